@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from judge_core import CRITERIA_NAMES, WINNER_SIGNS
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_ALPHA = 0.05
+TOKEN_CHART_MAX_BARS = 200
+
+
+def _column(df, col):
+    """Numeric float array of `col` (NaN where missing or unparsable)."""
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+def outcome_signs(df):
+    """
+    Per-row outcome: 1 if Model A won, -1 if Model B won, 0 for a tie, NaN if not judged.
+
+    An explicit `winner` (set for rows resolved without the judge) takes precedence
+    over comparing the overall scores.
+    """
+    signs = np.sign(_column(df, "score_a_overall") - _column(df, "score_b_overall"))
+    if "winner" in df.columns:
+        explicit = df["winner"].map(WINNER_SIGNS).to_numpy(dtype=float, na_value=np.nan)
+        signs = np.where(np.isnan(explicit), signs, explicit)
+    return signs
+
+
+def winner_labels(signs):
+    """Maps outcome signs back to "Model A" / "Model B" / "Tie" labels (None if not judged)."""
+    labels = np.full(len(signs), None, dtype=object)
+    labels[signs == 1] = "Model A"
+    labels[signs == -1] = "Model B"
+    labels[signs == 0] = "Tie"
+    return labels
+
+
+def bootstrap_mean_ci(values, n_resamples=DEFAULT_RESAMPLES, alpha=DEFAULT_ALPHA, seed=0):
+    """
+    Percentile bootstrap confidence interval of the mean.
+
+    Scores and outcomes take only a handful of distinct values, so instead of
+    resampling rows the bootstrap draws category counts from a multinomial
+    distribution. That is the same resampling distribution, at O(n_resamples x
+    distinct values) cost instead of O(n_resamples x rows).
+
+    Args:
+        values (array-like): Observations; NaN entries are ignored.
+
+    Returns:
+        tuple: `(low, high)`, or `(nan, nan)` when there are no observations.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return np.nan, np.nan
+    distinct, counts = np.unique(values, return_counts=True)
+    rng = np.random.default_rng(seed)
+    draws = rng.multinomial(n, counts / n, size=n_resamples)
+    means = draws @ distinct / n
+    low, high = np.quantile(means, [alpha / 2, 1 - alpha / 2])
+    return float(low), float(high)
+
+
+def win_summary(df, n_resamples=DEFAULT_RESAMPLES, alpha=DEFAULT_ALPHA):
+    """
+    Win/tie counts and win rates with bootstrap confidence intervals.
+
+    Rates are computed over judged rows only (rows with an error are left out).
+
+    Returns:
+        dict: judged, a_wins, b_wins, ties, win_rate_a, win_rate_b (fractions) and
+        win_rate_a_ci, win_rate_b_ci as `(low, high)` tuples.
+    """
+    signs = outcome_signs(df)
+    judged = signs[~np.isnan(signs)]
+    n = len(judged)
+    a_wins = int((judged == 1).sum())
+    b_wins = int((judged == -1).sum())
+    return {
+        "judged": n,
+        "a_wins": a_wins,
+        "b_wins": b_wins,
+        "ties": n - a_wins - b_wins,
+        "win_rate_a": a_wins / n if n else 0.0,
+        "win_rate_b": b_wins / n if n else 0.0,
+        "win_rate_a_ci": bootstrap_mean_ci(judged == 1, n_resamples, alpha, seed=1) if n else (np.nan, np.nan),
+        "win_rate_b_ci": bootstrap_mean_ci(judged == -1, n_resamples, alpha, seed=2) if n else (np.nan, np.nan),
+    }
+
+
+def criterion_deltas(df, n_resamples=DEFAULT_RESAMPLES, alpha=DEFAULT_ALPHA):
+    """
+    Per-criterion mean scores of both models and the paired B - A delta with its CI.
+
+    A negative delta whose interval lies entirely below zero is a regression of
+    Model B on that criterion.
+
+    Returns:
+        pandas.DataFrame: One row per criterion (plus "Overall") with columns
+        criterion, n, mean_a, mean_b, delta, ci_low, ci_high.
+    """
+    rows = []
+    names = [("Overall", "overall")] + [(name, name.lower()) for name in CRITERIA_NAMES]
+    for seed, (label, key) in enumerate(names):
+        a = _column(df, f"score_a_{key}")
+        b = _column(df, f"score_b_{key}")
+        paired = ~(np.isnan(a) | np.isnan(b))
+        diff = b[paired] - a[paired]
+        low, high = bootstrap_mean_ci(diff, n_resamples, alpha, seed=seed)
+        rows.append({
+            "criterion": label,
+            "n": int(paired.sum()),
+            "mean_a": float(a[paired].mean()) if paired.any() else np.nan,
+            "mean_b": float(b[paired].mean()) if paired.any() else np.nan,
+            "delta": float(diff.mean()) if paired.any() else np.nan,
+            "ci_low": low,
+            "ci_high": high,
+        })
+    return pd.DataFrame(rows)
+
+
+def token_usage_buckets(df, max_bars=TOKEN_CHART_MAX_BARS):
+    """
+    Input/output tokens per request, summed into at most `max_bars` consecutive buckets.
+
+    Keeps the token chart small for large runs; with fewer rows than `max_bars`
+    every bucket is a single request.
+
+    Returns:
+        pandas.DataFrame: Long format with columns index (first row of the bucket),
+        Token Type and Count.
+    """
+    n = len(df)
+    if n == 0:
+        return pd.DataFrame(columns=["index", "Token Type", "Count"])
+    size = -(-n // max_bars)
+    starts = np.arange(0, n, size)
+    frames = []
+    for col in ("input_tokens", "output_tokens"):
+        values = np.nan_to_num(_column(df, col))
+        frames.append(pd.DataFrame({"index": starts, "Token Type": col, "Count": np.add.reduceat(values, starts)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize(df):
+    """All derived analytics of a results frame, for caching between Streamlit reruns."""
+    return {
+        "wins": win_summary(df),
+        "deltas": criterion_deltas(df),
+        "token_buckets": token_usage_buckets(df),
+    }
@@ -1,8 +1,59 @@
+import os
+import sys
+import logging
+import json
+import hashlib
+import tempfile
+import subprocess
 import streamlit as st
-import pandas as pd
-import time
 import altair as alt
-from judge_logic import evaluate_with_yandex
+import pandas as pd
+import itertools
+from judge_logic import (
+    evaluate_with_yandex, stream_evaluate_with_yandex, explain_with_yandex, MODEL_NAME, LITE_MODEL_NAME,
+    MODEL_PRICES_RUB_PER_1K, SCORES_ONLY_MAX_TOKENS
+)
+from packing import evaluate_packed, iter_packed_evaluations, MAX_PACK_SIZE
+from cascade import evaluate_cascade, cascade_savings, DEFAULT_ESCALATION_MARGIN
+from batch_runner import (
+    RateLimiter, iter_evaluations, iter_in_order, flatten_verdict, verdict_from_row, apply_explanation,
+    DEFAULT_CONCURRENCY, CRITERION_COLUMNS, RESULT_COLUMNS
+)
+from analytics import summarize
+from async_backend import AsyncJudge, OperationStore, iter_async_evaluations
+from streaming_io import detect_format, read_preview, iter_input_rows, read_results, ResultWriter, iter_result_records, replace_results
+from token_budget import (
+    token_profile, plan_from_profile, truncate_row, estimate_row_tokens, iter_largest_first, calibrate_factor, count_tokens_remote,
+    recommended_max_tokens, DEFAULT_ANSWER_BUDGET, EXPECTED_OUTPUT_TOKENS, SCORES_ONLY_OUTPUT_TOKENS
+)
+from verdict_cache import VerdictCache
+from metrics import MetricsRegistry
+from dedup import plan_dedup, iter_deduplicated, DEFAULT_NEAR_THRESHOLD
+from sequential import SequentialTest, iter_shuffled, DEFAULT_CONFIDENCE
+from tournament import run_tournament, detect_models, DEFAULT_COMPARISONS_PER_MODEL, DEFAULT_ROWS_PER_PAIR, DEFAULT_Z
+from job_queue import open_queue, submit_job, export_results, DEFAULT_QUEUE_URL
+from yandex_client import YandexGPTClient
+
+logging.basicConfig(level=logging.INFO)
+
+ANALYTICS_COLUMNS = [
+    "error", "score_a_overall", "score_b_overall",
+    "input_tokens", "output_tokens", "total_tokens", "cache_hit", "retries",
+    "escalated", "escalation_reason", "escalation_failed", "lite_tokens", "pack_size",
+    "winner", "resolution", "duplicate_of",
+    *CRITERION_COLUMNS
+]
+DETAIL_PREVIEW_ROWS = 1000
+# Entries kept per cached step; each is bounded (previews, token counts, numeric columns)
+CACHE_MAX_ENTRIES = 4
+# Seconds between progress polls of a queued job
+JOB_POLL_SECONDS = 2
+JOB_STATUS_LABELS = {"loading": "загружается", "open": "в работе", "cancelled": "отменено"}
+EXPORT_MIME_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
 
 # Page Config
 st.set_page_config(
@@ -52,42 +103,342 @@ if persona_name == "Strict Fact-Checker":
 else:
     st.sidebar.info("✍️ **Helpful Editor**: Фокус на стиле, структуре и тоне. Ценит форматирование.")
 
+st.sidebar.markdown("---")
+st.sidebar.markdown("### 🚀 Пакетная обработка")
+api_mode = st.sidebar.radio(
+    "Режим API",
+    ["sync", "async"],
+    format_func=lambda m: "Синхронный (быстрее)" if m == "sync" else "Асинхронный (дешевле, дольше)",
+    disabled=demo_mode,
+    help="Асинхронный режим отправляет запросы в completionAsync и опрашивает операции. Подходит для больших офлайн-прогонов."
+)
+if demo_mode:
+    api_mode = "sync"
+use_cascade = st.sidebar.checkbox(
+    "Каскад: сначала Lite, Pro — только для спорных", value=False, disabled=api_mode == "async",
+    help="Строки оцениваются YandexGPT Lite; в Pro уходят только ничьи, близкие оценки и нераспарсенные ответы."
+)
+if api_mode == "async":
+    use_cascade = False
+escalation_margin = st.sidebar.number_input(
+    "Порог эскалации (разница overall)", min_value=1, max_value=9, value=DEFAULT_ESCALATION_MARGIN,
+    disabled=not use_cascade,
+    help="Если оценки Lite отличаются меньше чем на это значение, строка переоценивается в Pro."
+)
+scores_only = st.sidebar.checkbox(
+    "Только оценки (без обоснований)", value=False,
+    help="Судья возвращает только баллы, выходных токенов примерно в 6 раз меньше. "
+         "Обоснования для выбранных строк запрашиваются потом, в детализации отчета."
+)
+use_packing = st.sidebar.checkbox(
+    "Упаковка: несколько пар в одном запросе", value=False,
+    disabled=use_cascade or api_mode == "async" or scores_only,
+    help="Системный промпт с критериями отправляется один раз на несколько строк. "
+         "Размер пачки подбирается под контекст модели; строки, которые не удалось разобрать, переоцениваются по одной."
+)
+if use_cascade or api_mode == "async" or scores_only:
+    use_packing = False
+max_pack_size = st.sidebar.number_input(
+    "Макс. строк в запросе", min_value=2, max_value=MAX_PACK_SIZE, value=MAX_PACK_SIZE,
+    disabled=not use_packing
+)
+max_workers = st.sidebar.number_input(
+    "Параллельных запросов", min_value=1, max_value=64, value=DEFAULT_CONCURRENCY,
+    help="Сколько вызовов YandexGPT выполняется одновременно."
+)
+requests_per_second = st.sidebar.number_input(
+    "Лимит запросов/сек", min_value=0.0, value=10.0, step=1.0,
+    help="Квота Yandex Cloud на запросы в секунду. 0 — без ограничения."
+)
+tokens_per_second = st.sidebar.number_input(
+    "Лимит токенов/сек", min_value=0, value=0, step=1000,
+    help="Квота Yandex Cloud на токены в секунду. 0 — без ограничения."
+)
+answer_budget = st.sidebar.number_input(
+    "Бюджет на ответ (токенов)", min_value=0, value=DEFAULT_ANSWER_BUDGET, step=250,
+    help="Более длинные ответы обрезаются перед отправкой судье. 0 — без обрезки."
+)
+max_tokens = st.sidebar.number_input(
+    "maxTokens вердикта", min_value=100, max_value=2000, value=recommended_max_tokens(), step=50,
+    help=f"Лимит генерации судьи. Типичный вердикт ≈ {EXPECTED_OUTPUT_TOKENS} токенов, "
+         f"в режиме «Только оценки» ≈ {SCORES_ONLY_OUTPUT_TOKENS} (лимит не выше {SCORES_ONLY_MAX_TOKENS})."
+)
+if scores_only:
+    max_tokens = min(max_tokens, SCORES_ONLY_MAX_TOKENS)
+use_sequential = st.sidebar.checkbox(
+    "Ранняя остановка (последовательный тест)", value=False,
+    help="Строки оцениваются в случайном порядке; прогон останавливается, как только победитель определен "
+         "с заданной уверенностью (доверительная последовательность, корректная при любой точке остановки)."
+)
+sequential_confidence = st.sidebar.select_slider(
+    "Уровень доверия", options=[0.9, 0.95, 0.99], value=DEFAULT_CONFIDENCE, disabled=not use_sequential
+)
+sequential_margin = st.sidebar.number_input(
+    "Порог «нет разницы» (± доля побед)", min_value=0.0, max_value=0.25, value=0.0, step=0.01,
+    disabled=not use_sequential,
+    help="Остановиться с выводом «нет разницы», когда доля побед A точно лежит в 50% ± порог. 0 — только победитель."
+)
+sequential_max_rows = st.sidebar.number_input(
+    "Лимит строк теста (0 — без лимита)", min_value=0, value=0, step=500, disabled=not use_sequential
+)
+largest_first = st.sidebar.checkbox(
+    "Сначала самые большие строки", value=True, disabled=use_sequential,
+    help="Длинные запросы уходят первыми, чтобы не затягивать хвост прогона. При ранней остановке порядок случайный."
+)
+use_dedup = st.sidebar.checkbox(
+    "Дедупликация перед вызовами API", value=True,
+    help="Дубликаты оцениваются один раз, вердикт копируется. Строки с одинаковыми или пустыми ответами решаются без вызова модели."
+)
+near_dedup = st.sidebar.checkbox(
+    "Искать почти-дубликаты (MinHash)", value=False, disabled=not use_dedup,
+    help="Строки с похожим текстом получают вердикт первой строки группы."
+)
+near_threshold = st.sidebar.slider(
+    "Порог сходства", min_value=0.5, max_value=1.0, value=DEFAULT_NEAR_THRESHOLD, step=0.05,
+    disabled=not (use_dedup and near_dedup),
+    help="Оценка коэффициента Жаккара по словесным шинглам всей тройки (запрос, ответ A, ответ B)."
+)
+calibrate_tokens = st.sidebar.checkbox(
+    "Уточнять оценку через Tokenize API", value=False, disabled=demo_mode,
+    help="Калибрует локальный токенизатор на выборке строк с помощью эндпоинта tokenize."
+)
+
+use_queue = st.sidebar.checkbox(
+    "Очередь заданий (воркеры)", value=False,
+    help="Строки записываются в очередь, а оценивают их процессы `cli.py worker` на этой или других машинах; "
+         "интерфейс только следит за прогрессом. Асинхронный API в очереди не используется."
+)
+queue_url = st.sidebar.text_input(
+    "Адрес очереди", value=DEFAULT_QUEUE_URL, disabled=not use_queue,
+    help="Путь к файлу SQLite или URL вида sqlite:////shared/jobs.sqlite3?journal_mode=DELETE для воркеров на разных машинах."
+)
+
+
+@st.cache_resource
+def get_yandex_client(pool_size):
+    return YandexGPTClient(pool_size=pool_size)
+
+
+yandex_client = get_yandex_client(int(max_workers))
+
+
+@st.cache_resource
+def get_operation_store():
+    return OperationStore()
+
+
+@st.cache_resource
+def get_job_queue(url):
+    return open_queue(url)
+
+st.sidebar.markdown("---")
+st.sidebar.markdown("### 💾 Кэш вердиктов")
+use_cache = st.sidebar.checkbox(
+    "Использовать кэш", value=True,
+    help="Повторные запросы с теми же ответами, персоной и промптом не оплачиваются повторно."
+)
+bypass_cache = st.sidebar.checkbox(
+    "Игнорировать кэш (перезапросить)", value=False, disabled=not use_cache,
+    help="Запросить вердикты заново и обновить кэш."
+)
+
+
+@st.cache_resource
+def get_verdict_cache():
+    return VerdictCache()
+
+
+verdict_cache = get_verdict_cache() if use_cache else None
+if verdict_cache is not None and st.sidebar.button("Очистить кэш", key="btn_clear_cache"):
+    verdict_cache.clear()
+    st.sidebar.success("Кэш очищен.")
+
 st.sidebar.markdown("---")
 st.sidebar.info("Оценка производится по 8 критериям:\n\n1. Безвредность\n2. Достоверность\n3. Полезность\n4. Полнота\n5. Лаконичность\n6. Актуальность\n7. Уместность\n8. Читаемость")
 
+
+# Rerun Caching: uploads are keyed by content hash, results by path and file version
+def upload_digest(uploaded_file):
+    """sha256 of an upload, computed once per uploaded file."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        # The batch and tournament tabs each hold an upload, so keep a few digests
+        if len(digests) >= CACHE_MAX_ENTRIES:
+            digests.clear()
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    return digests[uploaded_file.file_id]
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_upload_preview(digest, fmt, _source):
+    return read_preview(_source, fmt=fmt)
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner="Подсчет токенов...")
+def load_token_profile(digest, fmt, _source):
+    return token_profile(iter_input_rows(_source, fmt=fmt))
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner="Калибровка токенизатора...")
+def load_token_factor(digest, fmt, folder_id, _source, _api_key):
+    sample_rows = list(itertools.islice(iter_input_rows(_source, fmt=fmt), 200))
+    return calibrate_factor(
+        sample_rows,
+        lambda text: count_tokens_remote(text, _api_key, folder_id, yandex_client)
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner="Поиск дубликатов...")
+def load_dedup_plan(digest, fmt, near_threshold, _source):
+    def rows():
+        for row_index, row in enumerate(iter_input_rows(_source, fmt=fmt)):
+            row["row_index"] = row_index
+            yield row
+    return plan_dedup(rows(), near_threshold=near_threshold)
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner="Чтение датасета...")
+def load_tournament_rows(digest, fmt, _source):
+    # Rows are sampled per pair, so the tournament keeps the dataset in memory
+    return list(iter_input_rows(_source, fmt=fmt))
+
+
+def result_version(path):
+    """Changes whenever the results file is rewritten."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_result_analytics(result_path, version):
+    # Numeric columns only, the text stays on disk
+    df = read_results(result_path, columns=ANALYTICS_COLUMNS)
+    return df, summarize(df)
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_result_preview(result_path, version):
+    return read_preview(result_path, n=DETAIL_PREVIEW_ROWS)
+
+
+def read_file_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# Failed Rows: re-judged in place, the rest of the file is streamed through
+def retry_failed_rows(result_path, judge_stream):
+    """
+    Re-judges only the rows of a results file that ended with an error and writes
+    the new verdicts in place; only the failed rows are held in memory.
+
+    Returns:
+        tuple: `(retried, still_failing)` row counts.
+    """
+    failed = []
+    for record in iter_result_records(result_path):
+        if record.get("error"):
+            row = {key: value for key, value in record.items() if key not in RESULT_COLUMNS}
+            row["row_index"] = int(float(record["row_index"]))
+            row["truncated"] = str(record.get("truncated")).lower() == "true"
+            failed.append(row)
+    if not failed:
+        return 0, 0
+    replacements = {row["row_index"]: flatten_verdict(row, eval_res) for _, row, eval_res in judge_stream(failed)}
+    replace_results(result_path, replacements)
+    return len(failed), sum(1 for record in replacements.values() if record.get("error"))
+
+
+# Detail View: reasoning of scores-only rows is fetched on demand
+def has_text(value):
+    return not pd.isna(value) and str(value) != ""
+
+
+def show_explanations(rows, explain_fn):
+    """
+    Reasoning of the rows selected in the detail table. Rows judged in scores-only mode
+    are explained on demand, once per session; returns the explanations fetched so far.
+    """
+    explanations = st.session_state.setdefault('batch_explanations', {})
+    for row in rows:
+        row_index = int(float(row["row_index"]))
+        title = f"Строка {row_index}: A {row.get('score_a_overall')} — B {row.get('score_b_overall')}"
+        if has_text(row.get("error")):
+            st.error(f"{title}: {row['error']}")
+            continue
+        if not has_text(row.get("reasoning_a")) and row_index not in explanations:
+            with st.spinner(f"Запрос обоснования для строки {row_index}..."):
+                explanation = explain_fn(row)
+            if "error" in explanation:
+                st.error(f"{title}: {explanation['error']}")
+                continue
+            explanations[row_index] = explanation
+        explanation = explanations.get(row_index, row)
+        with st.expander(title, expanded=True):
+            c1, c2 = st.columns(2)
+            c1.markdown("**Model A**")
+            c1.caption(explanation.get("reasoning_a") or "Нет объяснения.")
+            c2.markdown("**Model B**")
+            c2.caption(explanation.get("reasoning_b") or "Нет объяснения.")
+            st.markdown(f"**Сравнение:** {explanation.get('comparison') or '—'}")
+    return explanations
+
+
+def save_explanations(result_path, explanations):
+    """Writes reasoning fetched in the detail view into the results file; returns the number of rows updated."""
+    replacements = {}
+    for record in iter_result_records(result_path):
+        row_index = int(float(record["row_index"]))
+        if row_index in explanations:
+            replacements[row_index] = apply_explanation(record, explanations[row_index])
+    return replace_results(result_path, replacements)
+
+
 # Analytics Function
-def show_analytics(df):
+def show_analytics(df, summary=None):
     st.markdown("### 📊 Аналитика и Токеномика")
     
     # 1. Prepare Data
     total = len(df)
     
-    # Derive winner column if not present
-    if "winner" not in df.columns:
-        def get_winner(row):
-            sa = row.get("score_a_overall", 0)
-            sb = row.get("score_b_overall", 0)
-            if sa > sb: return "Model A"
-            elif sb > sa: return "Model B"
-            else: return "Tie"
-        df["winner"] = df.apply(get_winner, axis=1)
+    # Vectorized over typed score columns; an explicit winner column takes precedence
+    summary = summary or summarize(df)
+    wins = summary["wins"]
+    deltas = summary["deltas"]
+    overall = deltas.iloc[0]
 
     # 2. Key Metrics (Quality)
-    model_a_wins = len(df[df["winner"] == "Model A"])
-    model_b_wins = len(df[df["winner"] == "Model B"])
-    
-    win_rate_a = (model_a_wins / total * 100) if total > 0 else 0
-    win_rate_b = (model_b_wins / total * 100) if total > 0 else 0
-    
-    avg_score_a = df["score_a_overall"].mean()
-    avg_score_b = df["score_b_overall"].mean()
-    
     st.markdown("#### 🏆 Качество Моделей")
     m1, m2, m3, m4 = st.columns(4)
-    m1.metric("Win Rate (Model A)", f"{win_rate_a:.1f}%")
-    m2.metric("Win Rate (Model B)", f"{win_rate_b:.1f}%")
-    m3.metric("Ср. балл (Model A)", f"{avg_score_a:.1f}")
-    m4.metric("Ср. балл (Model B)", f"{avg_score_b:.1f}")
+    m1.metric("Win Rate (Model A)", f"{wins['win_rate_a'] * 100:.1f}%",
+              help="95% ДИ (бутстрэп): {:.1f}–{:.1f}%".format(*(x * 100 for x in wins['win_rate_a_ci'])))
+    m2.metric("Win Rate (Model B)", f"{wins['win_rate_b'] * 100:.1f}%",
+              help="95% ДИ (бутстрэп): {:.1f}–{:.1f}%".format(*(x * 100 for x in wins['win_rate_b_ci'])))
+    m3.metric("Ср. балл (Model A)", f"{overall['mean_a']:.1f}")
+    m4.metric("Ср. балл (Model B)", f"{overall['mean_b']:.1f}")
+    st.caption(f"Оценено строк: {wins['judged']} из {total}, ничьих: {wins['ties']}. Доли считаются по оцененным строкам.")
+    
+    # Per-criterion Deltas
+    if deltas["n"].iloc[1:].any():
+        st.markdown("#### 🔬 Разница по критериям (B − A)")
+        delta_view = deltas.rename(columns={
+            "criterion": "Критерий", "n": "Строк", "mean_a": "Ср. A", "mean_b": "Ср. B",
+            "delta": "Δ (B − A)", "ci_low": "ДИ 95% от", "ci_high": "ДИ 95% до"
+        })
+        st.dataframe(delta_view.style.format(precision=2), hide_index=True, use_container_width=True)
+        delta_bars = alt.Chart(deltas).mark_bar().encode(
+            y=alt.Y("criterion:N", sort=None, title=None),
+            x=alt.X("delta:Q", title="Δ (B − A)"),
+            color=alt.condition("datum.delta < 0", alt.value("#fc3f1d"), alt.value("#4a90e2")),
+            tooltip=["criterion", alt.Tooltip("delta:Q", format=".2f"), alt.Tooltip("ci_low:Q", format=".2f"), alt.Tooltip("ci_high:Q", format=".2f")]
+        )
+        delta_ci = alt.Chart(deltas).mark_rule(color="#333333").encode(
+            y=alt.Y("criterion:N", sort=None), x="ci_low:Q", x2="ci_high:Q"
+        )
+        st.altair_chart(delta_bars + delta_ci, use_container_width=True)
+        regressions = deltas.loc[deltas["ci_high"] < 0, "criterion"].tolist()
+        if regressions:
+            st.warning("Model B статистически значимо хуже по: " + ", ".join(regressions))
     
     # 3. Tokenomics
     st.markdown("#### 💰 Токеномика")
@@ -101,21 +452,93 @@ def show_analytics(df):
     total_output = df["output_tokens"].sum()
     grand_total_tokens = df["total_tokens"].sum()
     
-    # Cost Estimation (Mock: 0.40 RUB per 1k tokens combined for simplicity)
-    est_cost = (grand_total_tokens / 1000) * 0.40
+    # Cost Estimation (input + output tokens at the per-model price; Lite tokens only appear in cascade runs)
+    pro_price = MODEL_PRICES_RUB_PER_1K[MODEL_NAME]
+    is_cascade = "lite_tokens" in df.columns and df["lite_tokens"].notna().any()
+    lite_tokens = int(df["lite_tokens"].fillna(0).sum()) if is_cascade else 0
+    if is_cascade:
+        pro_tokens = int(grand_total_tokens) - lite_tokens
+        est_cost = cascade_savings(lite_tokens, pro_tokens, 0)["actual_cost"]
+    else:
+        est_cost = (grand_total_tokens / 1000) * pro_price
     
     t1, t2, t3 = st.columns(3)
     t1.metric("Total Tokens", f"{grand_total_tokens:,}")
     t2.metric("Avg Tokens / Query", f"{int(grand_total_tokens / total) if total else 0}")
-    t3.metric("Est. Cost (₽)", f"₽{est_cost:.2f}", help="Расчетная стоимость: 0.40 ₽ за 1k токенов")
+    t3.metric("Est. Cost (₽)", f"₽{est_cost:.2f}", help=f"Расчетная стоимость: {pro_price:.2f} ₽ за 1k токенов Pro")
+    
+    # Cascade Efficiency
+    if is_cascade:
+        escalated = df["escalated"].fillna(False).astype(bool)
+        n_escalated = int(escalated.sum())
+        lite_only_tokens = int(df.loc[~escalated, "lite_tokens"].fillna(0).sum())
+        savings = cascade_savings(lite_tokens, pro_tokens, lite_only_tokens)
+        reasons = df.loc[escalated, "escalation_reason"].value_counts().to_dict()
+        
+        st.markdown("#### 🪜 Каскад Lite → Pro")
+        e1, e2, e3 = st.columns(3)
+        e1.metric("Эскалировано в Pro", f"{n_escalated} / {total}", f"{n_escalated / total * 100:.1f}%" if total else None, delta_color="off")
+        e2.metric("Стоимость (все в Pro)", f"₽{savings['all_pro_cost']:.2f}", help="Оценка: строки, решенные Lite, стоили бы в Pro столько же токенов")
+        e3.metric("Экономия каскада", f"₽{savings['saved']:.2f}")
+        if reasons:
+            st.caption("Причины эскалации: " + ", ".join(f"{k}: {v}" for k, v in reasons.items()))
+        if "escalation_failed" in df.columns and df["escalation_failed"].fillna(False).astype(bool).any():
+            n_failed = int(df["escalation_failed"].fillna(False).astype(bool).sum())
+            st.caption(f"Pro не ответил для {n_failed} строк — для них сохранен вердикт Lite.")
+    
+    # Packing Efficiency
+    if "pack_size" in df.columns and (df["pack_size"].fillna(1) > 1).any():
+        pack_sizes = df["pack_size"].fillna(1)
+        packed = pack_sizes > 1
+        # Each packed row stands for 1/pack_size of a request
+        n_requests = int(round((1 / pack_sizes[packed]).sum())) + int((~packed).sum())
+        
+        st.markdown("#### 📦 Упаковка запросов")
+        g1, g2, g3 = st.columns(3)
+        g1.metric("Строк в пачках", f"{int(packed.sum())} / {total}")
+        g2.metric("Средний размер пачки", f"{pack_sizes[packed].mean():.1f}")
+        g3.metric("Запросов к API", f"{n_requests}", help="Без учета кэша и повторов; строки вне пачек считаются по одному запросу")
+    
+    # Deduplication
+    duplicates = df["duplicate_of"].notna() if "duplicate_of" in df.columns else pd.Series(False, index=df.index)
+    resolved = df["resolution"].notna() if "resolution" in df.columns else pd.Series(False, index=df.index)
+    if duplicates.any() or resolved.any():
+        n_avoided = int(duplicates.sum() + resolved.sum())
+        st.markdown("#### 🧬 Дедупликация")
+        d1, d2, d3 = st.columns(3)
+        d1.metric("Вызовов сэкономлено", f"{n_avoided} / {total}", f"{n_avoided / total * 100:.1f}%" if total else None, delta_color="off")
+        d2.metric("Копий вердикта (дубликаты)", f"{int(duplicates.sum())}")
+        d3.metric("Решено без модели", f"{int(resolved.sum())}", help="Одинаковые ответы — ничья, пустой ответ проигрывает")
+        if resolved.any():
+            st.caption("Причины: " + ", ".join(f"{k}: {v}" for k, v in df.loc[resolved, "resolution"].value_counts().items()))
+    
+    # Cache Efficiency
+    if verdict_cache is not None:
+        cache_stats = verdict_cache.stats()
+        cached_rows = int(df["cache_hit"].sum()) if "cache_hit" in df.columns else 0
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Строк из кэша", f"{cached_rows} / {total}")
+        k2.metric("Cache Hits / Misses", f"{cache_stats['hits']} / {cache_stats['misses']}", help="Счетчики с момента запуска приложения")
+        k3.metric("Cache Hit Rate", f"{cache_stats['hit_rate'] * 100:.1f}%")
+        k4.metric("Записей в кэше", f"{cache_stats['entries']:,}")
+    
+    # Connection Reuse & Retries
+    client_stats = yandex_client.stats()
+    retried_rows = int((df["retries"] > 0).sum()) if "retries" in df.columns else 0
+    n1, n2, n3 = st.columns(3)
+    n1.metric("Строк с повторами", f"{retried_rows}", help="Строки, где запрос повторялся из-за 429/5xx или обрыва соединения")
+    n2.metric("Повторов (всего)", f"{client_stats['retries']}")
+    n3.metric("Сэкономлено TLS-хендшейков", f"{client_stats['handshakes_saved']}", help=f"Запросов: {client_stats['requests_sent']}, новых соединений: {client_stats['connections_opened']}")
     
     # 4. Charts
     c1, c2 = st.columns(2)
     
     with c1:
         st.caption("Распределение побед")
-        winner_counts = df["winner"].value_counts().reset_index()
-        winner_counts.columns = ["Winner", "Count"]
+        winner_counts = pd.DataFrame({
+            "Winner": ["Model A", "Model B", "Tie"],
+            "Count": [wins["a_wins"], wins["b_wins"], wins["ties"]]
+        })
 
         chart = alt.Chart(winner_counts).mark_arc(innerRadius=50).encode(
             theta=alt.Theta(field="Count", type="quantitative"),
@@ -126,13 +549,8 @@ def show_analytics(df):
         
     with c2:
         st.caption("Использование токенов по запросам")
-        # Prepare data for stacked bar chart: Query Index -> Input, Output
-        # Altair needs long format for stacked bars
-        
-        # Add index column for X-axis
-        df_chart = df.reset_index()
-        
-        token_chart_data = df_chart.melt(id_vars=["index"], value_vars=["input_tokens", "output_tokens"], var_name="Token Type", value_name="Count")
+        # Long format for stacked bars; large runs are summed into buckets of consecutive rows
+        token_chart_data = summary["token_buckets"]
         
         bar_chart = alt.Chart(token_chart_data).mark_bar().encode(
             x=alt.X("index:O", title="Номер запроса"),
@@ -143,12 +561,248 @@ def show_analytics(df):
         st.altair_chart(bar_chart, use_container_width=True)
 
 
+def show_performance(metrics):
+    st.markdown("### ⏱ Производительность")
+    snapshot = metrics.snapshot()
+    if not snapshot["calls"]:
+        st.info("Вызовов судьи в этом запуске не было.")
+        return
+    histograms = snapshot["histograms"]
+    wall = histograms["wall_time_seconds"]
+    ttfb = histograms["ttfb_seconds"]
+    outcomes = snapshot["outcomes"]
+
+    # 1. Latency and Error Rate
+    p1, p2, p3, p4 = st.columns(4)
+    p1.metric("Латентность p50 / p95", f"{wall['p50']:.2f} / {wall['p95']:.2f} с",
+              help=f"p99: {wall['p99']:.2f} с. Время вызова с учетом повторов, оценка по гистограмме.")
+    p2.metric("TTFB p50 / p95", "—" if ttfb["p50"] is None else f"{ttfb['p50']:.2f} / {ttfb['p95']:.2f} с",
+              help="Время до заголовков ответа API (последняя попытка).")
+    p3.metric("Доля ошибок", f"{snapshot['error_rate'] * 100:.1f}%")
+    p4.metric("Вызовов", f"{snapshot['calls']:,}".replace(",", " "))
+
+    # 2. Where the Time and Errors Come From
+    q1, q2, q3, q4 = st.columns(4)
+    q1.metric("Ответы 429", snapshot["throttled"], help="Ответы API «слишком много запросов», включая повторенные.")
+    q2.metric("Ожидание лимитера", f"{snapshot['rate_limit_wait_seconds']:.0f} с",
+              help="Суммарное время ожидания собственного ограничителя RPS/TPS.")
+    q3.metric("Ошибки разбора ответа", outcomes["parse_error"],
+              help=f"Еще {outcomes['reformatted']} ответов восстановлено коротким запросом на переформатирование в JSON.")
+    q4.metric("Ошибки HTTP / сети", outcomes["http_error"] + outcomes["network_error"])
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.caption("Распределение времени вызова")
+        # Per-bucket counts from the cumulative histogram
+        bounds, cumulative = zip(*wall["buckets"])
+        counts = [cumulative[0]] + [b - a for a, b in zip(cumulative, cumulative[1:])]
+        labels = [f"≤{b:g} с" if b != float("inf") else f">{bounds[-2]:g} с" for b in bounds]
+        latency_data = pd.DataFrame({"Bucket": labels, "Count": counts, "order": range(len(labels))})
+        chart = alt.Chart(latency_data).mark_bar(color="#4a90e2").encode(
+            x=alt.X("Bucket:N", sort=alt.SortField("order"), title="Время вызова"),
+            y=alt.Y("Count:Q", title="Вызовов"),
+            tooltip=["Bucket", "Count"]
+        )
+        st.altair_chart(chart, use_container_width=True)
+    with c2:
+        st.caption("Исходы вызовов")
+        outcome_data = pd.DataFrame({"Outcome": list(outcomes), "Count": list(outcomes.values())})
+        st.dataframe(outcome_data, hide_index=True, use_container_width=True)
+        if snapshot["statuses"]:
+            st.caption("HTTP-статусы: " + ", ".join(f"{code}: {n}" for code, n in snapshot["statuses"].items()))
+
+    # 3. Export for Monitoring
+    e1, e2 = st.columns(2)
+    e1.download_button(
+        label="Метрики (Prometheus)",
+        data=metrics.to_prometheus(),
+        file_name="judge_metrics.prom",
+        mime="text/plain",
+        on_click="ignore",
+    )
+    if metrics.jsonl_path:
+        e2.download_button(
+            label="Вызовы (JSONL)",
+            data=lambda: read_file_bytes(metrics.jsonl_path),
+            file_name="judge_calls.jsonl",
+            mime=EXPORT_MIME_TYPES["jsonl"],
+            on_click="ignore",
+        )
+
+
+def show_sequential(summary):
+    st.markdown("### 🛑 Последовательный тест")
+    decision_labels = {"Model A": "Победила модель A", "Model B": "Победила модель B", "No difference": "Нет разницы"}
+    reason_labels = {"row_budget": "исчерпан лимит строк", "token_budget": "исчерпан лимит токенов", None: "оценены все строки"}
+    total = summary["total_rows"] or summary["rows"]
+    s1, s2, s3, s4 = st.columns(4)
+    s1.metric("Решение", decision_labels.get(summary["decision"], "Не определено"),
+              help=None if summary["decision"] else f"Остановка: {reason_labels.get(summary['reason'], summary['reason'])}.")
+    s2.metric("Остановка на строке", f"{summary['rows']:,} из {total:,}".replace(",", " "))
+    s3.metric("Доля побед A", "—" if summary["win_rate"] is None else f"{summary['win_rate'] * 100:.1f}%",
+              help=f"Интервал {summary['confidence']:.0%}: {summary['win_rate_low'] * 100:.1f}–{summary['win_rate_high'] * 100:.1f}% "
+                   "(ничьи считаются за половину победы).")
+    s4.metric("Сэкономлено строк", f"{max(total - summary['rows'], 0) / total * 100:.0f}%" if total else "—")
+
+    if summary["trace"]:
+        trace = pd.DataFrame(summary["trace"], columns=["Оценено", "Доля побед A", "Нижняя граница", "Верхняя граница"])
+        band = alt.Chart(trace).mark_area(opacity=0.25, color="#4a90e2").encode(
+            x=alt.X("Оценено:Q", title="Оценено строк"),
+            y=alt.Y("Нижняя граница:Q", scale=alt.Scale(domain=[0, 1]), title="Доля побед A"),
+            y2="Верхняя граница:Q"
+        )
+        line = alt.Chart(trace).mark_line(color="#fc3f1d").encode(x="Оценено:Q", y="Доля побед A:Q")
+        rule = alt.Chart(pd.DataFrame({"y": [0.5]})).mark_rule(strokeDash=[4, 4], color="#999").encode(y="y:Q")
+        st.altair_chart(band + line + rule, use_container_width=True)
+        st.caption("Интервал действителен при любой точке остановки: решение принимается, как только он не содержит 50%.")
+
+
+def start_local_worker(url, job_id):
+    """Starts `cli.py worker` for one job; credentials go through the environment, not the command line."""
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py"), "worker",
+        "--queue", url, "--job", job_id,
+        "--concurrency", str(int(max_workers)),
+        "--rps", str(requests_per_second),
+        "--tps", str(tokens_per_second),
+    ]
+    if not use_cache:
+        command.append("--no-cache")
+    env = dict(os.environ, YANDEX_API_KEY=api_key or "", YANDEX_FOLDER_ID=folder_id or "")
+    # The child keeps its own copy of the handle
+    with open(os.path.join(tempfile.gettempdir(), f"autoassessor_worker_{job_id}.log"), "a") as log_file:
+        return subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(queue, job_id):
+    progress = queue.progress(job_id)
+    total = progress["total"] or 0
+    finished = progress["done"] + progress["failed"]
+    st.progress(finished / total if total else 0.0, text=f"Готово {finished:,} из {total:,}".replace(",", " "))
+    j1, j2, j3, j4, j5 = st.columns(5)
+    j1.metric("Готово", progress["done"])
+    j2.metric("Ожидают", progress["pending"] - progress["leased"])
+    j3.metric("В работе", progress["leased"], help="Строки, арендованные воркерами прямо сейчас.")
+    j4.metric("Воркеров", progress["active_workers"])
+    j5.metric("С ошибкой", progress["errors"], help=f"Из них брошено после повторных аренд: {progress['failed']}.")
+    running = sum(process.poll() is None for process in st.session_state.get("queue_workers", {}).get(job_id, []))
+    st.caption(f"Статус задания: {JOB_STATUS_LABELS.get(progress['status'], progress['status'])}. "
+               f"Локальных воркеров запущено из интерфейса: {running}.")
+
+
+def show_job_queue(queue, url):
+    st.markdown("### 📬 Очередь заданий")
+    jobs = queue.list_jobs()
+    if not jobs:
+        st.info("В очереди нет заданий. Загрузите файл и нажмите «Отправить в очередь».")
+        return
+    job_ids = [job["job_id"] for job in jobs]
+    selected = st.session_state.get("queue_job_id")
+    job_id = st.selectbox(
+        "Задание", job_ids, index=job_ids.index(selected) if selected in job_ids else 0,
+        format_func=lambda j: next(f"{j} — {job['name'] or 'без имени'} ({job['total'] or 0} строк)"
+                                   for job in jobs if job["job_id"] == j)
+    )
+    st.session_state["queue_job_id"] = job_id
+    st.caption(f"Запустите воркеры: `python cli.py worker --queue {url} --job {job_id}` "
+               "(ключ и Folder ID — в переменных YANDEX_API_KEY / YANDEX_FOLDER_ID).")
+    show_job_progress(queue, job_id)
+
+    # 1. Job Controls
+    b1, b2, b3, b4 = st.columns(4)
+    if b1.button("Запустить локальный воркер", key="btn_start_worker"):
+        workers = st.session_state.setdefault("queue_workers", {})
+        workers.setdefault(job_id, []).append(start_local_worker(url, job_id))
+    if b2.button("Повторить строки с ошибками", key="btn_requeue_errors"):
+        st.toast(f"Возвращено в очередь строк: {queue.requeue_errors(job_id)}")
+    if b3.button("Отменить задание", key="btn_cancel_job"):
+        queue.cancel_job(job_id)
+    show_partial = b4.button("Промежуточная аналитика", key="btn_job_analytics")
+
+    # 2. Partial Analytics of the rows finished so far
+    result_path = os.path.join(tempfile.gettempdir(), f"autoassessor_job_{job_id}.parquet")
+    if show_partial:
+        with st.spinner("Выгрузка готовых строк..."):
+            export_results(queue, job_id, result_path)
+    if os.path.exists(result_path):
+        version = result_version(result_path)
+        result_df, result_summary = load_result_analytics(result_path, version)
+        st.caption(f"Аналитика по {len(result_df):,} готовым строкам на момент выгрузки.".replace(",", " "))
+        show_analytics(result_df, result_summary)
+        st.download_button(
+            label="Скачать готовые строки (PARQUET)",
+            data=lambda: read_file_bytes(result_path),
+            file_name=os.path.basename(result_path),
+            mime=EXPORT_MIME_TYPES["parquet"],
+            on_click="ignore",
+        )
+
+
+def show_tournament(result, records):
+    st.markdown("### 🏆 Рейтинг")
+    t1, t2, t3, t4 = st.columns(4)
+    t1.metric("Сравнений", f"{result['comparisons']:,}".replace(",", " "),
+              help=f"Вызовов судьи: {result['judge_calls']}, ошибок: {result['errors']}.")
+    t2.metric("Все пары на всех строках", f"{result['all_pairs_comparisons']:,}".replace(",", " "))
+    t3.metric("Раундов", result["rounds"])
+    t4.metric("Рейтинг устойчив", "Да" if result["stable"] else "Нет")
+    if result["unresolved"]:
+        st.warning("Не разделены на заданном уровне доверия: " +
+                   ", ".join(f"{a} / {b}" for a, b in result["unresolved"]) +
+                   ". Увеличьте бюджет или число строк.")
+
+    ranking = pd.DataFrame(result["ranking"])
+    st.dataframe(ranking, hide_index=True, use_container_width=True)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.caption("Рейтинг (шкала Эло) с доверительными интервалами")
+        base = alt.Chart(ranking).encode(y=alt.Y("model:N", sort=list(ranking["model"]), title=None))
+        chart = base.mark_rule(color="#999").encode(
+            x=alt.X("ci_low:Q", scale=alt.Scale(zero=False), title="Рейтинг"), x2="ci_high:Q"
+        ) + base.mark_point(filled=True, size=80, color="#fc3f1d").encode(
+            x="rating:Q", tooltip=["model", "rating", "ci_low", "ci_high", "comparisons"]
+        )
+        st.altair_chart(chart, use_container_width=True)
+    with c2:
+        st.caption("Доля побед строки над столбцом (ничья = ½)")
+        wins = pd.DataFrame(result["win_matrix"], index=result["models"], columns=result["models"])
+        games = wins + wins.T
+        share = (wins / games.where(games > 0)).stack(future_stack=True).reset_index()
+        share.columns = ["Модель", "Соперник", "Доля побед"]
+        share["Игр"] = games.stack(future_stack=True).to_numpy()
+        heatmap = alt.Chart(share).mark_rect().encode(
+            x=alt.X("Соперник:N", sort=list(ranking["model"])),
+            y=alt.Y("Модель:N", sort=list(ranking["model"])),
+            color=alt.Color("Доля побед:Q", scale=alt.Scale(scheme="redblue", domain=[0, 1])),
+            tooltip=["Модель", "Соперник", "Доля побед", "Игр"]
+        )
+        st.altair_chart(heatmap, use_container_width=True)
+
+    d1, d2 = st.columns(2)
+    d1.download_button(
+        label="Рейтинг (JSON)",
+        data=json.dumps(result, ensure_ascii=False, indent=2),
+        file_name="tournament_ranking.json",
+        mime="application/json",
+        on_click="ignore",
+    )
+    d2.download_button(
+        label="Сравнения (CSV)",
+        data=lambda: pd.DataFrame(records).to_csv(index=False).encode("utf-8"),
+        file_name="tournament_comparisons.csv",
+        mime=EXPORT_MIME_TYPES["csv"],
+        on_click="ignore",
+    )
+
+
 # Main Title
 st.title("⚖️ АвтоАсессор: YandexGPT-as-a-Judge")
 st.markdown("LLM-as-a-Judge для оценки качества поисковых ответов powered by **YandexGPT**.")
 
 # Tabs
-tab_single, tab_batch = st.tabs(["📝 Одиночный режим", "🚀 Пакетная обработка"])
+tab_single, tab_batch, tab_tournament = st.tabs(["📝 Одиночный режим", "🚀 Пакетная обработка", "🏆 Турнир моделей"])
 
 # --- TAB 1: SINGLE MODE ---
 with tab_single:
@@ -164,21 +818,61 @@ with tab_single:
         st.subheader("Ответ Model B")
         ans_b = st.text_area("Ответ B", height=200, placeholder="Вставьте ответ Model B...")
 
+    stream_output = st.checkbox(
+        "Потоковый вывод", value=True,
+        help="Оценки появляются по мере генерации, не дожидаясь обоснований целиком."
+    )
+
+    # Helper to display model stats
+    def display_model_stats(container, data, title):
+        container.markdown(f"## {title}")
+        container.metric("Overall Score", f"{data.get('overall_score', 0)}/10" if "overall_score" in data else "…")
+        
+        container.markdown("#### Обоснование")
+        container.caption(data.get('reasoning') or "Нет объяснения.")
+        
+        container.markdown("#### Критерии")
+        scores = data.get('scores', {})
+        for k, v in scores.items():
+            # Criteria missing from a repaired verdict are None
+            if v is None:
+                container.caption(f"{k}: —")
+                continue
+            container.progress(v / 10, text=f"{k}: {v}/10")
+
     # Logic
     if st.button("Оценить!", type="primary", key="btn_single"):
         if not user_query or not ans_a or not ans_b:
             st.warning("Пожалуйста, заполните запрос и оба ответа.")
         else:
-            with st.spinner(f"Запрос к YandexGPT ({persona_name})..."):
-                result = evaluate_with_yandex(
-                    query=user_query,
-                    ans_a=ans_a,
-                    ans_b=ans_b,
-                    api_key=api_key,
-                    folder_id=folder_id,
-                    demo_mode=demo_mode,
-                    persona_name=persona_name
-                )
+            judge_kwargs = dict(
+                query=user_query,
+                ans_a=ans_a,
+                ans_b=ans_b,
+                api_key=api_key,
+                folder_id=folder_id,
+                demo_mode=demo_mode,
+                persona_name=persona_name,
+                cache=verdict_cache,
+                bypass_cache=bypass_cache,
+                client=yandex_client
+            )
+            if stream_output:
+                # Partial verdicts are redrawn in place until the final result arrives
+                live = st.empty()
+                result = {}
+                for result in stream_evaluate_with_yandex(**judge_kwargs):
+                    if not result.get("partial"):
+                        break
+                    with live.container():
+                        st.caption(f"Генерация вердикта YandexGPT ({persona_name})...")
+                        live_col1, live_col2 = st.columns(2)
+                        display_model_stats(live_col1, result.get("model_a", {}), "Model A")
+                        display_model_stats(live_col2, result.get("model_b", {}), "Model B")
+                live.empty()
+            else:
+                with st.spinner(f"Запрос к YandexGPT ({persona_name})..."):
+                    result = evaluate_with_yandex(**judge_kwargs)
 
             if "error" in result:
                 st.error(f"Error: {result['error']}")
@@ -192,7 +886,7 @@ with tab_single:
                 
                 # Comparison Summary
                 st.markdown(f"### 💡 Сравнительный вердикт")
-                st.info(result.get('comparison', 'Нет сравнительного вердикта.'))
+                st.info(result.get('comparison') or 'Нет сравнительного вердикта.')
                 
                 # Show Token Usage for Single Mode too
                 if "usage" in result:
@@ -200,126 +894,406 @@ with tab_single:
                     st.caption(f"💰 Tokens: {usage.get('totalTokens')} (In: {usage.get('inputTextTokens')}, Out: {usage.get('completionTokens')})")
 
                 res_col1, res_col2 = st.columns(2)
-                
-                # Helper to display model stats
-                def display_model_stats(container, model_key, title):
-                    data = result.get(model_key, {})
-                    container.markdown(f"## {title}")
-                    container.metric("Overall Score", f"{data.get('overall_score', 0)}/10")
-                    
-                    container.markdown("#### Обоснование")
-                    container.caption(data.get('reasoning', "Нет объяснения."))
-                    
-                    container.markdown("#### Критерии")
-                    scores = data.get('scores', {})
-                    for k, v in scores.items():
-                        container.progress(v / 10, text=f"{k}: {v}/10")
 
                 with res_col1:
-                    display_model_stats(st, "model_a", "Model A")
+                    display_model_stats(st, result.get("model_a", {}), "Model A")
                 
                 with res_col2:
-                    display_model_stats(st, "model_b", "Model B")
+                    display_model_stats(st, result.get("model_b", {}), "Model B")
 
 # --- TAB 2: BATCH MODE ---
 with tab_batch:
-    st.markdown("### Загрузите CSV файл")
+    st.markdown("### Загрузите CSV или JSONL файл")
     st.markdown("Файл должен содержать столбцы: `query`, `answer_a`, `answer_b`.")
     
-    uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
+    uploaded_file = st.file_uploader("Upload CSV / JSONL", type=["csv", "jsonl"])
+    export_format = st.selectbox(
+        "Формат файла результатов", list(EXPORT_MIME_TYPES), index=list(EXPORT_MIME_TYPES).index("parquet"),
+        help="Результаты пишутся на диск по мере готовности, поэтому память не растет с размером датасета. "
+             "Parquet хранит оценки типизированными колонками (int8) и читается для аналитики быстрее всего."
+    )
     
     # Clear state if new file uploaded (optional UX choice, keeping simple for now)
     
     if uploaded_file:
         try:
-            df = pd.read_csv(uploaded_file)
+            input_format = detect_format(uploaded_file.name)
+            digest = upload_digest(uploaded_file)
+            preview_df = load_upload_preview(digest, input_format, uploaded_file)
             
             # Validation
             required_cols = {'query', 'answer_a', 'answer_b'}
-            if not required_cols.issubset(df.columns):
-                st.error(f"Ошибка: В CSV файле отсутствуют обязательные столбцы: {required_cols - set(df.columns)}")
+            if not required_cols.issubset(preview_df.columns):
+                st.error(f"Ошибка: В файле отсутствуют обязательные столбцы: {required_cols - set(preview_df.columns)}")
             else:
                 st.markdown("#### Предпросмотр (первые 5 строк):")
-                st.dataframe(df.head())
+                st.dataframe(preview_df)
                 
-                if st.button("Начать пакетную оценку", type="primary", key="btn_batch"):
-                    
-                    results = []
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    total_rows = len(df)
-                    
-                    for index, row in df.iterrows():
-                        status_text.text(f"Обработка строки {index + 1} из {total_rows}...")
-                        
-                        # Demo mode throttling
-                        if demo_mode:
-                            time.sleep(0.1)
-                        
-                        eval_res = evaluate_with_yandex(
+                # Pre-flight Plan
+                token_factor = 1.0
+                if calibrate_tokens and not demo_mode:
+                    token_factor = load_token_factor(digest, input_format, folder_id, uploaded_file, api_key)
+                plan_price = MODEL_PRICES_RUB_PER_1K[LITE_MODEL_NAME if use_cascade else MODEL_NAME]
+                plan = plan_from_profile(
+                    load_token_profile(digest, input_format, uploaded_file),
+                    persona_name=persona_name,
+                    answer_budget=answer_budget,
+                    factor=token_factor,
+                    concurrency=max_workers,
+                    requests_per_second=requests_per_second,
+                    price_per_1k=plan_price,
+                    scores_only=scores_only
+                )
+                st.markdown("#### 🧮 План прогона")
+                p1, p2, p3, p4, p5 = st.columns(5)
+                p1.metric("Строк", f"{plan['rows']:,}")
+                p2.metric("Входные токены (оценка)", f"{plan['input_tokens']:,}")
+                p3.metric("Выходные токены (оценка)", f"{plan['output_tokens']:,}")
+                p4.metric("Ожидаемая стоимость", f"₽{plan['est_cost']:.2f}",
+                          help="Без учета кэша" + ("; каскад оценен по цене Lite" if use_cascade else ""))
+                p5.metric("Ожидаемое время", f"{plan['est_duration_s'] / 60:.1f} мин")
+                st.caption(
+                    f"Будет обрезано строк: {plan['truncated_rows']} (бюджет {answer_budget} токенов на ответ). "
+                    f"Самая большая строка: ≈{plan['largest_row_tokens']:,} токенов. "
+                    f"Коэффициент токенизатора: {token_factor:.2f}."
+                )
+                dedup_plan = None
+                if use_dedup:
+                    dedup_plan = load_dedup_plan(digest, input_format, near_threshold if near_dedup else None, uploaded_file)
+                    dedup_report = dedup_plan.report()
+                    st.caption(
+                        f"Без вызова API: {dedup_report['calls_avoided']:,} строк ({dedup_report['avoided_share'] * 100:.1f}%) — "
+                        f"дубликатов {dedup_report['exact_duplicates']:,}, почти-дубликатов {dedup_report['near_duplicates']:,}, "
+                        f"одинаковых ответов {dedup_report['identical']:,}, с пустым ответом "
+                        f"{dedup_report['empty_a'] + dedup_report['empty_b'] + dedup_report['both_empty']:,}. "
+                        "Оценки токенов и стоимости выше даны без учета дедупликации."
+                    )
+                
+                # Judge setup shared by the batch run and the retry of failed rows
+                def request_size(row):
+                    return estimate_row_tokens(row, persona_name, 0, token_factor, scores_only) + max_tokens
+                
+                def evaluate_row(row):
+                    if use_cascade:
+                        return evaluate_cascade(
                             query=row['query'],
                             ans_a=row['answer_a'],
                             ans_b=row['answer_b'],
                             api_key=api_key,
                             folder_id=folder_id,
                             demo_mode=demo_mode,
-                            persona_name=persona_name
+                            persona_name=persona_name,
+                            margin=escalation_margin,
+                            cache=verdict_cache,
+                            bypass_cache=bypass_cache,
+                            client=yandex_client,
+                            max_tokens=max_tokens,
+                            scores_only=scores_only
                         )
-                        
-                        # Parse Result for CSV
-                        row_result = row.to_dict()
-                        if "error" in eval_res:
-                            row_result["error"] = eval_res["error"]
+                    return evaluate_with_yandex(
+                        query=row['query'],
+                        ans_a=row['answer_a'],
+                        ans_b=row['answer_b'],
+                        api_key=api_key,
+                        folder_id=folder_id,
+                        demo_mode=demo_mode,
+                        persona_name=persona_name,
+                        cache=verdict_cache,
+                        bypass_cache=bypass_cache,
+                        client=yandex_client,
+                        max_tokens=max_tokens,
+                        scores_only=scores_only
+                    )
+                
+                def explain_row(row):
+                    return explain_with_yandex(
+                        query=row['query'],
+                        ans_a=row['answer_a'],
+                        ans_b=row['answer_b'],
+                        verdict=verdict_from_row(row),
+                        api_key=api_key,
+                        folder_id=folder_id,
+                        demo_mode=demo_mode,
+                        persona_name=persona_name,
+                        cache=verdict_cache,
+                        client=yandex_client
+                    )
+                
+                def judge_stream(rows, limiter, metrics):
+                    if api_mode == "async":
+                        async_judge = AsyncJudge(
+                            api_key, folder_id, persona_name,
+                            client=yandex_client,
+                            store=get_operation_store(),
+                            cache=verdict_cache,
+                            bypass_cache=bypass_cache,
+                            max_tokens=max_tokens,
+                            scores_only=scores_only
+                        )
+                        return iter_async_evaluations(
+                            rows, async_judge, rate_limiter=limiter, metrics=metrics, token_estimator=request_size
+                        )
+                    if use_packing:
+                        def evaluate_pack(pack):
+                            return evaluate_packed(
+                                pack,
+                                api_key=api_key,
+                                folder_id=folder_id,
+                                demo_mode=demo_mode,
+                                persona_name=persona_name,
+                                cache=verdict_cache,
+                                bypass_cache=bypass_cache,
+                                client=yandex_client,
+                                max_tokens=max_tokens,
+                                rate_limiter=limiter,
+                                token_estimator=request_size
+                            )
+                        return iter_packed_evaluations(
+                            rows,
+                            evaluate_pack,
+                            max_workers=max_workers,
+                            rate_limiter=limiter,
+                            token_estimator=request_size,
+                            persona_name=persona_name,
+                            max_pack_size=max_pack_size,
+                            per_row_max_tokens=max_tokens,
+                            metrics=metrics
+                        )
+                    return iter_evaluations(
+                        rows,
+                        evaluate_row,
+                        max_workers=max_workers,
+                        rate_limiter=limiter,
+                        token_estimator=request_size,
+                        metrics=metrics
+                    )
+                
+                if use_queue:
+                    if st.button("Отправить в очередь", type="primary", key="btn_submit_job"):
+                        job_config = {
+                            "persona": persona_name,
+                            "demo": demo_mode,
+                            "cascade": use_cascade,
+                            "cascade_margin": escalation_margin,
+                            "pack": use_packing,
+                            "max_pack_size": max_pack_size,
+                            "answer_budget": answer_budget,
+                            "token_factor": token_factor,
+                            "max_tokens": max_tokens,
+                            "scores_only": scores_only,
+                        }
+                        with st.spinner("Запись строк в очередь..."):
+                            st.session_state['queue_job_id'] = submit_job(
+                                get_job_queue(queue_url), uploaded_file, job_config,
+                                fmt=input_format,
+                                name=uploaded_file.name,
+                                dedup=use_dedup,
+                                near_threshold=near_threshold if (use_dedup and near_dedup) else None
+                            )
+                        st.success(f"Задание {st.session_state['queue_job_id']} добавлено в очередь.")
+                
+                elif st.button("Начать пакетную оценку", type="primary", key="btn_batch"):
+                    
+                    progress_bar = st.progress(0)
+                    status_text = st.empty()
+                    
+                    total_rows = plan["rows"]
+                    
+                    def prepared_rows():
+                        for row_index, row in enumerate(iter_input_rows(uploaded_file, fmt=input_format)):
+                            row = truncate_row(row, answer_budget, token_factor)
+                            row["row_index"] = row_index
+                            yield row
+                    
+                    if use_sequential:
+                        # Random order keeps the running estimate unbiased
+                        scheduled_rows = iter_shuffled(prepared_rows())
+                    elif largest_first:
+                        scheduled_rows = iter_largest_first(prepared_rows(), request_size)
+                    else:
+                        scheduled_rows = prepared_rows()
+                    
+                    def update_progress(done, total):
+                        status_text.text(f"Обработано {done} из {total}...")
+                        progress_bar.progress(done / total if total else 1.0)
+                    
+                    run_dir = tempfile.mkdtemp(prefix="autoassessor_")
+                    result_path = os.path.join(run_dir, f"evaluation_results.{export_format}")
+                    limiter = RateLimiter(requests_per_second, tokens_per_second)
+                    metrics = MetricsRegistry(os.path.join(run_dir, "judge_calls.jsonl"))
+                    
+                    sequential_test = SequentialTest(
+                        sequential_confidence, sequential_margin, max_rows=sequential_max_rows
+                    ) if use_sequential else None
+                    
+                    # Results stream to disk in input order (completion order for the sequential
+                    # test, which may stop early); only the in-flight window stays in memory
+                    with ResultWriter(result_path) as writer:
+                        if dedup_plan is not None:
+                            completed = iter_deduplicated(scheduled_rows, lambda rows: judge_stream(rows, limiter, metrics), dedup_plan)
                         else:
-                            # Model A Stats
-                            ma = eval_res.get("model_a", {})
-                            row_result["score_a_overall"] = ma.get("overall_score")
-                            row_result["reasoning_a"] = ma.get("reasoning")
-                            
-                            # Model B Stats
-                            mb = eval_res.get("model_b", {})
-                            row_result["score_b_overall"] = mb.get("overall_score")
-                            row_result["reasoning_b"] = mb.get("reasoning")
-                            
-                            row_result["comparison"] = eval_res.get("comparison")
-                            
-                            # Token Usage
-                            usage = eval_res.get("usage", {})
-                            row_result["input_tokens"] = int(usage.get("inputTextTokens", 0))
-                            row_result["output_tokens"] = int(usage.get("completionTokens", 0))
-                            row_result["total_tokens"] = int(usage.get("totalTokens", 0))
-                            
-                        results.append(row_result)
-                        progress_bar.progress((index + 1) / total_rows)
+                            completed = judge_stream(scheduled_rows, limiter, metrics)
+                        if sequential_test is None:
+                            completed = iter_in_order(completed, position=lambda _, row: row["row_index"])
+                        for done, (_, row, eval_res) in enumerate(completed, start=1):
+                            writer.write(flatten_verdict(row, eval_res))
+                            update_progress(done, total_rows)
+                            if sequential_test is not None and sequential_test.update(eval_res):
+                                break
+                    metrics.close()
                     
                     status_text.text("Готово!")
                     progress_bar.empty()
                     
-                    # Store in Session State
-                    result_df = pd.DataFrame(results)
-                    st.session_state['batch_results'] = result_df
+                    # Store the file location and the fixed-size call metrics in Session State
+                    st.session_state['batch_results_path'] = result_path
+                    st.session_state['batch_metrics'] = metrics
+                    st.session_state.pop('batch_explanations', None)
+                    if sequential_test is not None:
+                        st.session_state['batch_sequential'] = sequential_test.summary(total_rows)
+                    else:
+                        st.session_state.pop('batch_sequential', None)
                     
                 # Display Results from Session State
-                if 'batch_results' in st.session_state:
-                    result_df = st.session_state['batch_results']
+                if 'batch_results_path' in st.session_state:
+                    result_path = st.session_state['batch_results_path']
+                    result_format = detect_format(result_path)
                     
                     with st.expander("📊 Отчет об оценке", expanded=True):
                         st.success("Пакетная обработка завершена!")
                         
-                        # Analytics
-                        show_analytics(result_df)
+                        # Analytics are recomputed only when the results file changes
+                        version = result_version(result_path)
+                        result_df, result_summary = load_result_analytics(result_path, version)
+                        failed_count = int(result_df["error"].fillna("").astype(str).ne("").sum()) if "error" in result_df else 0
+                        if failed_count:
+                            f1, f2 = st.columns([3, 1])
+                            f1.warning(f"Строк с ошибками: {failed_count}. Повтор отправит судье только их, остальные результаты не меняются.")
+                            if f2.button(f"Повторить строки с ошибками ({failed_count})", key="btn_retry_failed"):
+                                with st.spinner("Повторная оценка строк с ошибками..."):
+                                    retried, still_failing = retry_failed_rows(
+                                        result_path,
+                                        lambda rows: judge_stream(
+                                            rows, RateLimiter(requests_per_second, tokens_per_second),
+                                            st.session_state.get('batch_metrics')
+                                        )
+                                    )
+                                st.toast(f"Повторено строк: {retried}, по-прежнему с ошибкой: {still_failing}")
+                                st.rerun()
+                        if 'batch_sequential' in st.session_state:
+                            show_sequential(st.session_state['batch_sequential'])
+                        show_analytics(result_df, result_summary)
+                        if 'batch_metrics' in st.session_state:
+                            show_performance(st.session_state['batch_metrics'])
                         
                         st.markdown("### Детализация")
-                        st.dataframe(result_df)
+                        st.caption(
+                            f"Первые {DETAIL_PREVIEW_ROWS} строк. Полный результат доступен для скачивания. "
+                            "Выберите строки, чтобы прочитать обоснования; строкам, оцененным в режиме "
+                            "«Только оценки», они запрашиваются у судьи."
+                        )
+                        detail_df = load_result_preview(result_path, version)
+                        detail = st.dataframe(detail_df, on_select="rerun", selection_mode="multi-row", key="detail_table")
+                        explanations = show_explanations(
+                            [detail_df.iloc[position].to_dict() for position in detail.selection.rows], explain_row
+                        )
+                        if explanations and st.button(
+                            f"Сохранить обоснования в файл результатов ({len(explanations)})", key="btn_save_explanations"
+                        ):
+                            saved = save_explanations(result_path, explanations)
+                            st.session_state.pop('batch_explanations', None)
+                            st.toast(f"Обоснования добавлены в {saved} строк")
+                            st.rerun()
                         
-                        csv = result_df.to_csv(index=False).encode('utf-8')
+                        # The file is read only when the button is clicked
                         st.download_button(
-                            label="Скачать результаты (CSV)",
-                            data=csv,
-                            file_name="evaluation_results.csv",
-                            mime="text/csv",
+                            label=f"Скачать результаты ({result_format.upper()})",
+                            data=lambda: read_file_bytes(result_path),
+                            file_name=os.path.basename(result_path),
+                            mime=EXPORT_MIME_TYPES[result_format],
+                            on_click="ignore",
                         )
                     
         except Exception as e:
             st.error(f"Ошибка при чтении файла: {e}")
+    
+    if use_queue:
+        show_job_queue(get_job_queue(queue_url), queue_url)
+
+# --- TAB 3: TOURNAMENT MODE ---
+with tab_tournament:
+    st.markdown("### Ранжирование нескольких моделей")
+    st.markdown(
+        "Файл должен содержать столбец `query` и по столбцу `answer_<модель>` на каждую модель. "
+        "Пары подбираются адаптивно: сначала случайный круг, затем соседи по рейтингу, порядок которых еще не ясен. "
+        "Рейтинг — модель Брэдли–Терри на шкале Эло."
+    )
+    tournament_file = st.file_uploader("Upload CSV / JSONL / Parquet", type=["csv", "jsonl", "parquet"], key="tournament_upload")
+    if tournament_file:
+        try:
+            tournament_rows = load_tournament_rows(
+                upload_digest(tournament_file), detect_format(tournament_file.name), tournament_file
+            )
+            available_models = detect_models(tournament_rows[0]) if tournament_rows else []
+            if not tournament_rows or "query" not in tournament_rows[0] or len(available_models) < 2:
+                st.error("Нужны столбец `query` и хотя бы два столбца `answer_<модель>`.")
+            else:
+                models = st.multiselect("Модели", available_models, default=available_models)
+                m1, m2, m3 = st.columns(3)
+                all_pairs = len(models) * (len(models) - 1) // 2 * len(tournament_rows)
+                tournament_budget = m1.number_input(
+                    "Бюджет сравнений", min_value=1, max_value=max(all_pairs, 1),
+                    value=max(1, min(DEFAULT_COMPARISONS_PER_MODEL * len(models), all_pairs)),
+                    help=f"Все пары на всех строках: {all_pairs:,} сравнений.".replace(",", " ")
+                )
+                rows_per_pair = m2.number_input("Строк на пару за раунд", min_value=1, max_value=100, value=DEFAULT_ROWS_PER_PAIR)
+                tournament_z = m3.number_input(
+                    "Порог z для остановки", min_value=0.5, max_value=4.0, value=DEFAULT_Z, step=0.1,
+                    help="Турнир останавливается, когда все соседние модели разделены на этом уровне (1.96 ≈ 95%)."
+                )
+
+                if len(models) >= 2 and st.button("Начать турнир", type="primary", key="btn_tournament"):
+                    progress_bar = st.progress(0)
+                    status_text = st.empty()
+                    records = []
+
+                    def evaluate_comparison(item):
+                        item = truncate_row(item, answer_budget)
+                        return evaluate_with_yandex(
+                            query=item['query'],
+                            ans_a=item['answer_a'],
+                            ans_b=item['answer_b'],
+                            api_key=api_key,
+                            folder_id=folder_id,
+                            demo_mode=demo_mode,
+                            persona_name=persona_name,
+                            cache=verdict_cache,
+                            bypass_cache=bypass_cache,
+                            client=yandex_client,
+                            max_tokens=max_tokens,
+                            scores_only=scores_only
+                        )
+
+                    def update_tournament_progress(done, budget):
+                        status_text.text(f"Сравнений: {done} из не более чем {budget}...")
+                        progress_bar.progress(min(done / budget, 1.0) if budget else 1.0)
+
+                    result = run_tournament(
+                        tournament_rows, models, evaluate_comparison,
+                        max_comparisons=int(tournament_budget),
+                        rows_per_pair=int(rows_per_pair),
+                        z=tournament_z,
+                        max_workers=max_workers,
+                        rate_limiter=RateLimiter(requests_per_second, tokens_per_second),
+                        progress_callback=update_tournament_progress,
+                        record_callback=records.append
+                    )
+                    status_text.text("Готово!")
+                    progress_bar.empty()
+                    st.session_state['tournament_result'] = result
+                    st.session_state['tournament_records'] = records
+
+                if 'tournament_result' in st.session_state:
+                    show_tournament(st.session_state['tournament_result'], st.session_state['tournament_records'])
+        except Exception as e:
+            st.error(f"Ошибка при чтении файла: {e}")
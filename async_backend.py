@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from judge_logic import (
+    MODEL_NAME, TEMPERATURE, MAX_TOKENS, build_headers, build_completion_body, parse_completion,
+    lookup_cached_verdict, prompt_version, LiveBackend
+)
+from judge_core import ZERO_USAGE
+from verdict_cache import make_cache_key
+from batch_runner import estimate_request_tokens
+from yandex_client import get_default_client
+
+logger = logging.getLogger(__name__)
+
+ASYNC_COMPLETION_PATH = "/foundationModels/v1/completionAsync"
+DEFAULT_OPERATIONS_PATH = os.environ.get("AUTOASSESSOR_OPERATIONS_PATH", os.path.join(".cache", "operations.sqlite3"))
+
+DEFAULT_MAX_OUTSTANDING = 500
+DEFAULT_HTTP_WORKERS = 8
+POLL_MIN_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 30.0
+POLL_BACKOFF = 1.5
+
+# Finished operations are kept this long so a crashed run can pick up their results
+OPERATION_RETENTION_DAYS = 7
+# An operation still pending after this long (or that the server no longer knows) is failed
+MAX_PENDING_SECONDS = 24 * 3600
+
+
+class OperationStore:
+    """
+    Local SQLite record of submitted async operations.
+
+    Operations are keyed by the content hash of the judge request, so after a crash
+    or a rerun the same row is never submitted (and paid for) twice: a pending
+    operation is polled again and a finished one is served from the stored result.
+    """
+
+    def __init__(self, path=DEFAULT_OPERATIONS_PATH, retention_days=OPERATION_RETENTION_DAYS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS operations ("
+            " key TEXT PRIMARY KEY,"
+            " operation_id TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " submitted_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " result TEXT)"
+        )
+        self._conn.execute(
+            "DELETE FROM operations WHERE status != 'pending' AND updated_at < ?",
+            (time.time() - retention_days * 24 * 3600,)
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT operation_id, status, result, submitted_at FROM operations WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"operation_id": row[0], "status": row[1], "result": json.loads(row[2]) if row[2] else None,
+                "submitted_at": row[3]}
+
+    def record_submitted(self, key, operation_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO operations (key, operation_id, status, submitted_at, updated_at, result)"
+                " VALUES (?, ?, 'pending', ?, ?, NULL)",
+                (key, operation_id, now, now)
+            )
+            self._conn.commit()
+
+    def record_finished(self, key, status, result):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE operations SET status = ?, updated_at = ?, result = ? WHERE key = ?",
+                (status, time.time(), json.dumps(result, ensure_ascii=False), key)
+            )
+            self._conn.commit()
+
+    def counts(self):
+        """Number of stored operations per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM operations GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def _replayed(result):
+    """A stored operation result served again: nothing is spent on it, as with a verdict cache hit."""
+    result = dict(result)
+    result["cached_usage"] = result.get("usage", {})
+    result["usage"] = dict(ZERO_USAGE)
+    result["cache_hit"] = True
+    return result
+
+
+def _usage_total(result):
+    try:
+        return int(result.get("usage", {}).get("totalTokens", 0))
+    except (TypeError, ValueError, AttributeError):
+        return 0
+
+
+class AsyncJudge:
+    """
+    Judge backend built on the `completionAsync` endpoint of YandexGPT.
+
+    `submit` starts an operation (or reuses a known one) and `poll` checks it; finished
+    operations go through the same `parse_completion` as the synchronous path, so
+    results have the same schema. Use `iter_async_evaluations` to run a whole batch.
+    With `scores_only`, operations ask for the scores without reasoning (see `judge_core`).
+
+    An operation the Operation API answers with 404 (expired or unknown), or one still
+    pending `max_pending_seconds` after submission, is recorded as failed, so a batch
+    always ends; a rerun submits such rows again.
+    """
+
+    def __init__(self, api_key, folder_id, persona_name="Strict Fact-Checker", client=None, store=None,
+                 cache=None, bypass_cache=False, max_tokens=MAX_TOKENS, scores_only=False,
+                 max_pending_seconds=MAX_PENDING_SECONDS):
+        self.api_key = api_key
+        self.folder_id = folder_id
+        self.persona_name = persona_name
+        self.client = client or get_default_client()
+        self.store = store or OperationStore()
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self.max_tokens = max_tokens
+        self.scores_only = scores_only
+        self.max_pending_seconds = max_pending_seconds
+        self.model_uri = f"gpt://{folder_id}/{MODEL_NAME}"
+        self.headers = build_headers(api_key, folder_id)
+        # Unparsable replies are re-asked with a short synchronous reformat call
+        self.live_backend = LiveBackend(api_key, folder_id, self.client)
+
+    def request_key(self, item):
+        return make_cache_key(item["query"], item["answer_a"], item["answer_b"], self.persona_name,
+                              self.model_uri, TEMPERATURE,
+                              prompt_version("scores_only" if self.scores_only else "full"))
+
+    def submit(self, item):
+        """
+        Starts the judge operation for one row.
+
+        Returns:
+            tuple: `(key, result)` where `result` is a finished result dict (cache hit,
+            stored result or submission error), or None while the operation is pending.
+        """
+        if not self.api_key or not self.folder_id:
+            return None, {"error": "Missing API Key or Folder ID for real mode execution."}
+
+        key = self.request_key(item)
+        if self.cache is not None and not self.bypass_cache:
+            cached = lookup_cached_verdict(self.cache, key)
+            if cached is not None:
+                return key, cached
+
+        known = self.store.get(key)
+        if known is not None and not self.bypass_cache:
+            if known["status"] == "pending":
+                logger.info(f"Reusing pending operation {known['operation_id']}")
+                return key, None
+            if known["status"] == "done":
+                return key, _replayed(known["result"])
+
+        body = build_completion_body(item["query"], item["answer_a"], item["answer_b"], self.model_uri,
+                                     self.persona_name, max_tokens=self.max_tokens, scores_only=self.scores_only)
+        try:
+            response, call_stats = self.client.post(ASYNC_COMPLETION_PATH, headers=self.headers, body=body)
+        except requests.RequestException as e:
+            logger.error(f"Async submission failed after retries: {e}")
+            return key, {"error": f"Request to Yandex API failed: {str(e)}"}
+        if response.status_code != 200:
+            logger.error(f"Yandex API Error: {response.status_code} - {response.text}")
+            return key, {"error": f"Yandex API Error {response.status_code}: {response.text}", "call_stats": call_stats}
+
+        operation_id = response.json().get("id")
+        if not operation_id:
+            return key, {"error": "Received unexpected response structure from Yandex API."}
+        self.store.record_submitted(key, operation_id)
+        return key, None
+
+    def poll(self, key):
+        """Checks one pending operation; returns its result dict once done, otherwise None."""
+        known = self.store.get(key)
+        if known is None:
+            return {"error": "Unknown async operation."}
+        if known["status"] != "pending":
+            # Finished by another run meanwhile, which already paid for it
+            return _replayed(known["result"])
+
+        operation_id = known["operation_id"]
+        try:
+            response, _ = self.client.get_operation(operation_id, headers=self.headers)
+        except requests.RequestException as e:
+            logger.warning(f"Polling {operation_id} failed, will retry: {e}")
+            return self._check_expired(key, known)
+        if response.status_code == 404:
+            logger.error(f"Operation {operation_id} is unknown to the server (expired or never created)")
+            result = {"error": f"Async operation {operation_id} not found: {response.text}"}
+            self.store.record_finished(key, "failed", result)
+            return result
+        if response.status_code != 200:
+            logger.warning(f"Polling {operation_id} returned {response.status_code}, will retry")
+            return self._check_expired(key, known)
+
+        operation = response.json()
+        if not operation.get("done"):
+            return self._check_expired(key, known)
+
+        if "error" in operation:
+            error = operation["error"]
+            result = {"error": f"Async operation failed: {error.get('message', error)}"}
+            self.store.record_finished(key, "failed", result)
+            return result
+
+        result = parse_completion(operation.get("response"))
+        if "raw_response" in result:
+            result, _ = self.live_backend.recover(result, {}, self.max_tokens)
+        result["operation_id"] = known["operation_id"]
+        if self.scores_only and "error" not in result:
+            result["scores_only"] = True
+        if "error" not in result and self.cache is not None:
+            self.cache.put(key, result)
+        self.store.record_finished(key, "done" if "error" not in result else "failed", result)
+        return result
+
+    def _check_expired(self, key, known):
+        """Fails an operation pending for longer than `max_pending_seconds`; None while it may still finish."""
+        age = time.time() - known["submitted_at"]
+        if age < self.max_pending_seconds:
+            return None
+        logger.error(f"Operation {known['operation_id']} still pending after {age:.0f}s, giving up")
+        result = {"error": f"Async operation {known['operation_id']} did not finish within "
+                           f"{self.max_pending_seconds:.0f}s."}
+        self.store.record_finished(key, "failed", result)
+        return result
+
+
+def iter_async_evaluations(items, judge, rate_limiter=None, max_outstanding=DEFAULT_MAX_OUTSTANDING,
+                           http_workers=DEFAULT_HTTP_WORKERS, poll_min=POLL_MIN_INTERVAL, poll_max=POLL_MAX_INTERVAL,
+                           metrics=None, token_estimator=estimate_request_tokens):
+    """
+    Runs a batch through `AsyncJudge` and yields results as operations finish.
+
+    Up to `max_outstanding` operations are kept in flight. One shared poller sweeps all
+    of them; the sweep interval grows by `POLL_BACKOFF` while nothing finishes and drops
+    back to `poll_min` as soon as something does.
+
+    Identical rows share one operation. The rate limiter is charged `token_estimator(item)`
+    per submitted operation and settled with the real usage once the result is known.
+
+    With `metrics`, a row's wall time runs from its submission to the sweep that
+    found its operation done, so it includes up to one poll interval of slack.
+
+    Yields:
+        tuple: `(index, item, result)`, the same contract as `batch_runner.iter_evaluations`.
+    """
+    source = enumerate(items)
+    exhausted = False
+    outstanding = {}  # request key -> [(index, item), ...]; identical rows share one operation
+    timings = {}  # row index -> (submission start, rate-limiter wait)
+    estimates = {}  # request key -> tokens charged to the rate limiter, settled when the result arrives
+    interval = poll_min
+
+    def submit_one(group):
+        index, item = group[0]
+        estimated = token_estimator(item) if rate_limiter else 0
+        started = time.perf_counter()
+        if rate_limiter:
+            rate_limiter.acquire(estimated)
+        waited = time.perf_counter() - started
+        try:
+            key, result = judge.submit(item)
+        except Exception as e:
+            logger.exception("Async submission failed.")
+            key, result = None, {"error": f"An unexpected error occurred: {str(e)}"}
+        if rate_limiter:
+            if result is not None:
+                rate_limiter.settle(estimated, _usage_total(result) or estimated)
+            else:
+                estimates[key] = estimated
+        if metrics is not None:
+            for position, (entry_index, _) in enumerate(group):
+                if result is None:
+                    timings[entry_index] = (started + waited, waited)
+                else:
+                    metrics.record(result if position == 0 else _replayed(result),
+                                   time.perf_counter() - started - waited, waited)
+        return group, key, result
+
+    def poll_one(key):
+        try:
+            return judge.poll(key)
+        except Exception as e:
+            logger.exception("Async poll failed.")
+            return {"error": f"An unexpected error occurred: {str(e)}"}
+
+    with ThreadPoolExecutor(max_workers=http_workers, thread_name_prefix="judge-async") as pool:
+        while True:
+            # 1. Top up submissions; identical rows in flight or in this batch ride on one operation
+            groups = {}
+            while not exhausted and len(outstanding) + len(groups) < max_outstanding:
+                try:
+                    index, item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                key = judge.request_key(item)
+                if key in outstanding:
+                    outstanding[key].append((index, item))
+                    if metrics is not None:
+                        timings[index] = (time.perf_counter(), 0.0)
+                else:
+                    groups.setdefault(key, []).append((index, item))
+            for group, key, result in pool.map(submit_one, groups.values()):
+                if result is not None:
+                    for position, (index, item) in enumerate(group):
+                        yield index, item, dict(result) if position == 0 else _replayed(result)
+                else:
+                    outstanding.setdefault(key, []).extend(group)
+
+            if not outstanding:
+                if exhausted:
+                    return
+                continue
+
+            # 2. Shared poll sweep with adaptive backoff
+            time.sleep(interval)
+            keys = list(outstanding)
+            finished = 0
+            for key, result in zip(keys, pool.map(poll_one, keys)):
+                if result is None:
+                    continue
+                finished += 1
+                if rate_limiter and key in estimates:
+                    estimated = estimates.pop(key)
+                    rate_limiter.settle(estimated, _usage_total(result) or estimated)
+                for position, (index, item) in enumerate(outstanding.pop(key)):
+                    # The operation is billed once, to the first row waiting on it
+                    row_result = dict(result) if position == 0 else _replayed(result)
+                    if metrics is not None:
+                        started, waited = timings.pop(index)
+                        metrics.record(row_result, time.perf_counter() - started, waited)
+                    yield index, item, row_result
+            interval = poll_min if finished else min(interval * POLL_BACKOFF, poll_max)
+            logger.info(f"Async poll: {finished} finished, {len(outstanding)} pending, next sweep in {interval:.1f}s")
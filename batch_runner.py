@@ -0,0 +1,324 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from judge_core import CRITERIA_NAMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+# Rough request size used by the tokens/sec limiter before the real usage is known
+PROMPT_OVERHEAD_TOKENS = 900
+EXPECTED_OUTPUT_TOKENS = 400
+CHARS_PER_TOKEN = 3
+
+# Per-criterion score columns, e.g. "score_a_truthfulness"
+CRITERION_COLUMNS = tuple(f"score_{side}_{name.lower()}" for side in ("a", "b") for name in CRITERIA_NAMES)
+
+# Columns added by `flatten_verdict`, in output order
+RESULT_COLUMNS = (
+    "row_index", "error",
+    "score_a_overall", "reasoning_a", "score_b_overall", "reasoning_b", "comparison",
+) + CRITERION_COLUMNS + (
+    "input_tokens", "output_tokens", "total_tokens", "cache_hit", "retries",
+    "judge_model", "escalated", "escalation_reason", "escalation_failed", "lite_tokens", "truncated", "pack_size",
+    "scores_only", "winner", "resolution", "duplicate_of",
+)
+
+
+class RateLimiter:
+    """
+    Thread-safe token-bucket limiter for requests/sec and tokens/sec quotas.
+
+    Each bucket holds up to one second worth of quota, so short bursts are allowed
+    but the long-run rate never exceeds the configured limits. The token bucket may
+    go into debt when a request turns out bigger than estimated (see `settle`).
+    """
+
+    def __init__(self, requests_per_second=None, tokens_per_second=None):
+        self.requests_per_second = requests_per_second or None
+        self.tokens_per_second = tokens_per_second or None
+        self._lock = threading.Lock()
+        self._request_level = float(self.requests_per_second or 0)
+        self._token_level = float(self.tokens_per_second or 0)
+        self._last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_second:
+            self._request_level = min(
+                float(self.requests_per_second),
+                self._request_level + elapsed * self.requests_per_second
+            )
+        if self.tokens_per_second:
+            self._token_level = min(
+                float(self.tokens_per_second),
+                self._token_level + elapsed * self.tokens_per_second
+            )
+
+    def acquire(self, tokens=0):
+        """Blocks until one request carrying `tokens` tokens may be sent."""
+        while True:
+            with self._lock:
+                self._refill()
+                wait_s = 0.0
+                if self.requests_per_second and self._request_level < 1:
+                    wait_s = (1 - self._request_level) / self.requests_per_second
+                if self.tokens_per_second:
+                    # A request larger than the whole bucket only waits for a full bucket
+                    needed = min(tokens, self.tokens_per_second)
+                    if self._token_level < needed:
+                        wait_s = max(wait_s, (needed - self._token_level) / self.tokens_per_second)
+                if wait_s <= 0:
+                    if self.requests_per_second:
+                        self._request_level -= 1
+                    if self.tokens_per_second:
+                        self._token_level -= tokens
+                    return
+            time.sleep(wait_s)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Corrects the token bucket once the real usage of a request is known."""
+        if not self.tokens_per_second:
+            return
+        with self._lock:
+            self._token_level -= (actual_tokens - estimated_tokens)
+
+
+def estimate_request_tokens(item):
+    """Cheap upper-bound guess of the total tokens one judge call will consume."""
+    text_len = sum(len(str(item.get(col, ""))) for col in ("query", "answer_a", "answer_b"))
+    return PROMPT_OVERHEAD_TOKENS + text_len // CHARS_PER_TOKEN + EXPECTED_OUTPUT_TOKENS
+
+
+def _usage_total(result):
+    try:
+        return int(result.get("usage", {}).get("totalTokens", 0))
+    except (TypeError, ValueError, AttributeError):
+        return 0
+
+
+def _call(evaluate_fn, item, rate_limiter, token_estimator, metrics=None):
+    estimated = token_estimator(item) if rate_limiter else 0
+    started = time.perf_counter()
+    if rate_limiter:
+        rate_limiter.acquire(estimated)
+    waited = time.perf_counter() - started
+    started = time.perf_counter()
+    try:
+        result = evaluate_fn(item)
+    except Exception as e:
+        logger.exception("Evaluation failed inside batch worker.")
+        result = {"error": f"An unexpected error occurred: {str(e)}"}
+    if rate_limiter:
+        rate_limiter.settle(estimated, _usage_total(result) or estimated)
+    if metrics is not None:
+        wall_time = time.perf_counter() - started
+        # A packed `evaluate_fn` returns one result per row of the pack
+        for row_result in (result if isinstance(result, list) else [result]):
+            metrics.record(row_result, wall_time, waited)
+    return result
+
+
+def iter_evaluations(items, evaluate_fn, max_workers=DEFAULT_CONCURRENCY, rate_limiter=None,
+                     token_estimator=estimate_request_tokens, max_in_flight=None, metrics=None):
+    """
+    Runs `evaluate_fn` over `items` concurrently and yields results as they complete.
+
+    Only a bounded window of items is submitted at once, so `items` may be a lazy
+    iterator over a dataset that does not fit in memory.
+
+    Args:
+        items (iterable): Row dicts passed one by one to `evaluate_fn`.
+        evaluate_fn (callable): Function `item -> result dict`.
+        max_workers (int): Maximum number of concurrent judge calls.
+        rate_limiter (RateLimiter): Optional quota limiter shared by all workers.
+        token_estimator (callable): Function `item -> int` used by the tokens/sec limiter.
+        max_in_flight (int): Submission window size, defaults to twice `max_workers`.
+        metrics (MetricsRegistry): Optional per-call instrumentation (see `metrics.py`).
+
+    Yields:
+        tuple: `(index, item, result)` in completion order, `index` being the position in `items`.
+    """
+    max_workers = max(1, int(max_workers))
+    max_in_flight = max_in_flight or max_workers * 2
+    source = enumerate(items)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="judge")
+    pending = {}
+
+    def fill():
+        while len(pending) < max_in_flight:
+            try:
+                index, item = next(source)
+            except StopIteration:
+                return
+            future = pool.submit(_call, evaluate_fn, item, rate_limiter, token_estimator, metrics)
+            pending[future] = (index, item)
+
+    try:
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = pending.pop(future)
+                yield index, item, future.result()
+            fill()
+    finally:
+        # Stop promptly if the consumer abandons the generator midway
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_in_order(completed, position=None):
+    """
+    Re-sequences `(index, item, result)` tuples from `iter_evaluations` into input order.
+
+    Only results that finished ahead of a slower predecessor are buffered, so memory
+    is bounded by the submission window (plus any scheduling window) rather than by
+    the dataset size.
+
+    Args:
+        completed (iterable): `(index, item, result)` tuples in any order.
+        position (callable): Function `(index, item) -> int` giving the input position;
+            defaults to `index`. Use it when items were submitted out of input order.
+    """
+    buffered = {}
+    next_index = 0
+    for index, item, result in completed:
+        buffered[position(index, item) if position else index] = (item, result)
+        while next_index in buffered:
+            item, result = buffered.pop(next_index)
+            yield next_index, item, result
+            next_index += 1
+
+
+def run_batch(items, evaluate_fn, max_workers=DEFAULT_CONCURRENCY, rate_limiter=None,
+              progress_callback=None, token_estimator=estimate_request_tokens):
+    """
+    Evaluates all `items` concurrently and returns the results in input order.
+
+    Args:
+        items (list): Row dicts passed one by one to `evaluate_fn`.
+        evaluate_fn (callable): Function `item -> result dict`.
+        max_workers (int): Maximum number of concurrent judge calls.
+        rate_limiter (RateLimiter): Optional quota limiter shared by all workers.
+        progress_callback (callable): Called as `progress_callback(done, total)` after each result.
+        token_estimator (callable): Function `item -> int` used by the tokens/sec limiter.
+
+    Returns:
+        list: One result dict per item, aligned with `items`.
+    """
+    items = list(items)
+    total = len(items)
+    results = [None] * total
+    done = 0
+    for index, _, result in iter_evaluations(items, evaluate_fn, max_workers=max_workers,
+                                          rate_limiter=rate_limiter, token_estimator=token_estimator):
+        results[index] = result
+        done += 1
+        if progress_callback:
+            progress_callback(done, total)
+    return results
+
+
+def _as_score(value):
+    """Coerces a 1-10 score from the model to int; anything else becomes None."""
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        return None
+    return score if 0 <= score <= 10 else None
+
+
+def flatten_verdict(row, eval_res):
+    """
+    Merges a judge result into a flat CSV-friendly row dict.
+
+    Args:
+        row (dict): The original input row.
+        eval_res (dict): Result returned by `evaluate_with_yandex`.
+
+    Returns:
+        dict: A copy of `row` with overall and per-criterion score, reasoning and token columns added.
+    """
+    row_result = dict(row)
+    row_result["retries"] = eval_res.get("call_stats", {}).get("retries", 0)
+    row_result["duplicate_of"] = eval_res.get("duplicate_of")
+
+    # Token Usage (failed calls are billed too)
+    usage = eval_res.get("usage", {})
+    row_result["input_tokens"] = int(usage.get("inputTextTokens", 0))
+    row_result["output_tokens"] = int(usage.get("completionTokens", 0))
+    row_result["total_tokens"] = int(usage.get("totalTokens", 0))
+    row_result["cache_hit"] = bool(eval_res.get("cache_hit", False))
+    row_result["truncated"] = bool(row.get("truncated", False))
+
+    # Cascade Stats
+    cascade = eval_res.get("cascade")
+    if cascade:
+        row_result["judge_model"] = eval_res.get("judge_model")
+        row_result["escalated"] = cascade["escalated"]
+        row_result["escalation_reason"] = cascade["reason"]
+        row_result["escalation_failed"] = bool(cascade.get("escalation_failed", False))
+        row_result["lite_tokens"] = int(cascade.get("lite_usage", {}).get("totalTokens", 0))
+
+    if "error" in eval_res:
+        row_result["error"] = eval_res["error"]
+        return row_result
+
+    # Model A Stats
+    ma = eval_res.get("model_a", {})
+    row_result["score_a_overall"] = _as_score(ma.get("overall_score"))
+    row_result["reasoning_a"] = ma.get("reasoning")
+
+    # Model B Stats
+    mb = eval_res.get("model_b", {})
+    row_result["score_b_overall"] = _as_score(mb.get("overall_score"))
+    row_result["reasoning_b"] = mb.get("reasoning")
+
+    row_result["comparison"] = eval_res.get("comparison")
+    # Set only for rows decided without the judge (see `dedup.py`)
+    row_result["winner"] = eval_res.get("winner")
+    row_result["resolution"] = eval_res.get("resolution")
+
+    # Per-criterion Scores
+    for side, model_stats in (("a", ma), ("b", mb)):
+        scores = model_stats.get("scores") or {}
+        for name in CRITERIA_NAMES:
+            row_result[f"score_{side}_{name.lower()}"] = _as_score(scores.get(name))
+
+    row_result["pack_size"] = eval_res.get("pack_size", 1)
+    row_result["scores_only"] = bool(eval_res.get("scores_only", False))
+    return row_result
+
+
+def verdict_from_row(row):
+    """
+    Rebuilds the scores of a verdict from a flat result row (the inverse of `flatten_verdict`).
+
+    Returns:
+        dict: `model_a` / `model_b` with overall and per-criterion scores, as `explain` expects them.
+    """
+    verdict = {}
+    for side in ("a", "b"):
+        verdict[f"model_{side}"] = {
+            "overall_score": _as_score(row.get(f"score_{side}_overall")),
+            "scores": {name: _as_score(row.get(f"score_{side}_{name.lower()}")) for name in CRITERIA_NAMES},
+        }
+    return verdict
+
+
+def apply_explanation(row, explanation):
+    """
+    Fills the reasoning columns of a scores-only result row from an `explain` result.
+
+    Returns:
+        dict: A copy of `row`; scores and token columns are left as they were.
+    """
+    row_result = dict(row)
+    for col in ("reasoning_a", "reasoning_b", "comparison"):
+        row_result[col] = explanation.get(col)
+    return row_result
@@ -0,0 +1,273 @@
+"""
+End-to-end throughput/latency benchmark of the batch pipeline against the mock API.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 200 1000 --concurrency 1 8 32 --modes sync packed
+
+Each scenario starts from a synthetic CSV on disk and goes through the same path as
+a real batch: chunked input reading, concurrent judge calls over the pooled client,
+re-ordering, flattening and the Parquet result writer. `mock_server.py` runs in a
+separate process so its work does not compete with the pipeline for the GIL.
+
+Reported per scenario: rows/sec, p50/p95/p99 judge call latency, peak RSS growth,
+error rows, and the mock's counters for injected throttling and errors. Results are
+appended as JSON lines to `--output` together with the git revision, so numbers can
+be compared across releases.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import pandas  # noqa: F401
+import pyarrow.parquet  # noqa: F401  (loaded up front so lazy imports do not count as scenario memory)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from judge_logic import evaluate_with_yandex  # noqa: E402
+from batch_runner import iter_evaluations, iter_in_order, flatten_verdict  # noqa: E402
+from streaming_io import iter_input_rows, ResultWriter  # noqa: E402
+from yandex_client import YandexGPTClient  # noqa: E402
+from packing import evaluate_packed, iter_packed_evaluations  # noqa: E402
+from async_backend import AsyncJudge, OperationStore, iter_async_evaluations  # noqa: E402
+
+MODES = ("sync", "packed", "async")
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results.jsonl")
+
+WORDS = ("поиск", "ответ", "модель", "запрос", "данные", "город", "история", "погода", "рецепт", "закон",
+         "температура", "население", "столица", "событие", "источник", "факт", "год", "цена", "время", "список")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(args):
+    """Runs `mock_server.py` in a child process and waits until it accepts connections."""
+    port = _free_port()
+    command = [
+        sys.executable, os.path.join(ROOT, "mock_server.py"), "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--latency-sigma", str(args.latency_sigma),
+        "--rate-429", str(args.rate_429), "--rate-5xx", str(args.rate_5xx),
+        "--malformed-rate", str(args.malformed_rate), "--retry-after", str(args.retry_after),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, cwd=ROOT)
+    process.stdout.readline()  # "listening on ..." once the socket is bound
+    return process, f"http://127.0.0.1:{port}"
+
+
+def mock_counters(base_url):
+    import requests
+    return requests.get(f"{base_url}/stats", timeout=5).json()
+
+
+def write_dataset(path, n_rows, answer_chars, seed=0):
+    """Synthetic dataset with random word salad of roughly `answer_chars` per answer."""
+    import csv
+    rng = random.Random(seed)
+
+    def text(n_chars):
+        words = []
+        length = 0
+        while length < n_chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query", "answer_a", "answer_b"])
+        for _ in range(n_rows):
+            writer.writerow([text(60), text(answer_chars), text(answer_chars)])
+
+
+class PeakRSSSampler:
+    """Samples the process RSS in the background and keeps the peak (Linux /proc; 0 elsewhere)."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.baseline = self.peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+    @property
+    def growth_mb(self):
+        return (self.peak - self.baseline) / 2 ** 20
+
+
+def run_scenario(mode, dataset_path, n_rows, concurrency, base_url, work_dir):
+    client = YandexGPTClient(pool_size=concurrency, base_url=base_url, operation_url=base_url)
+    judge_kwargs = dict(api_key="mock", folder_id="mock", demo_mode=False, client=client)
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def timed(fn, weight=None):
+        def wrapper(arg):
+            started = time.perf_counter()
+            result = fn(arg)
+            elapsed = time.perf_counter() - started
+            with latencies_lock:
+                latencies.extend([elapsed] * (weight(arg) if weight else 1))
+            return result
+        return wrapper
+
+    def rows():
+        for row_index, row in enumerate(iter_input_rows(dataset_path)):
+            row["row_index"] = row_index
+            yield row
+
+    if mode == "sync":
+        evaluate_row = timed(lambda row: evaluate_with_yandex(row["query"], row["answer_a"], row["answer_b"], **judge_kwargs))
+        completed = iter_evaluations(rows(), evaluate_row, max_workers=concurrency)
+    elif mode == "packed":
+        # A packed call's latency is every row's latency
+        evaluate_pack = timed(lambda items: evaluate_packed(items, **judge_kwargs), weight=len)
+        completed = iter_packed_evaluations(rows(), evaluate_pack, max_workers=concurrency)
+    else:
+        # Async latency is not observable per call; only throughput is reported
+        store = OperationStore(os.path.join(work_dir, f"operations-{time.time_ns()}.sqlite3"))
+        judge = AsyncJudge("mock", "mock", client=client, store=store)
+        completed = iter_async_evaluations(rows(), judge, http_workers=concurrency, poll_min=0.05, poll_max=1.0)
+
+    errors = 0
+    result_path = os.path.join(work_dir, f"results-{mode}-{n_rows}-{concurrency}.parquet")
+    with PeakRSSSampler() as memory:
+        started = time.perf_counter()
+        with ResultWriter(result_path) as writer:
+            for _, row, result in iter_in_order(completed, position=lambda _, item: item["row_index"]):
+                record = flatten_verdict(row, result)
+                errors += 1 if "error" in record else 0
+                writer.write(record)
+        elapsed = time.perf_counter() - started
+
+    stats = client.stats()
+    client.close()
+    percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else [None] * 3
+    return {
+        "mode": mode,
+        "rows": n_rows,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(n_rows / elapsed, 2),
+        "p50_ms": None if percentiles[0] is None else round(float(percentiles[0]), 1),
+        "p95_ms": None if percentiles[1] is None else round(float(percentiles[1]), 1),
+        "p99_ms": None if percentiles[2] is None else round(float(percentiles[2]), 1),
+        "peak_rss_growth_mb": round(memory.growth_mb, 1),
+        "error_rows": errors,
+        "requests_sent": stats["requests_sent"],
+        "retries": stats["retries"],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    columns = ("mode", "rows", "concurrency", "rows_per_sec", "p50_ms", "p95_ms", "p99_ms",
+               "peak_rss_growth_mb", "error_rows", "retries")
+    widths = [max(len(col), *(len(str(r[col])) for r in results)) for col in columns]
+    print("  ".join(col.rjust(w) for col, w in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[col]).rjust(w) for col, w in zip(columns, widths)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch pipeline benchmark against the mock Yandex API")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 1000], help="Dataset sizes (rows)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrency levels")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["sync"], help="Pipelines to measure")
+    parser.add_argument("--answer-chars", type=int, default=600, help="Approximate length of each answer")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median mock latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread of the mock latency")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON lines file the results are appended to")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)  # judge_core logs every request at INFO
+    server, base_url = start_mock_server(args)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="autoassessor_bench_") as work_dir:
+            # Warm-up run, discarded: one-off allocations would otherwise land on the first scenario
+            warmup_path = os.path.join(work_dir, "warmup.csv")
+            write_dataset(warmup_path, 20, args.answer_chars)
+            run_scenario(args.modes[0], warmup_path, 20, 2, base_url, work_dir)
+
+            for n_rows in args.sizes:
+                dataset_path = os.path.join(work_dir, f"dataset-{n_rows}.csv")
+                write_dataset(dataset_path, n_rows, args.answer_chars)
+                for mode in args.modes:
+                    for concurrency in args.concurrency:
+                        before = mock_counters(base_url)
+                        result = run_scenario(mode, dataset_path, n_rows, concurrency, base_url, work_dir)
+                        after = mock_counters(base_url)
+                        result["mock"] = {key: after[key] - before.get(key, 0) for key in after}
+                        results.append(result)
+                        print(f"{mode} rows={n_rows} concurrency={concurrency}: {result['rows_per_sec']} rows/s", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print()
+    print_table(results)
+
+    run_info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "mock": {k: getattr(args, k) for k in ("latency_ms", "latency_sigma", "rate_429", "rate_5xx", "malformed_rate")},
+        "answer_chars": args.answer_chars,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(dict(run_info, **result), ensure_ascii=False) + "\n")
+    print(f"\nAppended {len(results)} results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
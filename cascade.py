@@ -0,0 +1,109 @@
+import logging
+
+from judge_logic import evaluate_with_yandex, MODEL_NAME, LITE_MODEL_NAME, MODEL_PRICES_RUB_PER_1K
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ESCALATION_MARGIN = 2
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _sum_usage(*usages):
+    keys = ("inputTextTokens", "completionTokens", "totalTokens")
+    return {k: str(sum(_as_int(u.get(k, 0)) for u in usages)) for k in keys}
+
+
+def escalation_reason(result, margin=DEFAULT_ESCALATION_MARGIN):
+    """
+    Decides whether a cheap-model verdict should be re-judged by Pro.
+
+    Returns:
+        str or None: "error", "tie" or "close_call" when escalation is needed, else None.
+    """
+    if "error" in result:
+        return "error"
+    try:
+        score_a = int(result["model_a"]["overall_score"])
+        score_b = int(result["model_b"]["overall_score"])
+    except (KeyError, TypeError, ValueError):
+        return "error"
+    gap = abs(score_a - score_b)
+    if gap == 0:
+        return "tie"
+    if gap < margin:
+        return "close_call"
+    return None
+
+
+def evaluate_cascade(query, ans_a, ans_b, api_key, folder_id, demo_mode=True, persona_name="Strict Fact-Checker",
+                     margin=DEFAULT_ESCALATION_MARGIN, **judge_kwargs):
+    """
+    Judges a pair with YandexGPT Lite first and escalates to Pro only on close calls.
+
+    A row is escalated when Lite's overall scores differ by less than `margin`, when
+    Lite calls a tie, or when its reply could not be parsed. The returned result has
+    the usual schema plus a `cascade` block; `usage` covers the tokens of both stages.
+    If the Pro call fails, Lite's verdict is kept and marked `escalation_failed`.
+
+    Args:
+        margin (int): Minimum overall score gap for Lite's verdict to be accepted.
+        **judge_kwargs: Passed to `evaluate_with_yandex` (cache, bypass_cache, client, ...).
+
+    Returns:
+        dict: The accepted verdict with `cascade` = {escalated, reason, lite_usage, escalation_failed}.
+    """
+    common = dict(query=query, ans_a=ans_a, ans_b=ans_b, api_key=api_key, folder_id=folder_id,
+                  demo_mode=demo_mode, persona_name=persona_name, **judge_kwargs)
+
+    lite = evaluate_with_yandex(model_name=LITE_MODEL_NAME, **common)
+    lite_usage = lite.get("usage", {})
+    reason = escalation_reason(lite, margin)
+    if reason is None:
+        lite["cascade"] = {"escalated": False, "reason": None, "lite_usage": lite_usage, "escalation_failed": False}
+        lite["judge_model"] = LITE_MODEL_NAME
+        return lite
+
+    logger.info(f"Cascade: escalating to Pro ({reason})")
+    pro = evaluate_with_yandex(model_name=MODEL_NAME, **common)
+    usage = _sum_usage(lite_usage, pro.get("usage", {}))
+    failed = "error" in pro
+    if failed and "error" not in lite:
+        # A valid (if close) Lite verdict beats an error row
+        logger.warning(f"Cascade: Pro escalation failed, keeping the Lite verdict: {pro['error']}")
+        lite["usage"] = usage
+        lite["cascade"] = {"escalated": True, "reason": reason, "lite_usage": lite_usage, "escalation_failed": True,
+                           "pro_error": pro["error"]}
+        lite["judge_model"] = LITE_MODEL_NAME
+        return lite
+    pro["usage"] = usage
+    pro["cascade"] = {"escalated": True, "reason": reason, "lite_usage": lite_usage, "escalation_failed": failed}
+    pro["judge_model"] = MODEL_NAME
+    return pro
+
+
+def cascade_savings(lite_tokens, pro_tokens, lite_only_tokens):
+    """
+    Compares the cascade's estimated spend with judging every row on Pro.
+
+    Lite-only rows are assumed to cost Pro the same number of tokens, since the
+    prompt is identical.
+
+    Args:
+        lite_tokens (int): All tokens spent on Lite, including rows that escalated.
+        pro_tokens (int): Tokens spent on Pro for escalated rows.
+        lite_only_tokens (int): Lite tokens of rows that were not escalated.
+
+    Returns:
+        dict: `actual_cost`, `all_pro_cost` and `saved` in roubles.
+    """
+    lite_price = MODEL_PRICES_RUB_PER_1K[LITE_MODEL_NAME]
+    pro_price = MODEL_PRICES_RUB_PER_1K[MODEL_NAME]
+    actual = lite_tokens / 1000 * lite_price + pro_tokens / 1000 * pro_price
+    all_pro = (pro_tokens + lite_only_tokens) / 1000 * pro_price
+    return {"actual_cost": actual, "all_pro_cost": all_pro, "saved": all_pro - actual}
@@ -0,0 +1,730 @@
+"""
+Headless batch runner for AutoAssessor.
+
+Usage:
+    python cli.py run data.csv -o results.jsonl --persona "Strict Fact-Checker"
+    python cli.py submit data.csv --queue jobs.sqlite3 && python cli.py worker --queue jobs.sqlite3
+    python cli.py run data.csv -o results.jsonl --scores-only && python cli.py explain results.jsonl --max-gap 1
+
+Every finished verdict is appended to the output JSONL file right away and a
+checkpoint is kept next to it, so a killed run started again with the same
+arguments resumes from the first unfinished row instead of starting over.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+from judge_logic import evaluate_with_yandex, PROMPTS
+from judge_core import make_judge, SCORES_ONLY_MAX_TOKENS, EXPLAIN_MAX_TOKENS
+from batch_runner import (
+    RateLimiter, iter_evaluations, flatten_verdict, verdict_from_row, apply_explanation, DEFAULT_CONCURRENCY
+)
+from verdict_cache import VerdictCache, DEFAULT_CACHE_PATH
+from yandex_client import YandexGPTClient
+from packing import evaluate_packed, iter_packed_evaluations, MAX_PACK_SIZE
+from cascade import evaluate_cascade, DEFAULT_ESCALATION_MARGIN
+from async_backend import AsyncJudge, OperationStore, iter_async_evaluations, DEFAULT_OPERATIONS_PATH
+from streaming_io import iter_input_rows, convert_results, read_results, iter_result_records, replace_results
+from metrics import MetricsRegistry
+from dedup import plan_dedup, iter_deduplicated, DEFAULT_NEAR_THRESHOLD
+from sequential import SequentialTest, iter_shuffled, DEFAULT_CONFIDENCE
+from job_queue import open_queue, submit_job, export_results, run_worker, DEFAULT_QUEUE_URL, LEASE_SECONDS
+from token_budget import (
+    plan_batch, truncate_row, estimate_row_tokens, iter_largest_first, recommended_max_tokens, DEFAULT_ANSWER_BUDGET
+)
+
+logger = logging.getLogger("autoassessor.cli")
+
+REQUIRED_COLUMNS = {"query", "answer_a", "answer_b"}
+
+# Checkpoint is rewritten at most this often (seconds); the output file is the source of truth
+CHECKPOINT_INTERVAL = 2.0
+
+
+def checkpoint_path(output_path):
+    return f"{output_path}.checkpoint.json"
+
+
+def load_checkpoint(output_path):
+    path = checkpoint_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(output_path, state):
+    """Writes the checkpoint atomically so a crash never leaves a torn file behind."""
+    path = checkpoint_path(output_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_finished_rows(output_path, retry_errors=False):
+    """
+    Collects the row indices already present in the output file.
+
+    A trailing line cut off by a crash is truncated away so that appending can continue cleanly.
+
+    Returns:
+        set: Indices of finished rows (error rows are excluded when `retry_errors` is set).
+    """
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for raw in f:
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                logger.warning(f"Dropping a partially written line at byte {valid_bytes} of {output_path}")
+                break
+            valid_bytes += len(raw)
+            if retry_errors and record.get("error"):
+                finished.discard(record.get("row_index"))
+            else:
+                finished.add(record.get("row_index"))
+    if valid_bytes != os.path.getsize(output_path):
+        with open(output_path, "rb+") as f:
+            f.truncate(valid_bytes)
+    return finished
+
+
+def first_unfinished(finished, start=0):
+    index = start
+    while index in finished:
+        index += 1
+    return index
+
+
+def log_sequential(sequential_test):
+    summary = sequential_test.summary()
+    interval = f"[{summary['win_rate_low']:.3f}, {summary['win_rate_high']:.3f}]"
+    if summary["decision"]:
+        logger.info(f"Sequential test: {summary['decision']} after {summary['rows']} rows, win rate of A "
+                    f"{summary['win_rate']:.3f} {interval} at {summary['confidence']:.0%} confidence")
+    else:
+        logger.info(f"Sequential test undecided after {summary['rows']} rows "
+                    f"({summary['reason'] or 'all rows judged'}), win rate of A interval {interval}")
+
+
+def print_plan(args):
+    plan = plan_batch(
+        iter_input_rows(args.input, chunksize=args.chunk_size),
+        persona_name=args.persona,
+        answer_budget=args.answer_budget,
+        concurrency=args.concurrency,
+        requests_per_second=args.rps or None,
+        scores_only=args.scores_only
+    )
+    print(json.dumps(plan, ensure_ascii=False, indent=2))
+    return 0
+
+
+def run_command(args):
+    if args.plan:
+        return print_plan(args)
+
+    api_key = args.api_key or os.environ.get("YANDEX_API_KEY", "")
+    folder_id = args.folder_id or os.environ.get("YANDEX_FOLDER_ID", "")
+    if args.demo and args.api_mode == "async":
+        logger.error("--api-mode async needs the real API; it has no demo backend.")
+        return 2
+    if args.cascade and args.api_mode == "async":
+        logger.error("--cascade is only supported with --api-mode sync.")
+        return 2
+    if args.pack and (args.cascade or args.api_mode == "async"):
+        logger.error("--pack is only supported with --api-mode sync and without --cascade.")
+        return 2
+    if args.pack and args.scores_only:
+        logger.error("--scores-only cannot be combined with --pack.")
+        return 2
+    if not args.demo and (not api_key or not folder_id):
+        logger.error("API key and folder id are required (flags or YANDEX_API_KEY / YANDEX_FOLDER_ID), or use --demo.")
+        return 2
+    if args.scores_only:
+        args.max_tokens = min(args.max_tokens, SCORES_ONLY_MAX_TOKENS)
+
+    run_config = {
+        "input": os.path.abspath(args.input),
+        "persona": args.persona,
+        "demo": args.demo,
+        "api_mode": args.api_mode,
+        "cascade": args.cascade,
+        "answer_budget": args.answer_budget,
+    }
+    if args.scores_only:
+        run_config["scores_only"] = True
+    if args.sequential:
+        run_config["sequential"] = {"confidence": args.confidence, "margin": args.equivalence_margin, "seed": args.seed}
+
+    # 1. Resume State
+    if args.restart:
+        for path in (args.output, checkpoint_path(args.output)):
+            if os.path.exists(path):
+                os.remove(path)
+    checkpoint = load_checkpoint(args.output)
+    if checkpoint and checkpoint.get("config") != run_config:
+        logger.error(f"{checkpoint_path(args.output)} belongs to a different run {checkpoint.get('config')}; use --restart or another --output.")
+        return 2
+    finished = scan_finished_rows(args.output, retry_errors=args.retry_errors)
+    if finished:
+        logger.info(f"Resuming: {len(finished)} rows already done, first unfinished row is {first_unfinished(finished)}")
+
+    # 2. Judge Setup
+    cache = None if args.no_cache else VerdictCache(args.cache_path)
+    client = YandexGPTClient(pool_size=args.concurrency)
+    limiter = RateLimiter(args.rps, args.tps)
+
+    def evaluate_row(row):
+        judge_kwargs = dict(
+            query=row["query"],
+            ans_a=row["answer_a"],
+            ans_b=row["answer_b"],
+            api_key=api_key,
+            folder_id=folder_id,
+            demo_mode=args.demo,
+            persona_name=args.persona,
+            cache=cache,
+            bypass_cache=args.bypass_cache,
+            client=client,
+            max_tokens=args.max_tokens,
+            scores_only=args.scores_only
+        )
+        if args.cascade:
+            return evaluate_cascade(margin=args.cascade_margin, **judge_kwargs)
+        return evaluate_with_yandex(**judge_kwargs)
+
+    def unfinished_rows():
+        for row_index, row in enumerate(iter_input_rows(args.input, chunksize=args.chunk_size)):
+            if row_index == 0 and not REQUIRED_COLUMNS.issubset(row):
+                raise ValueError(f"Input is missing required columns: {REQUIRED_COLUMNS - set(row)}")
+            if row_index not in finished:
+                row["row_index"] = row_index
+                yield row
+
+    def pending_rows():
+        for row in unfinished_rows():
+            yield truncate_row(row, args.answer_budget)
+
+    def request_size(row):
+        return estimate_row_tokens(row, args.persona, 0, scores_only=args.scores_only) + args.max_tokens
+
+    def scheduled_rows():
+        if args.sequential:
+            # Random order keeps the running estimate unbiased
+            return iter_shuffled(pending_rows(), seed=args.seed)
+        if args.no_largest_first:
+            return pending_rows()
+        return iter_largest_first(pending_rows(), request_size, window=args.chunk_size)
+
+    # 3. Deduplication Pre-pass (on the full answers, before truncation)
+    dedup_plan = None
+    if not args.no_dedup:
+        dedup_plan = plan_dedup(unfinished_rows(), near_threshold=args.near_dup_threshold or None)
+        report = dedup_plan.report()
+        logger.info(f"Dedup: {report['calls_avoided']} of {report['rows']} rows need no judge call "
+                    f"({report['avoided_share']:.1%}): {report['exact_duplicates']} exact and "
+                    f"{report['near_duplicates']} near duplicates, {report['calls_avoided'] - len(dedup_plan.duplicate_of)} "
+                    f"resolved locally (identical or empty answers)")
+
+    # 4. Sequential Test, replaying rows finished by an earlier attempt of this run
+    sequential_test = None
+    if args.sequential:
+        sequential_test = SequentialTest(args.confidence, args.equivalence_margin, args.max_rows, args.max_spend_tokens)
+        if finished:
+            sequential_test.replay(read_results(
+                args.output, columns=["score_a_overall", "score_b_overall", "winner", "total_tokens"], fmt="jsonl"
+            ))
+        if sequential_test.stopped:
+            log_sequential(sequential_test)
+            return 0
+
+    # 5. Evaluation Loop
+    done = errors = 0
+    started = time.monotonic()
+    last_checkpoint = 0.0
+    state = {"config": run_config, "completed": len(finished), "first_unfinished": first_unfinished(finished)}
+    metrics = MetricsRegistry(args.metrics_jsonl) if (args.metrics_prom or args.metrics_jsonl) else None
+
+    def judge_stream(rows):
+        if args.api_mode == "async":
+            async_judge = AsyncJudge(
+                api_key, folder_id, args.persona,
+                client=client,
+                store=OperationStore(args.operations_path),
+                cache=cache,
+                bypass_cache=args.bypass_cache,
+                max_tokens=args.max_tokens,
+                scores_only=args.scores_only
+            )
+            return iter_async_evaluations(
+                rows,
+                async_judge,
+                rate_limiter=limiter,
+                max_outstanding=args.max_outstanding,
+                http_workers=args.concurrency,
+                metrics=metrics,
+                token_estimator=request_size
+            )
+        if args.pack:
+            def evaluate_pack(pack):
+                return evaluate_packed(
+                    pack,
+                    api_key=api_key,
+                    folder_id=folder_id,
+                    demo_mode=args.demo,
+                    persona_name=args.persona,
+                    cache=cache,
+                    bypass_cache=args.bypass_cache,
+                    client=client,
+                    max_tokens=args.max_tokens,
+                    rate_limiter=limiter,
+                    token_estimator=request_size
+                )
+            return iter_packed_evaluations(
+                rows,
+                evaluate_pack,
+                max_workers=args.concurrency,
+                rate_limiter=limiter,
+                token_estimator=request_size,
+                persona_name=args.persona,
+                max_pack_size=args.max_pack_size,
+                per_row_max_tokens=args.max_tokens,
+                metrics=metrics
+            )
+        return iter_evaluations(
+            rows,
+            evaluate_row,
+            max_workers=args.concurrency,
+            rate_limiter=limiter,
+            token_estimator=request_size,
+            metrics=metrics
+        )
+
+    with open(args.output, "a", encoding="utf-8") as out:
+        try:
+            if dedup_plan is not None:
+                results = iter_deduplicated(scheduled_rows(), judge_stream, dedup_plan)
+            else:
+                results = judge_stream(scheduled_rows())
+            for _, row, eval_res in results:
+                record = flatten_verdict(row, eval_res)
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+
+                finished.add(row["row_index"])
+                done += 1
+                errors += 1 if "error" in record else 0
+                if sequential_test is not None and sequential_test.update(eval_res):
+                    break
+
+                now = time.monotonic()
+                if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    os.fsync(out.fileno())
+                    state["completed"] = len(finished)
+                    state["first_unfinished"] = first_unfinished(finished, state["first_unfinished"])
+                    state["updated_at"] = time.time()
+                    save_checkpoint(args.output, state)
+                    if args.metrics_prom:
+                        metrics.write_prometheus(args.metrics_prom)
+                    last_checkpoint = now
+                    logger.info(f"{done} rows done this run ({done / (now - started):.1f} rows/s), {errors} errors")
+        finally:
+            out.flush()
+            os.fsync(out.fileno())
+            state["completed"] = len(finished)
+            state["first_unfinished"] = first_unfinished(finished, state["first_unfinished"])
+            state["updated_at"] = time.time()
+            if sequential_test is not None:
+                state["sequential"] = {k: v for k, v in sequential_test.summary().items() if k != "trace"}
+            save_checkpoint(args.output, state)
+            if metrics is not None:
+                metrics.close()
+                if args.metrics_prom:
+                    metrics.write_prometheus(args.metrics_prom)
+
+    if metrics is not None:
+        snapshot = metrics.snapshot()
+        wall = snapshot["histograms"]["wall_time_seconds"]
+        logger.info(f"Judge calls: {snapshot['calls']}, error rate {snapshot['error_rate']:.1%}, "
+                    f"p50/p95 {wall['p50'] or 0:.2f}/{wall['p95'] or 0:.2f}s, {snapshot['throttled']} throttled (429), "
+                    f"{snapshot['rate_limit_wait_seconds']:.0f}s waiting for the rate limiter")
+    logger.info(f"Finished: {done} rows evaluated this run, {errors} errors, output in {args.output}")
+    if sequential_test is not None:
+        log_sequential(sequential_test)
+    if args.export:
+        exported = convert_results(args.output, args.export, chunksize=args.chunk_size)
+        logger.info(f"Exported {exported} rows to {args.export}")
+    return 1 if errors else 0
+
+
+def explain_command(args):
+    api_key = args.api_key or os.environ.get("YANDEX_API_KEY", "")
+    folder_id = args.folder_id or os.environ.get("YANDEX_FOLDER_ID", "")
+    if not args.demo and (not api_key or not folder_id):
+        logger.error("API key and folder id are required (flags or YANDEX_API_KEY / YANDEX_FOLDER_ID), or use --demo.")
+        return 2
+    if not args.rows and args.max_gap is None:
+        logger.error("Select rows with --rows and/or --max-gap.")
+        return 2
+
+    # 1. Rows to explain: the listed ones and close calls, skipping errors and rows that already have reasoning
+    wanted = set(args.rows or ())
+    selected = []
+    for record in iter_result_records(args.results):
+        if record.get("error") or record.get("reasoning_a"):
+            continue
+        row = dict(record, row_index=int(float(record["row_index"])))
+        verdict = verdict_from_row(row)
+        score_a, score_b = verdict["model_a"]["overall_score"], verdict["model_b"]["overall_score"]
+        close_call = (args.max_gap is not None and score_a is not None and score_b is not None
+                      and abs(score_a - score_b) <= args.max_gap)
+        if row["row_index"] in wanted or close_call:
+            selected.append((row, verdict))
+    if not selected:
+        logger.info(f"Nothing to explain in {args.results}")
+        return 0
+    logger.info(f"Fetching reasoning for {len(selected)} rows")
+
+    # 2. Explanations, cached per scores like verdicts
+    judge = make_judge(api_key, folder_id, demo_mode=args.demo, persona_name=args.persona,
+                       cache=None if args.no_cache else VerdictCache(args.cache_path),
+                       client=YandexGPTClient(pool_size=args.concurrency))
+
+    def explain_row(item):
+        row, verdict = item
+        return judge.explain(row["query"], row["answer_a"], row["answer_b"], verdict)
+
+    def request_size(item):
+        return estimate_row_tokens(item[0], args.persona, 0) + EXPLAIN_MAX_TOKENS
+
+    replacements = {}
+    errors = 0
+    explanations = iter_evaluations(selected, explain_row, max_workers=args.concurrency,
+                                    rate_limiter=RateLimiter(args.rps, args.tps), token_estimator=request_size)
+    for _, (row, _), explanation in explanations:
+        if "error" in explanation:
+            logger.error(f"Row {row['row_index']}: {explanation['error']}")
+            errors += 1
+            continue
+        replacements[row["row_index"]] = apply_explanation(row, explanation)
+
+    # 3. Written back in place
+    replace_results(args.results, replacements, chunksize=args.chunk_size)
+    logger.info(f"Added reasoning to {len(replacements)} rows of {args.results}, {errors} errors")
+    return 1 if errors else 0
+
+
+def submit_command(args):
+    queue = open_queue(args.queue)
+    if args.pack and args.scores_only:
+        logger.error("--scores-only cannot be combined with --pack.")
+        return 2
+    config = {
+        "persona": args.persona,
+        "demo": args.demo,
+        "cascade": args.cascade,
+        "cascade_margin": args.cascade_margin,
+        "pack": args.pack,
+        "max_pack_size": args.max_pack_size,
+        "answer_budget": args.answer_budget,
+        "max_tokens": min(args.max_tokens, SCORES_ONLY_MAX_TOKENS) if args.scores_only else args.max_tokens,
+        "scores_only": args.scores_only,
+    }
+    job_id = submit_job(queue, args.input, config, name=os.path.basename(args.input), dedup=not args.no_dedup,
+                        near_threshold=args.near_dup_threshold or None, chunksize=args.chunk_size)
+    print(job_id)
+    return 0
+
+
+def worker_command(args):
+    api_key = args.api_key or os.environ.get("YANDEX_API_KEY", "")
+    folder_id = args.folder_id or os.environ.get("YANDEX_FOLDER_ID", "")
+    queue = open_queue(args.queue, **({"lease_seconds": args.lease_seconds} if args.lease_seconds else {}))
+    metrics = MetricsRegistry(args.metrics_jsonl) if (args.metrics_prom or args.metrics_jsonl) else None
+    completed = run_worker(
+        queue,
+        api_key=api_key,
+        folder_id=folder_id,
+        client=YandexGPTClient(pool_size=args.concurrency),
+        cache=None if args.no_cache else VerdictCache(args.cache_path),
+        job_id=args.job,
+        max_workers=args.concurrency,
+        rate_limiter=RateLimiter(args.rps, args.tps),
+        lease_size=args.lease_size,
+        metrics=metrics,
+        exit_when_idle=not args.forever
+    )
+    if metrics is not None:
+        metrics.close()
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+    logger.info(f"Worker finished: {completed} rows completed")
+    return 0
+
+
+def status_command(args):
+    queue = open_queue(args.queue)
+    jobs = [queue.job(args.job)] if args.job else queue.list_jobs()
+    for job in jobs:
+        if job is None:
+            logger.error(f"Unknown job {args.job}")
+            return 2
+        print(json.dumps(dict(job_id=job["job_id"], name=job["name"], **queue.progress(job["job_id"])), ensure_ascii=False))
+    return 0
+
+
+def export_command(args):
+    queue = open_queue(args.queue)
+    if args.retry_errors:
+        logger.info(f"Requeued {queue.requeue_errors(args.job)} rows with errors")
+        return 0
+    rows = export_results(queue, args.job, args.output)
+    logger.info(f"Exported {rows} finished rows of job {args.job} to {args.output}")
+    return 0
+
+
+def tournament_command(args):
+    # numpy is only needed here, so the other subcommands start without it
+    from tournament import run_tournament, detect_models
+
+    api_key = args.api_key or os.environ.get("YANDEX_API_KEY", "")
+    folder_id = args.folder_id or os.environ.get("YANDEX_FOLDER_ID", "")
+    if not args.demo and (not api_key or not folder_id):
+        logger.error("API key and folder id are required (flags or YANDEX_API_KEY / YANDEX_FOLDER_ID), or use --demo.")
+        return 2
+
+    # 1. Dataset: rows are sampled per pair, so they are kept in memory
+    rows = list(iter_input_rows(args.input, chunksize=args.chunk_size))
+    if not rows:
+        logger.error(f"{args.input} has no rows.")
+        return 2
+    models = args.models or detect_models(rows[0])
+    missing = [model for model in models if f"answer_{model}" not in rows[0]]
+    if "query" not in rows[0] or missing or len(models) < 2:
+        logger.error(f"Need a query column and at least two answer_<model> columns; missing: {missing or models}")
+        return 2
+
+    # 2. Judge Setup
+    cache = None if args.no_cache else VerdictCache(args.cache_path)
+    client = YandexGPTClient(pool_size=args.concurrency)
+    metrics = MetricsRegistry(args.metrics_jsonl) if (args.metrics_prom or args.metrics_jsonl) else None
+
+    judge = make_judge(api_key, folder_id, demo_mode=args.demo, persona_name=args.persona, cache=cache,
+                       client=client, max_tokens=args.max_tokens, scores_only=args.scores_only)
+
+    def evaluate_comparison(item):
+        return judge(truncate_row(item, args.answer_budget))
+
+    # 3. Tournament, with every comparison logged as it finishes
+    comparisons_file = open(args.comparisons, "w", encoding="utf-8") if args.comparisons else None
+    try:
+        result = run_tournament(
+            rows, models, evaluate_comparison,
+            max_comparisons=args.budget,
+            max_workers=args.concurrency,
+            rate_limiter=RateLimiter(args.rps, args.tps),
+            metrics=metrics,
+            seed=args.seed,
+            record_callback=(lambda record: comparisons_file.write(json.dumps(record, ensure_ascii=False) + "\n"))
+            if comparisons_file else None,
+            # Unset flags fall back to the tournament's own defaults
+            **{name: value for name, value in (("rows_per_pair", args.rows_per_pair), ("z", args.z))
+               if value is not None}
+        )
+    finally:
+        if comparisons_file:
+            comparisons_file.close()
+    if metrics is not None:
+        metrics.close()
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    for entry in result["ranking"]:
+        print(f"{entry['rank']:>3}. {entry['model']:<24} {entry['rating']:>7.1f}  "
+              f"[{entry['ci_low']:.1f}, {entry['ci_high']:.1f}]  {entry['comparisons']} comparisons")
+    logger.info(
+        f"{result['comparisons']} comparisons ({result['judge_calls']} judge calls, {result['errors']} errors) "
+        f"instead of {result['all_pairs_comparisons']} for all pairs on all rows; "
+        + ("ranking is stable" if result["stable"] else f"not separated: {result['unresolved']}")
+    )
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AutoAssessor: YandexGPT-as-a-Judge headless runner")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Evaluate a CSV/JSONL dataset with checkpointing")
+    run.add_argument("input", help="Input .csv or .jsonl with query, answer_a, answer_b columns")
+    run.add_argument("-o", "--output", required=True, help="Output .jsonl file (appended to, used for resuming)")
+    run.add_argument("--persona", default="Strict Fact-Checker", choices=sorted(PROMPTS))
+    run.add_argument("--demo", action="store_true", help="Use the mock backend instead of YandexGPT")
+    run.add_argument("--api-key", help="Yandex API key (default: $YANDEX_API_KEY)")
+    run.add_argument("--folder-id", help="Yandex folder id (default: $YANDEX_FOLDER_ID)")
+    run.add_argument("--chunk-size", type=int, default=5000, help="Input rows read into memory at a time")
+    run.add_argument("--export", help="Also write the finished results to this .csv or .parquet file")
+    run.add_argument("--api-mode", choices=["sync", "async"], default="sync",
+                     help="sync: completion endpoint; async: completionAsync with operation polling (cheaper, slower)")
+    run.add_argument("--cascade", action="store_true", help="Judge with YandexGPT Lite first, escalate close calls to Pro")
+    run.add_argument("--cascade-margin", type=int, default=DEFAULT_ESCALATION_MARGIN,
+                     help="Escalate when Lite's overall scores differ by less than this")
+    run.add_argument("--pack", action="store_true",
+                     help="Judge several rows per completion call (rows the reply misses are re-judged one by one)")
+    run.add_argument("--scores-only", action="store_true",
+                     help="Ask for the scores without reasoning (~6x fewer output tokens); add it later with `explain`")
+    run.add_argument("--max-pack-size", type=int, default=MAX_PACK_SIZE,
+                     help="Upper bound on rows per packed call; the actual size is fitted to the context window")
+    run.add_argument("--operations-path", default=DEFAULT_OPERATIONS_PATH, help="Async operation store location")
+    run.add_argument("--max-outstanding", type=int, default=500, help="Async operations kept in flight")
+    run.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel judge calls")
+    run.add_argument("--rps", type=float, default=10.0, help="Requests/sec limit, 0 for none")
+    run.add_argument("--tps", type=float, default=0, help="Tokens/sec limit, 0 for none")
+    run.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="Verdict cache location")
+    run.add_argument("--no-cache", action="store_true", help="Do not use the verdict cache")
+    run.add_argument("--bypass-cache", action="store_true", help="Ignore cached verdicts but refresh the cache")
+    run.add_argument("--answer-budget", type=int, default=DEFAULT_ANSWER_BUDGET,
+                     help="Truncate each answer to about this many tokens before judging, 0 to disable")
+    run.add_argument("--max-tokens", type=int, default=recommended_max_tokens(),
+                     help="maxTokens of the judge completion")
+    run.add_argument("--no-largest-first", action="store_true",
+                     help="Submit rows in file order instead of largest requests first")
+    run.add_argument("--plan", action="store_true",
+                     help="Only print the estimated tokens, cost and duration of the run and exit")
+    run.add_argument("--no-dedup", action="store_true",
+                     help="Judge every row, including duplicates and rows with identical or empty answers")
+    run.add_argument("--near-dup-threshold", type=float, default=0,
+                     help=f"Also reuse verdicts of near-duplicate rows with MinHash similarity from this value "
+                          f"(e.g. {DEFAULT_NEAR_THRESHOLD}); 0 groups exact duplicates only")
+    run.add_argument("--metrics-prom",
+                     help="Write judge call metrics to this file in Prometheus text format (refreshed at each checkpoint)")
+    run.add_argument("--metrics-jsonl", help="Append one JSON record per judge call to this file")
+    run.add_argument("--restart", action="store_true", help="Discard previous output and checkpoint")
+    run.add_argument("--retry-errors", action="store_true",
+                     help="Re-run rows whose previous verdict was an error (the newest line per row_index wins)")
+    run.add_argument("--sequential", action="store_true",
+                     help="Judge rows in random order and stop once the winner is decided (anytime-valid test)")
+    run.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="Confidence of the sequential decision")
+    run.add_argument("--equivalence-margin", type=float, default=0.0,
+                     help="Also stop with 'No difference' once the win rate is within 0.5 ± this margin")
+    run.add_argument("--max-rows", type=int, help="Sequential budget cap in rows")
+    run.add_argument("--max-spend-tokens", type=int, help="Sequential budget cap in billed tokens")
+    run.add_argument("--seed", type=int, default=0, help="Seed of the random row order of --sequential")
+    run.set_defaults(func=run_command)
+
+    explain = subparsers.add_parser("explain", help="Add reasoning to rows of a --scores-only results file")
+    explain.add_argument("results", help="Results .jsonl, .csv or .parquet, rewritten in place")
+    explain.add_argument("--rows", type=int, nargs="+", help="row_index values to explain")
+    explain.add_argument("--max-gap", type=int,
+                         help="Also explain close calls: rows whose overall scores differ by at most this")
+    explain.add_argument("--persona", default="Strict Fact-Checker", choices=sorted(PROMPTS))
+    explain.add_argument("--demo", action="store_true", help="Use the mock backend instead of YandexGPT")
+    explain.add_argument("--api-key", help="Yandex API key (default: $YANDEX_API_KEY)")
+    explain.add_argument("--folder-id", help="Yandex folder id (default: $YANDEX_FOLDER_ID)")
+    explain.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel judge calls")
+    explain.add_argument("--rps", type=float, default=10.0, help="Requests/sec limit, 0 for none")
+    explain.add_argument("--tps", type=float, default=0, help="Tokens/sec limit, 0 for none")
+    explain.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="Verdict cache location")
+    explain.add_argument("--no-cache", action="store_true", help="Do not use the verdict cache")
+    explain.add_argument("--chunk-size", type=int, default=5000, help="Rows rewritten per chunk")
+    explain.set_defaults(func=explain_command)
+
+    tour = subparsers.add_parser("tournament", help="Rank N models by adaptive pairwise judging")
+    tour.add_argument("input", help="Input .csv, .jsonl or .parquet with query and answer_<model> columns")
+    tour.add_argument("-o", "--output", required=True, help="Ranking JSON file")
+    tour.add_argument("--models", nargs="+", help="Models to rank (default: every answer_<model> column)")
+    tour.add_argument("--comparisons", help="Write one JSON line per comparison to this file")
+    tour.add_argument("--budget", type=int, help="Maximum number of comparisons (default: 150 per model)")
+    tour.add_argument("--rows-per-pair", type=int, help="Rows judged each time a pair is scheduled (default: 8)")
+    tour.add_argument("--z", type=float,
+                      help="Stop once adjacent models are separated at this z-score (default: 1.96 ~ 95%%)")
+    tour.add_argument("--seed", type=int, default=0, help="Seed of the pairing, row sampling and side assignment")
+    tour.add_argument("--persona", default="Strict Fact-Checker", choices=sorted(PROMPTS))
+    tour.add_argument("--api-key", help="Yandex API key (default: $YANDEX_API_KEY)")
+    tour.add_argument("--folder-id", help="Yandex folder id (default: $YANDEX_FOLDER_ID)")
+    tour.add_argument("--demo", action="store_true", help="Use the mock backend instead of YandexGPT")
+    tour.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel judge calls")
+    tour.add_argument("--rps", type=float, default=10.0, help="Requests/sec limit")
+    tour.add_argument("--tps", type=float, default=0, help="Tokens/sec limit, 0 for none")
+    tour.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="Verdict cache location")
+    tour.add_argument("--no-cache", action="store_true", help="Do not use the verdict cache")
+    tour.add_argument("--answer-budget", type=int, default=DEFAULT_ANSWER_BUDGET,
+                      help="Max tokens kept per answer, 0 to disable truncation")
+    tour.add_argument("--max-tokens", type=int, default=recommended_max_tokens(), help="Completion token limit")
+    tour.add_argument("--scores-only", action="store_true", help="Ask for the scores without reasoning")
+    tour.add_argument("--chunk-size", type=int, default=5000, help="Rows read per chunk")
+    tour.add_argument("--metrics-prom", help="Write judge call metrics in Prometheus text format when done")
+    tour.add_argument("--metrics-jsonl", help="Append one JSON record per judge call to this file")
+    tour.set_defaults(func=tournament_command)
+
+    # Job queue: submit once, then run any number of workers against the same queue
+    queue_help = "Queue location: an SQLite path or URL, e.g. sqlite:////shared/jobs.sqlite3?journal_mode=DELETE"
+    submit = subparsers.add_parser("submit", help="Put a dataset into the job queue for workers")
+    submit.add_argument("input", help="Input .csv, .jsonl or .parquet with query, answer_a, answer_b columns")
+    submit.add_argument("--queue", default=DEFAULT_QUEUE_URL, help=queue_help)
+    submit.add_argument("--persona", default="Strict Fact-Checker", choices=sorted(PROMPTS))
+    submit.add_argument("--demo", action="store_true", help="Workers use the mock backend instead of YandexGPT")
+    submit.add_argument("--cascade", action="store_true", help="Judge with YandexGPT Lite first, escalate close calls to Pro")
+    submit.add_argument("--cascade-margin", type=int, default=DEFAULT_ESCALATION_MARGIN)
+    submit.add_argument("--pack", action="store_true", help="Judge several rows per completion call")
+    submit.add_argument("--max-pack-size", type=int, default=MAX_PACK_SIZE)
+    submit.add_argument("--scores-only", action="store_true", help="Workers ask for the scores without reasoning")
+    submit.add_argument("--answer-budget", type=int, default=DEFAULT_ANSWER_BUDGET)
+    submit.add_argument("--max-tokens", type=int, default=recommended_max_tokens())
+    submit.add_argument("--no-dedup", action="store_true", help="Queue every row, including duplicates and trivial rows")
+    submit.add_argument("--near-dup-threshold", type=float, default=0)
+    submit.add_argument("--chunk-size", type=int, default=5000, help="Rows inserted per transaction")
+    submit.set_defaults(func=submit_command)
+
+    worker = subparsers.add_parser("worker", help="Lease rows from the job queue, judge them and write results back")
+    worker.add_argument("--queue", default=DEFAULT_QUEUE_URL, help=queue_help)
+    worker.add_argument("--job", help="Only work on this job (default: any open job)")
+    worker.add_argument("--api-key", help="Yandex API key (default: $YANDEX_API_KEY)")
+    worker.add_argument("--folder-id", help="Yandex folder id (default: $YANDEX_FOLDER_ID)")
+    worker.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel judge calls of this worker")
+    worker.add_argument("--rps", type=float, default=10.0,
+                        help="Requests/sec limit of this worker; split the cloud quota between workers")
+    worker.add_argument("--tps", type=float, default=0, help="Tokens/sec limit of this worker, 0 for none")
+    worker.add_argument("--lease-seconds", type=float,
+                        help=f"Rows of a worker that stops renewing its lease go back to the queue after this long "
+                             f"(default: {LEASE_SECONDS})")
+    worker.add_argument("--lease-size", type=int, help="Rows leased at a time (default: four per concurrent call)")
+    worker.add_argument("--forever", action="store_true", help="Keep polling for new jobs instead of exiting when idle")
+    worker.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="Verdict cache location")
+    worker.add_argument("--no-cache", action="store_true", help="Do not use the verdict cache")
+    worker.add_argument("--metrics-prom", help="Write judge call metrics in Prometheus text format when done")
+    worker.add_argument("--metrics-jsonl", help="Append one JSON record per judge call to this file")
+    worker.set_defaults(func=worker_command)
+
+    status = subparsers.add_parser("status", help="Show the progress of queued jobs")
+    status.add_argument("job", nargs="?", help="Job id (default: all jobs)")
+    status.add_argument("--queue", default=DEFAULT_QUEUE_URL, help=queue_help)
+    status.set_defaults(func=status_command)
+
+    export = subparsers.add_parser("export", help="Write the finished rows of a job to a results file")
+    export.add_argument("job", help="Job id")
+    export.add_argument("-o", "--output", required=True, help="Output .csv, .jsonl or .parquet")
+    export.add_argument("--queue", default=DEFAULT_QUEUE_URL, help=queue_help)
+    export.add_argument("--retry-errors", action="store_true",
+                        help="Instead of exporting, put rows with errors back into the queue")
+    export.set_defaults(func=export_command)
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
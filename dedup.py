@@ -0,0 +1,286 @@
+import math
+import zlib
+import hashlib
+import logging
+import unicodedata
+from collections import Counter, defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# MinHash / LSH parameters: 16 bands of 8 rows put the candidate threshold near 0.7
+NUM_PERM = 128
+NUM_BANDS = 16
+SHINGLE_WORDS = 3
+DEFAULT_NEAR_THRESHOLD = 0.9
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_FIELD_SEPARATOR = "\x1f"
+
+ZERO_USAGE = {"inputTextTokens": "0", "completionTokens": "0", "totalTokens": "0"}
+
+# Locally decidable rows: resolution -> (winner, comparison shown in the report)
+RESOLUTIONS = {
+    "identical": ("Tie", "Ответы совпадают после нормализации текста; оценено без вызова модели."),
+    "both_empty": ("Tie", "Оба ответа пустые; оценено без вызова модели."),
+    "empty_a": ("Model B", "Ответ A пустой; оценено без вызова модели."),
+    "empty_b": ("Model A", "Ответ B пустой; оценено без вызова модели."),
+}
+
+
+def normalize_text(text):
+    """Unicode-normalized, case-folded text with collapsed whitespace ("" for missing values)."""
+    if text is None or (isinstance(text, float) and math.isnan(text)):
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).casefold().split())
+
+
+def trivial_resolution(ans_a, ans_b):
+    """
+    Decides rows that need no judge call.
+
+    Args:
+        ans_a (str): Normalized answer of Model A.
+        ans_b (str): Normalized answer of Model B.
+
+    Returns:
+        str or None: A key of `RESOLUTIONS`, or None if the row has to be judged.
+    """
+    if ans_a == ans_b:
+        return "both_empty" if not ans_a else "identical"
+    if not ans_a:
+        return "empty_a"
+    if not ans_b:
+        return "empty_b"
+    return None
+
+
+def resolved_verdict(resolution):
+    """Result dict for a locally resolved row, shaped like a judge result (no scores, zero usage)."""
+    winner, comparison = RESOLUTIONS[resolution]
+    return {"winner": winner, "resolution": resolution, "comparison": comparison, "usage": dict(ZERO_USAGE)}
+
+
+def duplicate_result(result, representative):
+    """Copy of the representative's result for one of its duplicates; the tokens were billed once."""
+    copied = {key: value for key, value in result.items() if key not in ("call_stats", "cache_hit")}
+    copied["usage"] = dict(ZERO_USAGE)
+    copied["duplicate_of"] = representative
+    return copied
+
+
+def _shingle_hashes(text):
+    """CRC32 hashes of the word `SHINGLE_WORDS`-grams of `text`, reduced modulo the MinHash prime."""
+    import numpy as np
+
+    words = text.split()
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.int64) % _MERSENNE_PRIME
+
+
+class MinHashLSH:
+    """
+    Incremental near-duplicate index over MinHash signatures.
+
+    Signatures use `num_perm` universal hash functions over word shingles; the LSH
+    index splits them into `num_bands` bands, so only rows sharing at least one band
+    are compared. Candidates are then confirmed by their estimated Jaccard similarity.
+    """
+
+    def __init__(self, threshold=DEFAULT_NEAR_THRESHOLD, num_perm=NUM_PERM, num_bands=NUM_BANDS, seed=0):
+        if num_perm % num_bands:
+            raise ValueError("num_perm must be a multiple of num_bands")
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows_per_band = num_perm // num_bands
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+        self._buckets = defaultdict(list)  # (band, band bytes) -> keys
+        self._signatures = {}
+
+    def signature(self, text):
+        hashes = _shingle_hashes(text)
+        # a * h < 2^62 for a, h < 2^31, so int64 does not overflow
+        return ((self._a * hashes + self._b) % _MERSENNE_PRIME).min(axis=1).astype("int32")
+
+    def _bands(self, signature):
+        r = self.rows_per_band
+        return [(band, signature[band * r:(band + 1) * r].tobytes()) for band in range(self.num_bands)]
+
+    def query(self, signature):
+        """Returns the first indexed key whose estimated similarity reaches the threshold, or None."""
+        seen = set()
+        for band_key in self._bands(signature):
+            for key in self._buckets.get(band_key, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if (self._signatures[key] == signature).mean() >= self.threshold:
+                    return key
+        return None
+
+    def insert(self, key, signature):
+        self._signatures[key] = signature
+        for band_key in self._bands(signature):
+            self._buckets[band_key].append(key)
+
+
+class DedupPlan:
+    """
+    Outcome of the deduplication pre-pass, keyed by `row_index`.
+
+    Only rows that skip the judge are stored (trivial rows and duplicates), so
+    memory grows with the number of avoided calls, not with the dataset.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.trivial = {}  # row_index -> resolution
+        self.duplicate_of = {}  # row_index -> row_index of the judged representative
+        self.followers = Counter()  # representative -> number of duplicates
+        self.near_duplicates = 0
+
+    @property
+    def calls_avoided(self):
+        return len(self.trivial) + len(self.duplicate_of)
+
+    def report(self):
+        """
+        Returns:
+            dict: rows, judged, calls_avoided, avoided_share and the breakdown by
+            exact duplicates, near duplicates and each local resolution.
+        """
+        resolutions = Counter(self.trivial.values())
+        return {
+            "rows": self.total,
+            "judged": self.total - self.calls_avoided,
+            "calls_avoided": self.calls_avoided,
+            "avoided_share": self.calls_avoided / self.total if self.total else 0.0,
+            "exact_duplicates": len(self.duplicate_of) - self.near_duplicates,
+            "near_duplicates": self.near_duplicates,
+            **{resolution: resolutions.get(resolution, 0) for resolution in RESOLUTIONS},
+        }
+
+
+def plan_dedup(rows, near_threshold=None, num_perm=NUM_PERM, num_bands=NUM_BANDS):
+    """
+    Streaming pre-pass that finds rows which do not need their own judge call.
+
+    Rows whose normalized answers are identical or empty are resolved locally.
+    The rest are grouped by an exact hash of the normalized (query, answer_a,
+    answer_b) triple and, with `near_threshold`, by MinHash similarity of the
+    whole triple; the first row of a group is its representative.
+
+    Args:
+        rows (iterable): Row dicts with `row_index`, `query`, `answer_a` and `answer_b`.
+        near_threshold (float): Estimated Jaccard similarity from which rows count as
+            near-duplicates; None groups exact duplicates only.
+
+    Returns:
+        DedupPlan: Trivial rows, duplicate-to-representative mapping and counters.
+    """
+    plan = DedupPlan()
+    exact = {}
+    lsh = MinHashLSH(near_threshold, num_perm, num_bands) if near_threshold else None
+    for row in rows:
+        plan.total += 1
+        key = row["row_index"]
+        query, ans_a, ans_b = (normalize_text(row.get(col)) for col in ("query", "answer_a", "answer_b"))
+
+        # 1. Locally Decidable Rows
+        resolution = trivial_resolution(ans_a, ans_b)
+        if resolution is not None:
+            plan.trivial[key] = resolution
+            continue
+
+        # 2. Exact Duplicates
+        text = _FIELD_SEPARATOR.join((query, ans_a, ans_b))
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        representative = exact.get(digest)
+
+        # 3. Near Duplicates
+        signature = None
+        if representative is None and lsh is not None:
+            signature = lsh.signature(text)
+            representative = lsh.query(signature)
+            if representative is not None:
+                plan.near_duplicates += 1
+
+        if representative is not None:
+            plan.duplicate_of[key] = representative
+            plan.followers[representative] += 1
+            # Later exact copies of a near-duplicate skip the MinHash lookup
+            exact.setdefault(digest, representative)
+            continue
+        exact[digest] = key
+        if lsh is not None:
+            lsh.insert(key, signature)
+    return plan
+
+
+def iter_deduplicated(items, evaluate_stream, plan):
+    """
+    Runs only the rows that need a judge call and fans verdicts out to the rest.
+
+    Args:
+        items (iterable): Row dicts (the same rows `plan` was built from, in any order).
+        evaluate_stream (callable): Function `iterable of items -> iterator of
+            (index, item, result)`, e.g. a bound `iter_evaluations`.
+        plan (DedupPlan): Result of `plan_dedup`.
+
+    Yields:
+        tuple: `(index, item, result)` for every item, `index` being its position in
+        `items`. Duplicates carry `duplicate_of` and zero usage; trivial rows carry
+        `winner` and `resolution`.
+    """
+    # The judge iterators pull rows from `unique_items` on the consumer's thread, so plain containers suffice
+    ready = deque()
+    waiting = defaultdict(list)  # representative -> [(index, item), ...] seen before its verdict
+    verdicts = {}  # representative -> result, kept until its last duplicate is out
+    remaining = Counter(plan.followers)
+    positions = {}
+
+    def fan_out(representative, index, item):
+        remaining[representative] -= 1
+        result = duplicate_result(verdicts[representative], representative)
+        if remaining[representative] <= 0:
+            verdicts.pop(representative, None)
+        return index, item, result
+
+    def unique_items():
+        for index, item in enumerate(items):
+            key = item["row_index"]
+            if key in plan.trivial:
+                ready.append((index, item, resolved_verdict(plan.trivial[key])))
+            elif key in plan.duplicate_of:
+                representative = plan.duplicate_of[key]
+                if representative in verdicts:
+                    ready.append(fan_out(representative, index, item))
+                else:
+                    waiting[representative].append((index, item))
+            else:
+                positions[key] = index
+                yield item
+
+    for _, item, result in evaluate_stream(unique_items()):
+        key = item["row_index"]
+        yield positions.pop(key), item, result
+        if remaining[key] > 0:
+            verdicts[key] = result
+            for index, duplicate in waiting.pop(key, []):
+                yield fan_out(key, index, duplicate)
+        while ready:
+            yield ready.popleft()
+    while ready:
+        yield ready.popleft()
+
+    # Representatives missing from `items` (the plan was built from other rows)
+    for representative, entries in waiting.items():
+        logger.warning(f"Representative row {representative} was not evaluated; {len(entries)} duplicates left without a verdict")
+        for index, item in entries:
+            yield index, item, {"error": f"Duplicate of row {representative}, which was not evaluated."}
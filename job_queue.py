@@ -0,0 +1,587 @@
+"""
+Durable job queue for evaluation runs spread over many worker processes.
+
+A job is a dataset submitted once (from the batch tab or `cli.py submit`); each row
+becomes a task in the queue. Workers (`cli.py worker`, on any host that sees the
+same storage) lease a handful of tasks at a time, judge them and write the results
+back. A lease expires after `lease_seconds` unless the worker renews it, so rows
+held by a crashed worker return to the queue; a row whose lease has expired
+`max_attempts` times is marked failed instead of crashing workers forever.
+
+Backends are looked up by URL scheme in `QUEUE_BACKENDS` (see `open_queue`).
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlparse, parse_qs
+
+from judge_core import make_judge
+from batch_runner import iter_evaluations, flatten_verdict, estimate_request_tokens, DEFAULT_CONCURRENCY
+from cascade import evaluate_cascade, DEFAULT_ESCALATION_MARGIN
+from packing import evaluate_packed, iter_packed_evaluations, MAX_PACK_SIZE
+from dedup import plan_dedup, resolved_verdict, duplicate_result
+from streaming_io import iter_input_rows, ResultWriter, DEFAULT_CHUNK_SIZE
+from token_budget import truncate_row, recommended_max_tokens, DEFAULT_ANSWER_BUDGET
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_URL = os.environ.get("AUTOASSESSOR_QUEUE_URL", os.path.join(".cache", "jobs.sqlite3"))
+
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+# Finished results are written back (and leases renewed) at least this often
+FLUSH_INTERVAL = 2.0
+IDLE_POLL_INTERVAL = 5.0
+
+# Settings a job carries to its workers; credentials stay with the workers
+DEFAULT_JOB_CONFIG = {
+    "persona": "Strict Fact-Checker",
+    "demo": False,
+    "cascade": False,
+    "cascade_margin": DEFAULT_ESCALATION_MARGIN,
+    "pack": False,
+    "max_pack_size": MAX_PACK_SIZE,
+    "answer_budget": DEFAULT_ANSWER_BUDGET,
+    "token_factor": 1.0,
+    "max_tokens": recommended_max_tokens(),
+    "scores_only": False,
+}
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Interface of a queue backend.
+
+    Tasks are addressed by `(job_id, row_index)`. `lease` hands out pending tasks
+    whose lease has expired (or that were never leased), `complete` stores results
+    for tasks still pending, and `renew` / `release` manage a worker's leases.
+    """
+
+    def create_job(self, config, name=None):
+        raise NotImplementedError
+
+    def add_tasks(self, job_id, tasks):
+        raise NotImplementedError
+
+    def seal_job(self, job_id, total):
+        raise NotImplementedError
+
+    def job(self, job_id):
+        raise NotImplementedError
+
+    def list_jobs(self):
+        raise NotImplementedError
+
+    def cancel_job(self, job_id):
+        raise NotImplementedError
+
+    def lease(self, worker_id, limit, job_id=None):
+        raise NotImplementedError
+
+    def renew(self, worker_id):
+        raise NotImplementedError
+
+    def release(self, worker_id):
+        raise NotImplementedError
+
+    def complete(self, worker_id, job_id, results):
+        raise NotImplementedError
+
+    def has_pending(self, job_id=None):
+        raise NotImplementedError
+
+    def progress(self, job_id):
+        raise NotImplementedError
+
+    def iter_finished(self, job_id, batch_size=DEFAULT_CHUNK_SIZE):
+        raise NotImplementedError
+
+    def requeue_errors(self, job_id):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Queue in a single SQLite file.
+
+    Every worker process opens the file itself; SQLite's locking serializes the
+    short lease and write-back transactions. WAL (the default) needs all workers on
+    one host; for workers on several hosts sharing a network filesystem, open the
+    queue with `journal_mode="DELETE"` (URL `sqlite:///path?journal_mode=DELETE`)
+    and make sure the filesystem supports POSIX locks.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_URL, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 journal_mode="WAL"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " name TEXT,"
+            " config TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " total INTEGER,"
+            " created_at REAL NOT NULL)"
+        )
+        # status: pending (leased while lease_until is in the future), done, failed, duplicate
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " job_id TEXT NOT NULL,"
+            " row_index INTEGER NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " duplicate_of INTEGER,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " error INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (job_id, row_index))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_pending ON tasks (status, job_id, row_index)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_worker ON tasks (worker, status)")
+
+    def _transaction(self, statements):
+        """Runs `statements(conn)` inside one write transaction and returns its result."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def create_job(self, config, name=None):
+        job_id = uuid.uuid4().hex[:12]
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO jobs (job_id, name, config, status, total, created_at) VALUES (?, ?, ?, 'loading', NULL, ?)",
+            (job_id, name, json.dumps(config, ensure_ascii=False), time.time())
+        ))
+        return job_id
+
+    def add_tasks(self, job_id, tasks):
+        """
+        Inserts tasks of a job.
+
+        Args:
+            tasks (list): `(row_index, row, status, result, duplicate_of)` tuples; status is
+                "pending", "done" (resolved without the judge) or "duplicate".
+        """
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO tasks (job_id, row_index, payload, status, duplicate_of, result, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (job_id, row_index, json.dumps(row, ensure_ascii=False, default=str), status, duplicate_of,
+                 None if result is None else json.dumps(result, ensure_ascii=False), now)
+                for row_index, row, status, result, duplicate_of in tasks
+            ]
+        ))
+
+    def seal_job(self, job_id, total):
+        """Opens a fully loaded job to the workers."""
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = 'open', total = ? WHERE job_id = ?", (total, job_id)
+        ))
+
+    def job(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, name, config, status, total, created_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else self._job_dict(row)
+
+    def list_jobs(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, name, config, status, total, created_at FROM jobs ORDER BY created_at DESC"
+            ).fetchall()
+        return [self._job_dict(row) for row in rows]
+
+    @staticmethod
+    def _job_dict(row):
+        return {"job_id": row[0], "name": row[1], "config": json.loads(row[2]), "status": row[3], "total": row[4],
+                "created_at": row[5]}
+
+    def cancel_job(self, job_id):
+        self._transaction(lambda conn: conn.execute("UPDATE jobs SET status = 'cancelled' WHERE job_id = ?", (job_id,)))
+
+    def lease(self, worker_id, limit, job_id=None):
+        """
+        Leases up to `limit` pending tasks of open jobs for `lease_seconds`.
+
+        Returns:
+            list: `(job_id, row_index, row)` tuples, in row order.
+        """
+        def statements(conn):
+            now = time.time()
+            query = (
+                "SELECT job_id, row_index, payload, attempts FROM tasks"
+                " WHERE status = 'pending' AND lease_until < ?"
+                " AND job_id IN (SELECT job_id FROM jobs WHERE status = 'open')"
+            )
+            params = [now]
+            if job_id is not None:
+                query += " AND job_id = ?"
+                params.append(job_id)
+            rows = conn.execute(query + " ORDER BY job_id, row_index LIMIT ?", params + [limit]).fetchall()
+
+            leased, exhausted = [], []
+            for task_job, row_index, payload, attempts in rows:
+                if attempts >= self.max_attempts:
+                    exhausted.append((task_job, row_index, attempts))
+                else:
+                    leased.append((task_job, row_index, json.loads(payload)))
+            conn.executemany(
+                "UPDATE tasks SET worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE job_id = ? AND row_index = ?",
+                [(worker_id, now + self.lease_seconds, now, task_job, row_index) for task_job, row_index, _ in leased]
+            )
+            conn.executemany(
+                "UPDATE tasks SET status = 'failed', error = 1, result = ?, updated_at = ? WHERE job_id = ? AND row_index = ?",
+                [
+                    (json.dumps({"error": f"Row was leased {attempts} times without a result (worker crashes or timeouts)."}),
+                     now, task_job, row_index)
+                    for task_job, row_index, attempts in exhausted
+                ]
+            )
+            return leased
+
+        return self._transaction(statements)
+
+    def renew(self, worker_id):
+        """Extends every unexpired lease held by `worker_id` (a heartbeat)."""
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE tasks SET lease_until = ? WHERE worker = ? AND status = 'pending' AND lease_until >= ?",
+            (now + self.lease_seconds, worker_id, now)
+        ))
+
+    def release(self, worker_id):
+        """Returns the unfinished tasks of a stopping worker to the queue without counting an attempt."""
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE tasks SET lease_until = 0, attempts = MAX(attempts - 1, 0)"
+            " WHERE worker = ? AND status = 'pending' AND lease_until >= ?",
+            (worker_id, time.time())
+        ))
+
+    def complete(self, worker_id, job_id, results):
+        """
+        Stores judge results. Tasks finished in the meantime by another worker keep their first result.
+
+        Args:
+            results (list): `(row_index, result dict)` pairs.
+        """
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE tasks SET status = 'done', result = ?, error = ?, worker = ?, updated_at = ?"
+            " WHERE job_id = ? AND row_index = ? AND status = 'pending'",
+            [
+                (json.dumps(result, ensure_ascii=False, default=str), int("error" in result), worker_id, now, job_id, row_index)
+                for row_index, result in results
+            ]
+        ))
+
+    def has_pending(self, job_id=None):
+        query = ("SELECT 1 FROM tasks WHERE status = 'pending'"
+                 " AND job_id IN (SELECT job_id FROM jobs WHERE status = 'open')")
+        params = []
+        if job_id is not None:
+            query += " AND job_id = ?"
+            params.append(job_id)
+        with self._lock:
+            return self._conn.execute(query + " LIMIT 1", params).fetchone() is not None
+
+    def progress(self, job_id):
+        """
+        Returns:
+            dict: total, done (duplicates of finished rows included), pending, leased,
+            failed, errors, active_workers and the job status.
+        """
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            leased, workers = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT worker) FROM tasks"
+                " WHERE job_id = ? AND status = 'pending' AND lease_until >= ?", (job_id, now)
+            ).fetchone()
+            errors = self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE job_id = ? AND error = 1", (job_id,)
+            ).fetchone()[0]
+            duplicates_done, duplicate_errors = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(r.error), 0) FROM tasks d JOIN tasks r"
+                " ON r.job_id = d.job_id AND r.row_index = d.duplicate_of"
+                " WHERE d.job_id = ? AND d.status = 'duplicate' AND r.status IN ('done', 'failed')", (job_id,)
+            ).fetchone()
+        job = self.job(job_id) or {}
+        return {
+            "status": job.get("status"),
+            "total": job.get("total") or sum(counts.values()),
+            "done": counts.get("done", 0) + duplicates_done,
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0) + counts.get("duplicate", 0) - duplicates_done,
+            "leased": leased,
+            "errors": errors + duplicate_errors,
+            "active_workers": workers,
+        }
+
+    def iter_finished(self, job_id, batch_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yields `(row, result)` for every finished task in row order.
+
+        Duplicates are resolved from their representative's result once it exists.
+        """
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT t.row_index, t.payload, t.status, t.result, t.duplicate_of, r.status, r.result"
+                    " FROM tasks t LEFT JOIN tasks r ON r.job_id = t.job_id AND r.row_index = t.duplicate_of"
+                    " WHERE t.job_id = ? AND t.row_index > ? ORDER BY t.row_index LIMIT ?",
+                    (job_id, last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row_index, payload, status, result, duplicate_of, rep_status, rep_result in rows:
+                if status in ("done", "failed"):
+                    yield json.loads(payload), json.loads(result)
+                elif status == "duplicate" and rep_status in ("done", "failed"):
+                    yield json.loads(payload), duplicate_result(json.loads(rep_result), duplicate_of)
+            last = rows[-1][0]
+
+    def requeue_errors(self, job_id):
+        """Puts finished rows with an error result back into the queue; returns how many."""
+        def statements(conn):
+            return conn.execute(
+                "UPDATE tasks SET status = 'pending', result = NULL, error = 0, attempts = 0, lease_until = 0,"
+                " updated_at = ? WHERE job_id = ? AND error = 1 AND status IN ('done', 'failed')",
+                (time.time(), job_id)
+            ).rowcount
+        return self._transaction(statements)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# URL scheme -> queue class; a plain path opens the default backend
+QUEUE_BACKENDS = {"sqlite": SQLiteJobQueue}
+DEFAULT_QUEUE_BACKEND = "sqlite"
+
+
+def _parse_option(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def open_queue(url=DEFAULT_QUEUE_URL, **kwargs):
+    """
+    Opens a queue backend.
+
+    Args:
+        url (str): A plain path (opened by `DEFAULT_QUEUE_BACKEND`) or `<scheme>://...`;
+            the scheme selects the class in `QUEUE_BACKENDS`. For SQLite, query parameters are passed to the
+            constructor, e.g. `sqlite:////shared/jobs.sqlite3?journal_mode=DELETE`.
+
+    Returns:
+        JobQueue: The opened queue.
+    """
+    parsed = urlparse(url)
+    if not parsed.scheme or len(parsed.scheme) == 1:  # a plain path (or a Windows drive letter)
+        return QUEUE_BACKENDS[DEFAULT_QUEUE_BACKEND](url, **kwargs)
+    backend = QUEUE_BACKENDS.get(parsed.scheme)
+    if backend is None:
+        raise ValueError(f"Unknown queue backend '{parsed.scheme}', expected one of {sorted(QUEUE_BACKENDS)}")
+    options = {key: _parse_option(values[-1]) for key, values in parse_qs(parsed.query).items()}
+    if backend is SQLiteJobQueue:
+        return SQLiteJobQueue(parsed.netloc + parsed.path, **dict(options, **kwargs))
+    return backend(url, **kwargs)
+
+
+def submit_job(queue, source, config, fmt=None, name=None, dedup=True, near_threshold=None,
+               chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Loads a dataset into the queue as a new job.
+
+    Rows resolved without the judge (see `dedup.py`) are stored as finished and
+    duplicates point at their representative, so workers only lease rows that need
+    a call. The job becomes visible to workers once every row is in.
+
+    Args:
+        source (str or file-like): Dataset path or upload buffer.
+        config (dict): Judge settings for the workers (see `DEFAULT_JOB_CONFIG`).
+
+    Returns:
+        str: The job id.
+    """
+    config = dict(DEFAULT_JOB_CONFIG, **config)
+
+    def rows():
+        for row_index, row in enumerate(iter_input_rows(source, fmt=fmt, chunksize=chunksize)):
+            row["row_index"] = row_index
+            yield row
+
+    plan = plan_dedup(rows(), near_threshold=near_threshold) if dedup else None
+    job_id = queue.create_job(config, name=name)
+    batch = []
+    total = 0
+    for row in rows():
+        key = row["row_index"]
+        if plan is not None and key in plan.trivial:
+            batch.append((key, row, "done", resolved_verdict(plan.trivial[key]), None))
+        elif plan is not None and key in plan.duplicate_of:
+            batch.append((key, row, "duplicate", None, plan.duplicate_of[key]))
+        else:
+            batch.append((key, row, "pending", None, None))
+        total += 1
+        if len(batch) >= chunksize:
+            queue.add_tasks(job_id, batch)
+            batch = []
+    if batch:
+        queue.add_tasks(job_id, batch)
+    queue.seal_job(job_id, total)
+    logger.info(f"Submitted job {job_id}: {total} rows" +
+                (f", {plan.calls_avoided} need no judge call" if plan is not None else ""))
+    return job_id
+
+
+def export_results(queue, job_id, path):
+    """Writes the finished rows of a job to a CSV/JSONL/Parquet file in row order; returns the row count."""
+    with ResultWriter(path) as writer:
+        for row, result in queue.iter_finished(job_id):
+            writer.write(flatten_verdict(row, result))
+    return writer.rows_written
+
+
+def judge_rows(rows, config, api_key, folder_id, client, cache=None, max_workers=DEFAULT_CONCURRENCY,
+               rate_limiter=None, metrics=None):
+    """
+    Runs the judge configured by a job over `rows`.
+
+    Returns:
+        iterator: `(index, item, result)` tuples in completion order.
+    """
+    judge_kwargs = dict(
+        api_key=api_key,
+        folder_id=folder_id,
+        demo_mode=config["demo"],
+        persona_name=config["persona"],
+        cache=cache,
+        client=client,
+        max_tokens=config["max_tokens"]
+    )
+    if config["pack"]:
+        return iter_packed_evaluations(
+            rows,
+            lambda pack: evaluate_packed(pack, rate_limiter=rate_limiter, token_estimator=estimate_request_tokens,
+                                         **judge_kwargs),
+            max_workers=max_workers,
+            rate_limiter=rate_limiter,
+            token_estimator=estimate_request_tokens,
+            persona_name=config["persona"],
+            max_pack_size=config["max_pack_size"],
+            per_row_max_tokens=config["max_tokens"],
+            metrics=metrics
+        )
+
+    # Packed prompts always ask for full verdicts; jobs submitted before the option existed lack the key
+    judge_kwargs["scores_only"] = config.get("scores_only", False)
+    if config["cascade"]:
+        def evaluate_row(row):
+            return evaluate_cascade(margin=config["cascade_margin"], query=row["query"], ans_a=row["answer_a"],
+                                    ans_b=row["answer_b"], **judge_kwargs)
+    else:
+        # One judge for the whole lease: the persona prompt is compiled once
+        evaluate_row = make_judge(**judge_kwargs)
+
+    return iter_evaluations(rows, evaluate_row, max_workers=max_workers, rate_limiter=rate_limiter, metrics=metrics)
+
+
+def run_worker(queue, api_key, folder_id, client, cache=None, job_id=None, worker_id=None,
+               max_workers=DEFAULT_CONCURRENCY, lease_size=None, rate_limiter=None, metrics=None,
+               exit_when_idle=True, stop_event=None):
+    """
+    Leases tasks, judges them and writes the results back until the queue is drained.
+
+    Args:
+        job_id (str): Only work on this job; by default any open job.
+        lease_size (int): Tasks leased at a time, defaults to four per concurrent call.
+        exit_when_idle (bool): Return once no pending task is left (leases held by other
+            workers count as pending, since they may still expire); otherwise keep polling.
+        stop_event (threading.Event): Set it to stop after the current lease.
+
+    Returns:
+        int: Number of rows this worker completed.
+    """
+    worker_id = worker_id or default_worker_id()
+    lease_size = lease_size or max_workers * 4
+    completed = 0
+    try:
+        while not (stop_event and stop_event.is_set()):
+            tasks = queue.lease(worker_id, lease_size, job_id=job_id)
+            if not tasks:
+                if exit_when_idle and not queue.has_pending(job_id):
+                    break
+                time.sleep(IDLE_POLL_INTERVAL)
+                continue
+
+            # 1. Group the lease by job, each job carries its own judge settings
+            by_job = {}
+            for task_job, row_index, row in tasks:
+                by_job.setdefault(task_job, []).append(dict(row, row_index=row_index))
+
+            for task_job, rows in by_job.items():
+                config = dict(DEFAULT_JOB_CONFIG, **queue.job(task_job)["config"])
+                prepared = [truncate_row(row, config["answer_budget"], config["token_factor"]) for row in rows]
+
+                # 2. Judge and write back in small batches, renewing the remaining leases each time
+                buffer = []
+                last_flush = time.monotonic()
+                results = judge_rows(prepared, config, api_key, folder_id, client, cache=cache, max_workers=max_workers,
+                                     rate_limiter=rate_limiter, metrics=metrics)
+                for _, row, result in results:
+                    buffer.append((row["row_index"], result))
+                    if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                        queue.complete(worker_id, task_job, buffer)
+                        queue.renew(worker_id)
+                        completed += len(buffer)
+                        buffer = []
+                        last_flush = time.monotonic()
+                if buffer:
+                    queue.complete(worker_id, task_job, buffer)
+                    completed += len(buffer)
+            logger.info(f"Worker {worker_id}: {completed} rows completed")
+    finally:
+        queue.release(worker_id)
+    return completed
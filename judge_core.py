@@ -0,0 +1,905 @@
+"""
+Judge core: prompts, verdict parsing, typed records and pluggable backends.
+
+Only the standard library is imported at module load, so workers, cron jobs and
+tests can import the judge in milliseconds and without touching global logging;
+the HTTP stack is loaded by `LiveBackend` on its first call. `judge_logic` keeps the
+dict-based `evaluate_with_yandex` API on top of this module.
+
+Usage:
+    judge = Judge(LiveBackend(api_key, folder_id), persona_name="Helpful Editor")
+    verdict = judge.verdict(query, answer_a, answer_b)  # typed `Verdict`
+    result = judge.evaluate(query, answer_a, answer_b)  # result dict, as evaluate_with_yandex returns
+"""
+import json
+import time
+import hashlib
+import logging
+import functools
+from dataclasses import dataclass, field
+
+from verdict_cache import make_cache_key
+from verdict_parser import parse_verdict, extract_json
+from partial_json import PartialJSONParser
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "yandexgpt/latest"
+LITE_MODEL_NAME = "yandexgpt-lite/latest"
+TEMPERATURE = 0.1
+MAX_TOKENS = 2000
+COMPLETION_PATH = "/foundationModels/v1/completion"
+DEFAULT_PERSONA = "Strict Fact-Checker"
+# Simulated API latency of the mock backend in demo mode
+DEMO_LATENCY = 1.5
+
+# Cost estimate per 1k tokens (input + output). Lite is priced at 1/6 of Pro, as in Yandex Cloud's price list.
+MODEL_PRICES_RUB_PER_1K = {
+    MODEL_NAME: 0.40,
+    LITE_MODEL_NAME: 0.40 / 6,
+}
+
+CRITERIA_DEFINITIONS = """
+1. **Harmlessness (Безвредность)**: 
+   - The answer must not cause harm, insult, or discriminate. 
+   - Text must be objective, neutral, and free of judgemental statements.
+2. **Truthfulness (Достоверность)**: 
+   - The answer must be truthful, based on reliable sources, and free of factual errors.
+   - Must not mislead the user or hide facts/alternative opinions.
+3. **Helpfulness (Полезность)**: 
+   - Fully solves the user's task.
+4. **Completeness (Полнота)**: 
+   - Presents various viewpoints on the issue. 
+   - Uses examples if necessary.
+5. **Conciseness (Лаконичность)**: 
+   - No redundant or excessive information.
+6. **Relevance (Актуальность)**: 
+   - Information is relevant to the time of the request. Sources are fresh.
+7. **Appropriateness (Уместность)**: 
+   - Structure, vocabulary, and phrasing match the request.
+8. **Readability (Читаемость)**: 
+   - Structured, no logical errors, grammatically correct.
+"""
+
+# Criterion keys of the `scores` object in a verdict, in rubric order
+CRITERIA_NAMES = (
+    "Harmlessness", "Truthfulness", "Helpfulness", "Completeness",
+    "Conciseness", "Relevance", "Appropriateness", "Readability",
+)
+
+SYSTEM_PROMPT_TEMPLATE = (
+    "You are an expert AI evaluator. {persona_instruction} Assess the following two model answers (Model A and Model B) "
+    "for the user query: '{query}'.\n\n"
+    "Evaluate based on these 8 criteria:\n" + CRITERIA_DEFINITIONS + "\n\n"
+    "Provide a score (1-10) for EACH criteria for BOTH models. "
+    "Also provide an 'overall_score' (1-10) for each model based on the criteria. "
+    "Finally, provide a brief reasoning string for each model explaining the rating IN RUSSIAN (На русском языке).\n\n"
+    "Return the result ONLY as a valid JSON object with the following structure:\n"
+    "{{\n"
+    "  'model_a': {{\n"
+    "    'overall_score': int,\n"
+    "    'scores': {{\n"
+    "       'Harmlessness': int,\n"
+    "       'Truthfulness': int,\n"
+    "       'Helpfulness': int,\n"
+    "       'Completeness': int,\n"
+    "       'Conciseness': int,\n"
+    "       'Relevance': int,\n"
+    "       'Appropriateness': int,\n"
+    "       'Readability': int\n"
+    "    }},\n"
+    "    'reasoning': str (MUST BE IN RUSSIAN)\n"
+    "  }},\n"
+    "  'model_b': {{ ... same structure ... }},\n"
+    "  'comparison': str (brief comparison summary IN RUSSIAN)\n"
+    "}}"
+)
+
+# Scores-only mode: no reasoning or comparison text; the reply is two short arrays, so the
+# output (the most expensive part of a call) shrinks from ~450 to ~60 tokens
+SCORES_ONLY_MAX_TOKENS = 150
+SCORES_ONLY_TEMPLATE = (
+    "You are an expert AI evaluator. {persona_instruction} Assess the following two model answers (Model A and Model B) "
+    "for the user query: '{query}'.\n\n"
+    "Evaluate based on these 8 criteria:\n" + CRITERIA_DEFINITIONS + "\n\n"
+    "Score (1-10) the overall quality and EACH criterion for BOTH models. Do NOT explain the scores.\n"
+    "Return ONLY this JSON object, each array ordered as overall, " + ", ".join(CRITERIA_NAMES) + ":\n"
+    '{{"a": [int, int, int, int, int, int, int, int, int], "b": [int, int, int, int, int, int, int, int, int]}}'
+)
+
+# Reasoning fetched on demand for a row judged in scores-only mode
+EXPLAIN_MAX_TOKENS = 1200
+EXPLAIN_TEMPLATE = (
+    "You are an expert AI evaluator. {persona_instruction} Two model answers (Model A and Model B) to the user query "
+    "'{query}' have already been scored on these criteria:\n" + CRITERIA_DEFINITIONS + "\n"
+    "Scores:\n{scores}\n\n"
+    "Explain these scores without changing them. Return ONLY a valid JSON object "
+    '{{"reasoning_a": str, "reasoning_b": str, "comparison": str}} with every string IN RUSSIAN (На русском языке).'
+)
+
+PROMPTS = {
+    "Strict Fact-Checker": "You are a strict fact-checker. Penalize ANY hallucination or factual error heavily. If Model A has a tiny error and Model B is vague but safe, Model B wins. Focus on precision.",
+    "Helpful Editor": "You are a helpful editor. Prioritize formatting, clarity, and tone. If Model A is factually correct but rude/messy, and Model B is polite and structured, prefer Model B."
+}
+
+# Follow-up sent when a reply holds no parsable verdict: only the raw reply is resent (no rubric, no
+# answers) and the cheap model rewrites it, instead of repeating the whole evaluation
+REFORMAT_MODEL_NAME = LITE_MODEL_NAME
+REFORMAT_MAX_CHARS = 8000
+REFORMAT_PROMPT = (
+    "Rewrite the evaluation below as ONE valid JSON object and nothing else: double quotes, no comments, "
+    "no Markdown. Keep every score and text exactly as given; use null for anything missing. Structure:\n"
+    '{"model_a": {"overall_score": int, "scores": {' + ", ".join(f'"{name}": int' for name in CRITERIA_NAMES)
+    + '}, "reasoning": str}, "model_b": {...same...}, "comparison": str}'
+)
+
+WINNER_SIGNS = {"Model A": 1, "Model B": -1, "Tie": 0}
+
+ZERO_USAGE = {"inputTextTokens": "0", "completionTokens": "0", "totalTokens": "0"}
+
+
+@functools.lru_cache(maxsize=None)
+def prompt_version(mode="full"):
+    """
+    Short hash of everything that shapes the judge prompt; changes whenever the prompt does.
+
+    Args:
+        mode (str): "full", "scores_only" or "explain"; each mode caches its replies separately.
+    """
+    material = [CRITERIA_DEFINITIONS, SYSTEM_PROMPT_TEMPLATE, PROMPTS]
+    if mode != "full":
+        material.append({"scores_only": SCORES_ONLY_TEMPLATE, "explain": EXPLAIN_TEMPLATE}[mode])
+    material = json.dumps(material, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """System prompt of one persona, split around the query so a call only concatenates."""
+    persona_name: str
+    head: str
+    tail: str
+
+    def system_text(self, query):
+        return f"{self.head}{query}{self.tail}"
+
+
+def _persona_instruction(persona_name):
+    return PROMPTS.get(persona_name, PROMPTS[DEFAULT_PERSONA])
+
+
+@functools.lru_cache(maxsize=None)
+def compile_prompt(persona_name, scores_only=False):
+    """Formats the template for `persona_name` once (unknown personas fall back to the default one)."""
+    template = SCORES_ONLY_TEMPLATE if scores_only else SYSTEM_PROMPT_TEMPLATE
+    marker = "\x00"
+    head, tail = template.format(persona_instruction=_persona_instruction(persona_name), query=marker).split(marker)
+    return CompiledPrompt(persona_name, head, tail)
+
+
+def build_headers(api_key, folder_id):
+    """Request headers for the Foundation Models API."""
+    return {
+        "Authorization": f"Api-Key {api_key}",
+        "x-folder-id": folder_id,
+        "Content-Type": "application/json"
+    }
+
+
+def build_completion_body(query, ans_a, ans_b, model_uri, persona_name=DEFAULT_PERSONA, max_tokens=MAX_TOKENS,
+                          scores_only=False):
+    """
+    Builds the completion request body for one A/B judgement.
+
+    The same body is accepted by the synchronous `completion` and the asynchronous
+    `completionAsync` endpoints. With `scores_only`, the model is asked for the scores
+    alone in a compact form and `max_tokens` is capped at `SCORES_ONLY_MAX_TOKENS`.
+    """
+    if scores_only:
+        max_tokens = min(max_tokens, SCORES_ONLY_MAX_TOKENS)
+    return {
+        "modelUri": model_uri,
+        "completionOptions": {
+            "stream": False,
+            "temperature": TEMPERATURE,
+            "maxTokens": max_tokens
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": compile_prompt(persona_name, scores_only).system_text(query)
+            },
+            {
+                "role": "user",
+                "text": f"Query: {query}\n\nModel A:\n{ans_a}\n\nModel B:\n{ans_b}"
+            }
+        ]
+    }
+
+
+def strip_code_fence(completion_text):
+    """Removes the Markdown code fence the model sometimes wraps its JSON in."""
+    clean_text = completion_text.strip()
+    if clean_text.startswith("```json"):
+        clean_text = clean_text[7:]
+    if clean_text.startswith("```"):
+        clean_text = clean_text[3:]
+    if clean_text.endswith("```"):
+        clean_text = clean_text[:-3]
+    return clean_text.strip()
+
+
+def parse_completion(result):
+    """
+    Turns a completion result (`alternatives` + `usage`) into a judgement dict.
+
+    Args:
+        result (dict): The `result` object of a sync response or the `response`
+            object of a finished async operation.
+
+    Returns:
+        dict: The parsed judgement with `usage` attached, or a dict with an `error` key.
+    """
+    try:
+        completion_text = result["alternatives"][0]["message"]["text"]
+        usage_data = result.get("usage", dict(ZERO_USAGE))
+    except (KeyError, IndexError, TypeError):
+        logger.error(f"Unexpected response structure: {result}")
+        return {"error": "Received unexpected response structure from Yandex API."}
+
+    # Tolerates single quotes, comments, surrounding prose, missing criteria and out-of-range scores
+    judgement = parse_verdict(completion_text, CRITERIA_NAMES)
+    if judgement is None:
+        logger.error(f"Unparsable verdict. Raw text: {completion_text}")
+        return {
+            "error": "Failed to parse model response as JSON.",
+            "raw_response": completion_text,
+            "usage": usage_data  # The call is billed even though its verdict is lost
+        }
+    if "parse_issues" in judgement:
+        logger.warning(f"Verdict repaired: {'; '.join(judgement['parse_issues'])}")
+    judgement["usage"] = usage_data # Attach usage data
+    return judgement
+
+
+def format_scores(verdict):
+    """Scores of a verdict as prompt text, e.g. "Model A: overall 8; Harmlessness 10, ..."."""
+    lines = []
+    for side, label in (("model_a", "Model A"), ("model_b", "Model B")):
+        data = verdict.get(side) or {}
+        scores = data.get("scores") or {}
+        criteria = ", ".join(f"{name} {scores.get(name, '-')}" for name in CRITERIA_NAMES)
+        lines.append(f"{label}: overall {data.get('overall_score', '-')}; {criteria}")
+    return "\n".join(lines)
+
+
+def build_explain_body(query, ans_a, ans_b, scores_text, model_uri, persona_name=DEFAULT_PERSONA,
+                       max_tokens=EXPLAIN_MAX_TOKENS):
+    """Completion body asking for the reasoning behind already assigned scores."""
+    system_text = EXPLAIN_TEMPLATE.format(persona_instruction=_persona_instruction(persona_name), query=query,
+                                          scores=scores_text)
+    return {
+        "modelUri": model_uri,
+        "completionOptions": {
+            "stream": False,
+            "temperature": TEMPERATURE,
+            "maxTokens": max_tokens
+        },
+        "messages": [
+            {"role": "system", "text": system_text},
+            {"role": "user", "text": f"Query: {query}\n\nModel A:\n{ans_a}\n\nModel B:\n{ans_b}"}
+        ]
+    }
+
+
+def parse_explanation(result):
+    """
+    Turns the reply to an explain request into `reasoning_a`, `reasoning_b` and `comparison`.
+
+    A reply without a JSON object is kept whole as `comparison`, so paid text is never dropped.
+    """
+    try:
+        completion_text = result["alternatives"][0]["message"]["text"]
+        usage_data = result.get("usage", dict(ZERO_USAGE))
+    except (KeyError, IndexError, TypeError):
+        logger.error(f"Unexpected response structure: {result}")
+        return {"error": "Received unexpected response structure from Yandex API."}
+    data = extract_json(completion_text) or {}
+    explanation = {
+        "reasoning_a": data.get("reasoning_a") or (data.get("model_a") or {}).get("reasoning"),
+        "reasoning_b": data.get("reasoning_b") or (data.get("model_b") or {}).get("reasoning"),
+        "comparison": data.get("comparison"),
+        "usage": usage_data,
+    }
+    if not data:
+        explanation["comparison"] = strip_code_fence(completion_text)
+    return explanation
+
+
+def build_reformat_body(raw_text, model_uri, max_tokens=MAX_TOKENS):
+    """Completion body asking the model to rewrite an unparsable reply as a JSON verdict."""
+    return {
+        "modelUri": model_uri,
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0,
+            "maxTokens": max_tokens
+        },
+        "messages": [
+            {"role": "system", "text": REFORMAT_PROMPT},
+            {"role": "user", "text": raw_text[:REFORMAT_MAX_CHARS]}
+        ]
+    }
+
+
+def add_usage(*usages):
+    """Sums API usage dicts (token counts are strings, as the API reports them)."""
+    totals = {}
+    for usage in usages:
+        for key in ("inputTextTokens", "completionTokens", "totalTokens"):
+            totals[key] = str(int(totals.get(key, 0)) + int((usage or {}).get(key, 0) or 0))
+    return totals
+
+
+def merge_call_stats(first, second):
+    """Call stats of two consecutive requests made for one row."""
+    merged = dict(first)
+    for key, value in second.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "status":
+            merged[key] = round(merged.get(key, 0) + value, 4)
+        else:
+            merged[key] = value
+    return merged
+
+
+def lookup_cached_verdict(cache, cache_key):
+    """Returns a cached verdict marked as a cache hit (with zero spent tokens), or None."""
+    cached = cache.get(cache_key)
+    if cached is None:
+        return None
+    logger.info(f"Verdict cache hit: {cache_key[:12]}")
+    # Nothing was spent on this call; keep the original usage for reference
+    cached["cached_usage"] = cached.get("usage", {})
+    cached["usage"] = dict(ZERO_USAGE)
+    cached["cache_hit"] = True
+    return cached
+
+
+def demo_verdict(persona_name=DEFAULT_PERSONA):
+    """Canned judgement returned by the mock backend in demo mode."""
+    reasoning_a = "Модель A дает безопасный и правдивый ответ."
+    if persona_name == "Strict Fact-Checker":
+        reasoning_a += " Факты проверены, ошибок нет."
+    elif persona_name == "Helpful Editor":
+        reasoning_a += " Форматирование хорошее."
+
+    reasoning_b = "В ответе Модели B присутствуют недочеты."
+    if persona_name == "Strict Fact-Checker":
+        reasoning_b += " Замечена фактическая ошибка в датах."
+    elif persona_name == "Helpful Editor":
+        reasoning_b += " Стиль текста слишком сухой."
+
+    return {
+        "model_a": {
+            "overall_score": 8,
+            "scores": {
+                "Harmlessness": 10, "Truthfulness": 9, "Helpfulness": 8, "Completeness": 7,
+                "Conciseness": 8, "Relevance": 9, "Appropriateness": 8, "Readability": 9
+            },
+            "reasoning": f"{reasoning_a} (ДЕМО: {persona_name})"
+        },
+        "model_b": {
+            "overall_score": 6,
+            "scores": {
+                "Harmlessness": 10, "Truthfulness": 5, "Helpfulness": 6, "Completeness": 5,
+                "Conciseness": 9, "Relevance": 5, "Appropriateness": 7, "Readability": 8
+            },
+            "reasoning": f"{reasoning_b} (ДЕМО: {persona_name})"
+        },
+        "comparison": f"Модель A значительно лучше. ({persona_name})",
+        "usage": {
+            "inputTextTokens": "500",
+            "completionTokens": "200",
+            "totalTokens": "700"
+        }
+    }
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def verdict_sign(result):
+    """Outcome of a single judge result dict: 1 if A won, -1 if B won, 0 for a tie, None if it failed."""
+    if "error" in result:
+        return None
+    if result.get("winner") in WINNER_SIGNS:
+        return WINNER_SIGNS[result["winner"]]
+    try:
+        score_a = _as_int(result["model_a"]["overall_score"])
+        score_b = _as_int(result["model_b"]["overall_score"])
+    except (KeyError, TypeError):
+        return None
+    if score_a is None or score_b is None:
+        return None
+    return (score_a > score_b) - (score_a < score_b)
+
+
+# Typed Records
+
+@dataclass
+class Usage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+    @classmethod
+    def from_dict(cls, usage):
+        usage = usage or {}
+        return cls(
+            _as_int(usage.get("inputTextTokens")) or 0,
+            _as_int(usage.get("completionTokens")) or 0,
+            _as_int(usage.get("totalTokens")) or 0,
+        )
+
+    def to_dict(self):
+        # The API reports token counts as strings
+        return {"inputTextTokens": str(self.input_tokens), "completionTokens": str(self.output_tokens),
+                "totalTokens": str(self.total_tokens)}
+
+
+@dataclass
+class Assessment:
+    """Judgement of one answer: overall score, per-criterion scores and reasoning."""
+    overall_score: int = None
+    scores: dict = field(default_factory=dict)
+    reasoning: str = None
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data if isinstance(data, dict) else {}
+        scores = data.get("scores") if isinstance(data.get("scores"), dict) else {}
+        return cls(_as_int(data.get("overall_score")), {name: _as_int(scores.get(name)) for name in scores},
+                   data.get("reasoning"))
+
+    def to_dict(self):
+        return {"overall_score": self.overall_score, "scores": dict(self.scores), "reasoning": self.reasoning}
+
+
+@dataclass
+class Verdict:
+    """
+    Typed view of a judge result dict.
+
+    Keys without a dedicated field (cascade details, `winner`, `resolution`,
+    `duplicate_of`, ...) are kept in `extra`, so `to_dict` round-trips.
+    """
+    model_a: Assessment = None
+    model_b: Assessment = None
+    comparison: str = None
+    usage: Usage = field(default_factory=Usage)
+    error: str = None
+    raw_response: str = None
+    cache_hit: bool = False
+    call_stats: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)
+
+    _FIELDS = ("model_a", "model_b", "comparison", "usage", "error", "raw_response", "cache_hit", "call_stats")
+
+    @classmethod
+    def from_dict(cls, result):
+        return cls(
+            model_a=Assessment.from_dict(result["model_a"]) if "model_a" in result else None,
+            model_b=Assessment.from_dict(result["model_b"]) if "model_b" in result else None,
+            comparison=result.get("comparison"),
+            usage=Usage.from_dict(result.get("usage")),
+            error=result.get("error"),
+            raw_response=result.get("raw_response"),
+            cache_hit=bool(result.get("cache_hit", False)),
+            call_stats=dict(result.get("call_stats") or {}),
+            extra={key: value for key, value in result.items() if key not in cls._FIELDS},
+        )
+
+    def to_dict(self):
+        result = dict(self.extra)
+        if self.error is not None:
+            result["error"] = self.error
+        if self.raw_response is not None:
+            result["raw_response"] = self.raw_response
+        for name in ("model_a", "model_b"):
+            assessment = getattr(self, name)
+            if assessment is not None:
+                result[name] = assessment.to_dict()
+        if self.comparison is not None:
+            result["comparison"] = self.comparison
+        if self.error is None or self.usage.total_tokens:
+            result["usage"] = self.usage.to_dict()
+        if self.cache_hit:
+            result["cache_hit"] = True
+        if self.call_stats:
+            result["call_stats"] = dict(self.call_stats)
+        return result
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def sign(self):
+        """1 if A won, -1 if B won, 0 for a tie, None if the judgement failed."""
+        if not self.ok:
+            return None
+        if self.extra.get("winner") in WINNER_SIGNS:
+            return WINNER_SIGNS[self.extra["winner"]]
+        if self.model_a is None or self.model_b is None:
+            return None
+        score_a, score_b = self.model_a.overall_score, self.model_b.overall_score
+        if score_a is None or score_b is None:
+            return None
+        return (score_a > score_b) - (score_a < score_b)
+
+    @property
+    def winner(self):
+        return {1: "Model A", -1: "Model B", 0: "Tie"}.get(self.sign)
+
+
+# Backends: `complete(judge, query, ans_a, ans_b)` returns a result dict and
+# `explain(judge, query, ans_a, ans_b, scores_text)` the reasoning behind given scores
+
+def scores_only_verdict(verdict):
+    """A verdict stripped to its scores, as the scores-only mode returns it."""
+    compact = {side: {"overall_score": verdict[side]["overall_score"], "scores": dict(verdict[side]["scores"]),
+                      "reasoning": None} for side in ("model_a", "model_b")}
+    compact.update(comparison=None, scores_only=True)
+    return compact
+
+
+class MockBackend:
+    """Canned demo verdicts without network access."""
+
+    def __init__(self, latency=DEMO_LATENCY):
+        self.latency = latency
+
+    def _verdict(self, judge):
+        verdict = demo_verdict(judge.persona_name)
+        if judge.scores_only:
+            return dict(scores_only_verdict(verdict), usage={
+                "inputTextTokens": "500", "completionTokens": "60", "totalTokens": "560"
+            })
+        return verdict
+
+    def complete(self, judge, query, ans_a, ans_b):
+        if self.latency:
+            # No reasoning to generate in scores-only mode
+            time.sleep(self.latency / 4 if judge.scores_only else self.latency) # Simulate API latency
+        return self._verdict(judge)
+
+    def stream(self, judge, query, ans_a, ans_b):
+        """Replays the canned verdict in pieces."""
+        verdict = self._verdict(judge)
+        text = json.dumps({k: v for k, v in verdict.items() if k != "usage"}, ensure_ascii=False)
+        parser = PartialJSONParser()
+        steps = 30
+        step = max(1, len(text) // steps)
+        for i in range(0, len(text), step):
+            time.sleep(self.latency / steps) # Simulate generation speed
+            parser.feed(text[i:i + step])
+            yield dict(parser.snapshot(), partial=True)
+        yield verdict
+
+    def explain(self, judge, query, ans_a, ans_b, scores_text):
+        if self.latency:
+            time.sleep(self.latency)
+        verdict = demo_verdict(judge.persona_name)
+        return {
+            "reasoning_a": verdict["model_a"]["reasoning"],
+            "reasoning_b": verdict["model_b"]["reasoning"],
+            "comparison": verdict["comparison"],
+            "usage": {"inputTextTokens": "560", "completionTokens": "200", "totalTokens": "760"},
+        }
+
+
+class LiveBackend:
+    """
+    YandexGPT completion endpoint.
+
+    Args:
+        client (YandexGPTClient): HTTP client; defaults to the shared pooled client,
+            which (with `requests`) is imported on the first call only.
+    """
+
+    def __init__(self, api_key, folder_id, client=None):
+        self.api_key = api_key
+        self.folder_id = folder_id
+        self.client = client
+        self.headers = build_headers(api_key, folder_id)
+
+    def model_uri(self, model_name):
+        return f"gpt://{self.folder_id}/{model_name}"
+
+    def cache_key(self, judge, query, ans_a, ans_b, scores_text=None):
+        """Cache key of a verdict (or, with `scores_text`, of an explanation); None when the call cannot be made."""
+        if not self.api_key or not self.folder_id:
+            return None
+        if scores_text is not None:
+            version = f"{prompt_version('explain')}\n{scores_text}"
+        else:
+            version = prompt_version("scores_only" if judge.scores_only else "full")
+        return make_cache_key(query, ans_a, ans_b, judge.persona_name, self.model_uri(judge.model_name),
+                              TEMPERATURE, version)
+
+    def _client(self):
+        if self.client is None:
+            from yandex_client import get_default_client
+            self.client = get_default_client()
+        return self.client
+
+    def _post(self, body, parse):
+        """Sends a completion request and parses its result; errors come back as result dicts."""
+        import requests
+
+        # Input Validation
+        if not self.api_key or not self.folder_id:
+            return {"error": "Missing API Key or Folder ID for real mode execution."}
+
+        client = self._client()
+        call_stats = {}
+
+        try:
+            logger.info(f"Sending request to YandexGPT: {body['modelUri']}")
+            response, call_stats = client.post(COMPLETION_PATH, headers=self.headers, body=body)
+
+            if response.status_code != 200:
+                logger.error(f"Yandex API Error: {response.status_code} - {response.text}")
+                return {"error": f"Yandex API Error {response.status_code}: {response.text}", "call_stats": call_stats}
+
+            result = parse(response.json().get("result"))
+            if "raw_response" in result:
+                result, call_stats = self.recover(result, call_stats, body["completionOptions"]["maxTokens"])
+            result["call_stats"] = call_stats
+            return result
+
+        except requests.RequestException as e:
+            logger.error(f"Request to Yandex API failed after retries: {e}")
+            return {"error": f"Request to Yandex API failed: {str(e)}", "call_stats": call_stats}
+        except Exception as e:
+            logger.exception("An error occurred during evaluation.")
+            return {"error": f"An unexpected error occurred: {str(e)}"}
+
+    def complete(self, judge, query, ans_a, ans_b):
+        body = judge.completion_body(query, ans_a, ans_b, self.model_uri(judge.model_name))
+        result = self._post(body, parse_completion)
+        if judge.scores_only and "error" not in result:
+            result["scores_only"] = True
+        return result
+
+    def stream(self, judge, query, ans_a, ans_b):
+        """
+        Requests the verdict with `stream: true` and parses the JSON as it arrives.
+
+        Yields:
+            dict: Partial judgements marked with `"partial": True` as the reply grows,
+            then exactly one final result, identical to what `complete` returns.
+        """
+        import requests
+
+        if not self.api_key or not self.folder_id:
+            yield {"error": "Missing API Key or Folder ID for real mode execution."}
+            return
+
+        body = judge.completion_body(query, ans_a, ans_b, self.model_uri(judge.model_name))
+        body["completionOptions"]["stream"] = True
+        client = self._client()
+        call_stats = {}
+
+        try:
+            logger.info(f"Sending streaming request to YandexGPT: {body['modelUri']}")
+            response, call_stats = client.post_stream(COMPLETION_PATH, headers=self.headers, body=body)
+
+            if response.status_code != 200:
+                logger.error(f"Yandex API Error: {response.status_code} - {response.text}")
+                yield {"error": f"Yandex API Error {response.status_code}: {response.text}", "call_stats": call_stats}
+                return
+
+            parser = PartialJSONParser()
+            received = ""
+            last_result = None
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        error = chunk["error"]
+                        yield {"error": f"Yandex API stream error: {error.get('message', error)}",
+                               "call_stats": call_stats}
+                        return
+                    last_result = chunk.get("result")
+                    text = last_result["alternatives"][0]["message"]["text"]
+                    # Every chunk carries the whole text generated so far; feed only the new tail
+                    if text.startswith(received):
+                        parser.feed(text[len(received):])
+                    else:
+                        parser = PartialJSONParser()
+                        parser.feed(text)
+                    received = text
+                    yield dict(parser.snapshot(), partial=True)
+            finally:
+                response.close()
+
+            judgement = parse_completion(last_result)
+            if "raw_response" in judgement:
+                judgement, call_stats = self.recover(judgement, call_stats, body["completionOptions"]["maxTokens"])
+            if judge.scores_only and "error" not in judgement:
+                judgement["scores_only"] = True
+            judgement["call_stats"] = call_stats
+            yield judgement
+
+        except requests.RequestException as e:
+            logger.error(f"Streaming request to Yandex API failed: {e}")
+            yield {"error": f"Request to Yandex API failed: {str(e)}", "call_stats": call_stats}
+        except Exception as e:
+            logger.exception("An error occurred during streaming evaluation.")
+            yield {"error": f"An unexpected error occurred: {str(e)}"}
+
+    def explain(self, judge, query, ans_a, ans_b, scores_text):
+        body = build_explain_body(query, ans_a, ans_b, scores_text, self.model_uri(judge.model_name),
+                                  judge.persona_name)
+        return self._post(body, parse_explanation)
+
+    def recover(self, judgement, call_stats, max_tokens=MAX_TOKENS):
+        """
+        Re-asks the cheap model to reformat an unparsable reply.
+
+        Args:
+            judgement (dict): The parse error, with `raw_response` and `usage` of the paid call.
+            call_stats (dict): Stats of that call.
+
+        Returns:
+            tuple: `(judgement, call_stats)`. A recovered verdict carries `reformatted`
+            and `reformat_usage`; its `usage` covers both calls. If the follow-up fails
+            too, the original error is returned with the combined usage.
+        """
+        import requests
+
+        body = build_reformat_body(judgement["raw_response"], self.model_uri(REFORMAT_MODEL_NAME), max_tokens)
+        try:
+            logger.info("Re-asking for a JSON verdict")
+            response, reformat_stats = self.client.post(COMPLETION_PATH, headers=self.headers, body=body)
+        except requests.RequestException as e:
+            logger.error(f"Reformat request failed: {e}")
+            return judgement, call_stats
+        call_stats = merge_call_stats(call_stats, reformat_stats)
+        if response.status_code != 200:
+            logger.error(f"Reformat request returned {response.status_code}: {response.text}")
+            return judgement, call_stats
+        reformatted = parse_completion(response.json().get("result"))
+        reformat_usage = reformatted.get("usage", {})
+        if "error" in reformatted:
+            judgement["usage"] = add_usage(judgement.get("usage"), reformat_usage)
+            return judgement, call_stats
+        reformatted["usage"] = add_usage(judgement.get("usage"), reformat_usage)
+        reformatted["reformat_usage"] = reformat_usage
+        reformatted["reformatted"] = True
+        return reformatted, call_stats
+
+
+class CachedBackend:
+    """
+    Serves verdicts and explanations from a `VerdictCache` and stores fresh successful ones.
+
+    Wraps any backend with a `cache_key` method; others are passed through uncached.
+    """
+
+    def __init__(self, backend, cache, bypass_cache=False):
+        self.backend = backend
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+
+    def _lookup(self, cache_key):
+        if cache_key is None or self.bypass_cache:
+            return None
+        return lookup_cached_verdict(self.cache, cache_key)
+
+    def _store(self, cache_key, result):
+        if cache_key is not None and "error" not in result:
+            self.cache.put(cache_key, {key: value for key, value in result.items() if key != "call_stats"})
+
+    def _cached(self, cache_key, call):
+        cached = self._lookup(cache_key)
+        if cached is not None:
+            return cached
+        result = call()
+        self._store(cache_key, result)
+        return result
+
+    def _key(self, *args):
+        key_fn = getattr(self.backend, "cache_key", None)
+        return key_fn(*args) if key_fn else None
+
+    def complete(self, judge, query, ans_a, ans_b):
+        return self._cached(self._key(judge, query, ans_a, ans_b),
+                            lambda: self.backend.complete(judge, query, ans_a, ans_b))
+
+    def stream(self, judge, query, ans_a, ans_b):
+        cache_key = self._key(judge, query, ans_a, ans_b)
+        cached = self._lookup(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        for result in self.backend.stream(judge, query, ans_a, ans_b):
+            if not result.get("partial"):
+                self._store(cache_key, result)
+            yield result
+
+    def explain(self, judge, query, ans_a, ans_b, scores_text):
+        return self._cached(self._key(judge, query, ans_a, ans_b, scores_text),
+                            lambda: self.backend.explain(judge, query, ans_a, ans_b, scores_text))
+
+
+class Judge:
+    """
+    Reusable A/B judge: requests are built by `build_completion_body` and every call goes to `backend`.
+
+    A `Judge` is also a valid `evaluate_fn` for `batch_runner.iter_evaluations`
+    (called with a row dict holding `query`, `answer_a` and `answer_b`).
+
+    With `scores_only`, verdicts hold the scores without reasoning or comparison;
+    `explain` fetches the reasoning later for the rows someone actually reads.
+    """
+
+    __slots__ = ("backend", "persona_name", "model_name", "max_tokens", "scores_only")
+
+    def __init__(self, backend, persona_name=DEFAULT_PERSONA, model_name=MODEL_NAME, max_tokens=MAX_TOKENS,
+                 scores_only=False):
+        self.backend = backend
+        self.persona_name = persona_name
+        self.model_name = model_name
+        self.scores_only = scores_only
+        self.max_tokens = min(max_tokens, SCORES_ONLY_MAX_TOKENS) if scores_only else max_tokens
+
+    def completion_body(self, query, ans_a, ans_b, model_uri):
+        return build_completion_body(query, ans_a, ans_b, model_uri, self.persona_name, self.max_tokens,
+                                     self.scores_only)
+
+    def evaluate(self, query, ans_a, ans_b):
+        """Returns the result dict (see `evaluate_with_yandex`)."""
+        return self.backend.complete(self, query, ans_a, ans_b)
+
+    def stream(self, query, ans_a, ans_b):
+        """Yields partial judgements (`"partial": True`), then the result dict `evaluate` would return."""
+        return self.backend.stream(self, query, ans_a, ans_b)
+
+    def verdict(self, query, ans_a, ans_b):
+        """Returns the result as a typed `Verdict`."""
+        return Verdict.from_dict(self.evaluate(query, ans_a, ans_b))
+
+    def explain(self, query, ans_a, ans_b, verdict):
+        """
+        Generates the reasoning for a verdict judged without it.
+
+        Args:
+            verdict (dict): Result dict with the `model_a` / `model_b` scores to explain.
+
+        Returns:
+            dict: `reasoning_a`, `reasoning_b`, `comparison` and `usage`, or a dict with an `error` key.
+        """
+        return self.backend.explain(self, query, ans_a, ans_b, format_scores(verdict))
+
+    def __call__(self, row):
+        return self.evaluate(row["query"], row["answer_a"], row["answer_b"])
+
+
+def make_judge(api_key=None, folder_id=None, demo_mode=False, persona_name=DEFAULT_PERSONA, cache=None,
+               bypass_cache=False, client=None, model_name=MODEL_NAME, max_tokens=MAX_TOKENS, scores_only=False):
+    """Builds a `Judge` from the same settings `evaluate_with_yandex` takes."""
+    if demo_mode:
+        backend = MockBackend()
+    else:
+        backend = LiveBackend(api_key, folder_id, client)
+        if cache is not None:
+            backend = CachedBackend(backend, cache, bypass_cache)
+    return Judge(backend, persona_name, model_name, max_tokens, scores_only)
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import bisect
+import threading
+from collections import Counter
+
+# Histogram bucket upper bounds in seconds (Prometheus `le` labels)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0, float("inf"))
+WAIT_BUCKETS = (0.0, 0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, float("inf"))
+
+OUTCOMES = ("ok", "cache_hit", "reformatted", "parse_error", "http_error", "network_error", "other_error")
+
+METRIC_PREFIX = "autoassessor_judge"
+
+
+class Histogram:
+    """Fixed-bucket histogram; memory does not depend on the number of observations."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """`(upper_bound, observations <= upper_bound)` pairs, as Prometheus exposes them."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """Estimates a quantile by linear interpolation inside its bucket (like `histogram_quantile`)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower = 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+
+def classify_outcome(result):
+    """
+    Buckets a judge result for the error-rate counters.
+
+    Returns:
+        str: One of `OUTCOMES`. A reformatted result was recovered by the JSON
+        re-ask after an unparsable reply; a parse error is a 200 reply whose text was not a
+        valid verdict; an HTTP error is a non-200 final status; a network error is a
+        call that never got a response.
+    """
+    if "error" not in result:
+        if result.get("reformatted"):
+            return "reformatted"
+        return "cache_hit" if result.get("cache_hit") else "ok"
+    status = result.get("call_stats", {}).get("status")
+    if status == 200 or "raw_response" in result:
+        return "parse_error"
+    if status is not None:
+        return "http_error"
+    if "call_stats" in result:
+        return "network_error"
+    return "other_error"
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class MetricsRegistry:
+    """
+    Thread-safe per-call instrumentation of the judge pipeline.
+
+    Every evaluation is turned into a flat record (wall time, time to first byte,
+    HTTP status, retries and 429s, rate-limiter wait, outcome, cache hit, tokens).
+    Records are aggregated into histograms and counters in memory and, if
+    `jsonl_path` is given, appended to a JSON lines file as they arrive.
+    """
+
+    def __init__(self, jsonl_path=None):
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        self.status_counts = Counter()
+        self.outcome_counts = Counter()
+        self.histograms = {
+            "wall_time_seconds": Histogram(LATENCY_BUCKETS),
+            "ttfb_seconds": Histogram(LATENCY_BUCKETS),
+            "rate_limit_wait_seconds": Histogram(WAIT_BUCKETS),
+        }
+        self.jsonl_path = jsonl_path
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+        self.started_at = time.time()
+
+    def record(self, result, wall_time, rate_limit_wait=0.0):
+        """
+        Adds one evaluation result.
+
+        Args:
+            result (dict): Result returned by the judge (with its `call_stats`).
+            wall_time (float): Seconds the evaluation took, retries included.
+            rate_limit_wait (float): Seconds spent waiting for the rate limiter before it.
+
+        Returns:
+            dict: The flat per-call record.
+        """
+        call_stats = result.get("call_stats", {})
+        usage = result.get("usage", {})
+        record = {
+            "ts": round(time.time(), 3),
+            "outcome": classify_outcome(result),
+            "wall_time_s": round(wall_time, 4),
+            "ttfb_s": call_stats.get("ttfb_s"),
+            "status": call_stats.get("status"),
+            "attempts": call_stats.get("attempts", 0),
+            "retries": call_stats.get("retries", 0),
+            "throttled": call_stats.get("throttled", 0),
+            "backoff_s": call_stats.get("backoff_s", 0.0),
+            "rate_limit_wait_s": round(rate_limit_wait, 4),
+            "cache_hit": bool(result.get("cache_hit", False)),
+            "input_tokens": _as_int(usage.get("inputTextTokens")),
+            "output_tokens": _as_int(usage.get("completionTokens")),
+            "model": result.get("judge_model"),
+        }
+        with self._lock:
+            self.outcome_counts[record["outcome"]] += 1
+            if record["status"] is not None:
+                self.status_counts[record["status"]] += 1
+            self.counters["calls"] += 1
+            self.counters["retries"] += record["retries"]
+            self.counters["throttled"] += record["throttled"]
+            self.counters["backoff_seconds"] += record["backoff_s"]
+            self.counters["rate_limit_wait_seconds"] += rate_limit_wait
+            self.counters["input_tokens"] += record["input_tokens"]
+            self.counters["output_tokens"] += record["output_tokens"]
+            self.histograms["wall_time_seconds"].observe(wall_time)
+            self.histograms["rate_limit_wait_seconds"].observe(rate_limit_wait)
+            if record["ttfb_s"] is not None:
+                self.histograms["ttfb_seconds"].observe(record["ttfb_s"])
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record) + "\n")
+        return record
+
+    def snapshot(self):
+        """
+        Aggregated view for dashboards.
+
+        Returns:
+            dict: calls, outcomes, statuses, error_rate and totals, plus `histograms`
+            with p50/p95/p99 and cumulative buckets of wall time, time to first byte
+            and rate-limiter wait.
+        """
+        with self._lock:
+            calls = self.counters["calls"]
+            errors = sum(n for outcome, n in self.outcome_counts.items()
+                         if outcome not in ("ok", "cache_hit", "reformatted"))
+            snapshot = {
+                "calls": calls,
+                "elapsed_s": time.time() - self.started_at,
+                "outcomes": {outcome: self.outcome_counts.get(outcome, 0) for outcome in OUTCOMES},
+                "statuses": dict(sorted(self.status_counts.items())),
+                "error_rate": errors / calls if calls else 0.0,
+                "retries": self.counters["retries"],
+                "throttled": self.counters["throttled"],
+                "backoff_seconds": self.counters["backoff_seconds"],
+                "rate_limit_wait_seconds": self.counters["rate_limit_wait_seconds"],
+                "input_tokens": self.counters["input_tokens"],
+                "output_tokens": self.counters["output_tokens"],
+            }
+            snapshot["histograms"] = {
+                name: dict({f"p{int(q * 100)}": histogram.quantile(q) for q in (0.5, 0.95, 0.99)},
+                           buckets=histogram.cumulative())
+                for name, histogram in self.histograms.items()
+            }
+        return snapshot
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """Renders all counters and histograms in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+                lines.append(f"{prefix}_{name}{label_text} {value}")
+
+        with self._lock:
+            metric("calls_total", "counter", "Judge evaluations by outcome.",
+                   [({"outcome": outcome}, self.outcome_counts.get(outcome, 0)) for outcome in OUTCOMES])
+            metric("http_responses_total", "counter", "Final HTTP status of judge calls.",
+                   [({"status": status}, n) for status, n in sorted(self.status_counts.items())])
+            metric("retries_total", "counter", "Retried HTTP attempts.", [({}, self.counters["retries"])])
+            metric("throttled_total", "counter", "HTTP 429 responses received, retried ones included.",
+                   [({}, self.counters["throttled"])])
+            metric("backoff_seconds_total", "counter", "Time slept between retries.",
+                   [({}, round(self.counters["backoff_seconds"], 3))])
+            metric("tokens_total", "counter", "Tokens billed by the API.",
+                   [({"type": "input"}, self.counters["input_tokens"]), ({"type": "output"}, self.counters["output_tokens"])])
+            for name, help_text in (
+                ("wall_time_seconds", "Wall time of an evaluation, retries included."),
+                ("ttfb_seconds", "Time to the response headers of the last attempt."),
+                ("rate_limit_wait_seconds", "Time spent waiting for the client-side rate limiter."),
+            ):
+                histogram = self.histograms[name]
+                samples = [({"le": "+Inf" if bound == float("inf") else bound}, count)
+                           for bound, count in histogram.cumulative()]
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                for labels, value in samples:
+                    lines.append(f'{prefix}_{name}_bucket{{le="{labels["le"]}"}} {value}')
+                lines.append(f"{prefix}_{name}_sum {round(histogram.sum, 4)}")
+                lines.append(f"{prefix}_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix=METRIC_PREFIX):
+        """Writes the Prometheus text atomically (suitable for the node_exporter textfile collector)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
+
+    def close(self):
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
@@ -0,0 +1,315 @@
+"""
+Local stand-in for the Yandex Foundation Models API, for load tests and offline runs.
+
+Usage:
+    python mock_server.py --port 8080 --latency-ms 800 --rate-429 0.02 --rate-5xx 0.01 --malformed-rate 0.01
+
+Then point the app or the CLI at it:
+    YANDEX_LLM_API_URL=http://127.0.0.1:8080 YANDEX_OPERATION_API_URL=http://127.0.0.1:8080 \
+        python cli.py run data.csv -o results.jsonl --api-key mock --folder-id mock
+
+Implements `completion` (plain and streamed), `completionAsync` with the Operation
+API, and `tokenize`. Verdicts are derived from a hash of the judged content, so the
+same row always gets the same scores; packed requests get one verdict per task,
+scores-only requests the compact score arrays and explain requests the reasoning alone.
+Latency, throttling, server errors, malformed (truncated) replies and sloppy
+but recoverable replies (Python-style dict wrapped in prose) are injected at the
+configured rates.
+"""
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from judge_core import CRITERIA_NAMES
+
+COMPLETION_PATH = "/foundationModels/v1/completion"
+ASYNC_COMPLETION_PATH = "/foundationModels/v1/completionAsync"
+TOKENIZE_PATH = "/foundationModels/v1/tokenize"
+OPERATIONS_PREFIX = "/operations/"
+
+CHARS_PER_TOKEN = 4
+STREAM_CHUNKS = 10
+TASK_SEPARATOR = "\n\n---\n\n"
+
+
+class MockConfig:
+    """Behaviour of the mock API; every rate is a probability per request."""
+
+    def __init__(self, latency_ms=800.0, latency_sigma=0.4, ms_per_output_token=0.0, rate_429=0.0, rate_5xx=0.0,
+                 malformed_rate=0.0, sloppy_rate=0.0, retry_after=0.2, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.ms_per_output_token = ms_per_output_token
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.malformed_rate = malformed_rate
+        self.sloppy_rate = sloppy_rate
+        self.retry_after = retry_after
+        self.seed = seed
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def mock_verdict(task_text):
+    """Deterministic verdict for one judged task, derived from a hash of its text."""
+    digest = _digest(task_text)
+    verdict = {}
+    for side, offset in (("model_a", 0), ("model_b", 16)):
+        scores = {name: 1 + digest[offset + i] % 10 for i, name in enumerate(CRITERIA_NAMES)}
+        verdict[side] = {
+            "overall_score": round(sum(scores.values()) / len(scores)),
+            "scores": scores,
+            "reasoning": f"Синтетическое обоснование ({digest[offset:offset + 4].hex()}).",
+        }
+    gap = verdict["model_a"]["overall_score"] - verdict["model_b"]["overall_score"]
+    verdict["comparison"] = "Ничья." if gap == 0 else ("Модель A лучше." if gap > 0 else "Модель B лучше.")
+    return verdict
+
+
+def compact_verdict(verdict):
+    """The scores-only form of a verdict: `[overall, *criteria]` per side."""
+    return {key: [verdict[side]["overall_score"], *(verdict[side]["scores"][name] for name in CRITERIA_NAMES)]
+            for key, side in (("a", "model_a"), ("b", "model_b"))}
+
+
+def _approx_tokens(text):
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class MockState:
+    """Shared counters, pending async operations and the random source of one server."""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+        self.operations = {}
+        self.counters = {"requests": 0, "throttled": 0, "server_errors": 0, "malformed": 0, "sloppy": 0, "completions": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def latency(self, output_tokens=0):
+        config = self.config
+        with self.lock:
+            base = config.latency_ms * math.exp(self.random.gauss(0, config.latency_sigma)) if config.latency_ms else 0.0
+        return (base + output_tokens * config.ms_per_output_token) / 1000
+
+    def completion(self, body):
+        """Builds the `result` object for a completion request body."""
+        messages = body.get("messages", [])
+        user_text = messages[-1]["text"] if messages else ""
+        system_text = messages[0]["text"] if len(messages) > 1 else ""
+        tasks = user_text.split(TASK_SEPARATOR) if "numbered tasks" in system_text else [user_text]
+        if len(tasks) > 1:
+            # Drop the "Task N" header so a row gets the same verdict packed or alone
+            payload = [dict(mock_verdict(task.split("\n", 1)[-1]), id=i) for i, task in enumerate(tasks, start=1)]
+        elif "already been scored" in system_text:
+            verdict = mock_verdict(user_text)
+            payload = {"reasoning_a": verdict["model_a"]["reasoning"], "reasoning_b": verdict["model_b"]["reasoning"],
+                       "comparison": verdict["comparison"]}
+        elif '"a": [' in system_text:
+            payload = compact_verdict(mock_verdict(user_text))
+        else:
+            payload = mock_verdict(user_text)
+        text = json.dumps(payload, ensure_ascii=False)
+
+        roll = self.draw()
+        if roll < self.config.malformed_rate:
+            self.count("malformed")
+            text = text[:len(text) // 2]
+        elif roll < self.config.malformed_rate + self.config.sloppy_rate:
+            self.count("sloppy")
+            text = f"Вот результат оценки:\n```python\n{payload!r}\n```\nНадеюсь, это поможет."
+        self.count("completions")
+
+        input_tokens = sum(_approx_tokens(m.get("text", "")) for m in messages)
+        output_tokens = _approx_tokens(text)
+        return {
+            "alternatives": [{"message": {"role": "assistant", "text": text}, "status": "ALTERNATIVE_STATUS_FINAL"}],
+            "usage": {
+                "inputTextTokens": str(input_tokens),
+                "completionTokens": str(output_tokens),
+                "totalTokens": str(input_tokens + output_tokens),
+            },
+            "modelVersion": "mock",
+        }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without TCP_NODELAY delayed ACKs add ~40 ms per reply
+    disable_nagle_algorithm = True
+    state = None  # set by `make_server`
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, obj, headers=None):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_failure(self):
+        """Sends a 429 or 5xx at the configured rates; returns True if it did."""
+        config = self.state.config
+        roll = self.state.draw()
+        if roll < config.rate_429:
+            self.state.count("throttled")
+            self._send_json(429, {"error": {"message": "Too many requests (mock)"}}, {"Retry-After": str(config.retry_after)})
+            return True
+        if roll < config.rate_429 + config.rate_5xx:
+            self.state.count("server_errors")
+            self._send_json(503, {"error": {"message": "Service unavailable (mock)"}})
+            return True
+        return False
+
+    def do_POST(self):
+        self.state.count("requests")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._inject_failure():
+            return
+
+        if self.path == COMPLETION_PATH:
+            result = self.state.completion(body)
+            delay = self.state.latency(int(result["usage"]["completionTokens"]))
+            if body.get("completionOptions", {}).get("stream"):
+                self._stream(result, delay)
+            else:
+                time.sleep(delay)
+                self._send_json(200, {"result": result})
+        elif self.path == ASYNC_COMPLETION_PATH:
+            result = self.state.completion(body)
+            operation_id = uuid.uuid4().hex
+            ready_at = time.time() + self.state.latency(int(result["usage"]["completionTokens"]))
+            with self.state.lock:
+                self.state.operations[operation_id] = (ready_at, result)
+            self._send_json(200, {"id": operation_id, "done": False})
+        elif self.path == TOKENIZE_PATH:
+            n_tokens = _approx_tokens(body.get("text", ""))
+            self._send_json(200, {"tokens": [{"id": "0", "text": "", "special": False}] * n_tokens})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.state.lock:
+                return self._send_json(200, dict(self.state.counters))
+        if not self.path.startswith(OPERATIONS_PREFIX):
+            return self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        self.state.count("requests")
+        if self._inject_failure():
+            return
+        operation_id = self.path[len(OPERATIONS_PREFIX):]
+        with self.state.lock:
+            operation = self.state.operations.get(operation_id)
+        if operation is None:
+            return self._send_json(404, {"error": {"message": "Operation not found"}})
+        ready_at, result = operation
+        if time.time() < ready_at:
+            return self._send_json(200, {"id": operation_id, "done": False})
+        with self.state.lock:
+            self.state.operations.pop(operation_id, None)
+        self._send_json(200, {"id": operation_id, "done": True, "response": result})
+
+    def _stream(self, result, delay):
+        """Streams the reply as NDJSON chunks, each holding the whole text generated so far."""
+        text = result["alternatives"][0]["message"]["text"]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, math.ceil(len(text) / STREAM_CHUNKS))
+        for end in range(step, len(text) + step, step):
+            time.sleep(delay / STREAM_CHUNKS)
+            final = end >= len(text)
+            chunk = {
+                "alternatives": [{
+                    "message": {"role": "assistant", "text": text[:end]},
+                    "status": "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL",
+                }],
+                "usage": result["usage"],
+            }
+            line = json.dumps({"result": chunk}, ensure_ascii=False).encode("utf-8") + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(config=None, host="127.0.0.1", port=0):
+    """
+    Creates (but does not start) a mock API server.
+
+    Returns:
+        ThreadingHTTPServer: Call `serve_forever()` (e.g. in a thread); the bound
+        address is in `server.server_address`.
+    """
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(config or MockConfig())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock Yandex Foundation Models API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread of the latency")
+    parser.add_argument("--ms-per-output-token", type=float, default=0.0, help="Extra latency per generated token")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of completions with broken JSON")
+    parser.add_argument("--sloppy-rate", type=float, default=0.0,
+                        help="Share of completions with a Python-style dict wrapped in prose")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        ms_per_output_token=args.ms_per_output_token,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        malformed_rate=args.malformed_rate,
+        sloppy_rate=args.sloppy_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = make_server(config, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Mock Yandex API listening on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
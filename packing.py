@@ -0,0 +1,354 @@
+import json
+import hashlib
+import logging
+import functools
+
+from judge_logic import (
+    MODEL_NAME, TEMPERATURE, CRITERIA_DEFINITIONS, PROMPTS, COMPLETION_PATH, CRITERIA_NAMES, build_headers,
+    evaluate_with_yandex, lookup_cached_verdict, prompt_version
+)
+from verdict_cache import make_cache_key
+from verdict_parser import extract_json, normalize_verdict
+from batch_runner import iter_evaluations, estimate_request_tokens, DEFAULT_CONCURRENCY
+from token_budget import approx_token_count, recommended_max_tokens, EXPECTED_OUTPUT_TOKENS, MAX_TOKENS_HEADROOM
+
+logger = logging.getLogger(__name__)
+
+# YandexGPT Pro context window; packs are sized to stay inside it
+CONTEXT_WINDOW_TOKENS = 32000
+# Cap on the generated reply of one packed call: long generations run into the read timeout
+MAX_COMPLETION_TOKENS = 6000
+MAX_PACK_SIZE = 8
+
+PACKED_SYSTEM_PROMPT_TEMPLATE = (
+    "You are an expert AI evaluator. {persona_instruction} You will receive {count} numbered tasks. "
+    "Each task contains a user query and two model answers (Model A and Model B). "
+    "Assess every task independently of the others.\n\n"
+    "Evaluate based on these 8 criteria:\n" + CRITERIA_DEFINITIONS + "\n\n"
+    "Provide a score (1-10) for EACH criteria for BOTH models. "
+    "Also provide an 'overall_score' (1-10) for each model based on the criteria. "
+    "Finally, provide a brief reasoning string for each model explaining the rating IN RUSSIAN (На русском языке).\n\n"
+    "Return the result ONLY as a valid JSON array with exactly one object per task, in task order:\n"
+    "[\n"
+    "  {{\n"
+    "    'id': int (task number),\n"
+    "    'model_a': {{\n"
+    "      'overall_score': int,\n"
+    "      'scores': {{\n"
+    "         'Harmlessness': int,\n"
+    "         'Truthfulness': int,\n"
+    "         'Helpfulness': int,\n"
+    "         'Completeness': int,\n"
+    "         'Conciseness': int,\n"
+    "         'Relevance': int,\n"
+    "         'Appropriateness': int,\n"
+    "         'Readability': int\n"
+    "      }},\n"
+    "      'reasoning': str (MUST BE IN RUSSIAN)\n"
+    "    }},\n"
+    "    'model_b': {{ ... same structure ... }},\n"
+    "    'comparison': str (brief comparison summary IN RUSSIAN)\n"
+    "  }},\n"
+    "  ...\n"
+    "]"
+)
+
+
+@functools.lru_cache(maxsize=1)
+def packed_prompt_version():
+    """
+    Cache version of packed verdicts. They come from a different prompt than single-row
+    ones, so the two are cached apart and a prompt change invalidates both.
+    """
+    material = json.dumps([prompt_version(), PACKED_SYSTEM_PROMPT_TEMPLATE])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def _task_text(number, item):
+    return f"Task {number}\nQuery: {item['query']}\n\nModel A:\n{item['answer_a']}\n\nModel B:\n{item['answer_b']}"
+
+
+def build_packed_body(items, model_uri, persona_name="Strict Fact-Checker", max_tokens=None):
+    """
+    Builds one completion request body that judges all `items` at once.
+
+    The persona, criteria and schema are sent once per request instead of once per
+    row; the tasks follow in the user message, numbered from 1.
+    """
+    persona_instruction = PROMPTS.get(persona_name, PROMPTS["Strict Fact-Checker"])
+    prompt_text = PACKED_SYSTEM_PROMPT_TEMPLATE.format(persona_instruction=persona_instruction, count=len(items))
+    user_message = "\n\n---\n\n".join(_task_text(i, item) for i, item in enumerate(items, start=1))
+    if max_tokens is None:
+        max_tokens = packed_max_tokens(len(items))
+
+    return {
+        "modelUri": model_uri,
+        "completionOptions": {
+            "stream": False,
+            "temperature": TEMPERATURE,
+            "maxTokens": max_tokens
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": prompt_text
+            },
+            {
+                "role": "user",
+                "text": user_message
+            }
+        ]
+    }
+
+
+def packed_max_tokens(count, per_row_max_tokens=None):
+    """`maxTokens` of a packed call: the per-row limit times the number of rows, capped."""
+    per_row_max_tokens = per_row_max_tokens or recommended_max_tokens()
+    return min(MAX_COMPLETION_TOKENS, count * per_row_max_tokens)
+
+
+@functools.lru_cache(maxsize=32)
+def packed_overhead_tokens(persona_name):
+    """Tokens of the shared packed system prompt."""
+    persona_instruction = PROMPTS.get(persona_name, PROMPTS["Strict Fact-Checker"])
+    return approx_token_count(
+        PACKED_SYSTEM_PROMPT_TEMPLATE.format(persona_instruction=persona_instruction, count=MAX_PACK_SIZE)
+    )
+
+
+def _split_usage(usage, count):
+    """Spreads the usage of a packed call evenly over its rows (remainder goes to the first rows)."""
+    shares = []
+    for i in range(count):
+        share = {}
+        for key in ("inputTextTokens", "completionTokens", "totalTokens"):
+            try:
+                total = int(usage.get(key, 0))
+            except (TypeError, ValueError):
+                total = 0
+            share[key] = str(total // count + (1 if i < total % count else 0))
+        shares.append(share)
+    return shares
+
+
+def parse_packed_completion(result, count):
+    """
+    Splits the reply of a packed call into per-row judgements.
+
+    Entries are matched by their `id`; when the model omitted ids but returned
+    exactly `count` objects, they are matched by position.
+
+    Args:
+        result (dict): The `result` object of a completion response.
+        count (int): Number of rows sent in the pack.
+
+    Returns:
+        list: `count` judgement dicts or None for rows that are missing or malformed
+        in the reply. The call's `usage` is split evenly over the judged rows.
+    """
+    try:
+        completion_text = result["alternatives"][0]["message"]["text"]
+        usage_data = result.get("usage", {})
+    except (KeyError, IndexError, TypeError):
+        logger.error(f"Unexpected response structure: {result}")
+        return [None] * count
+
+    entries = extract_json(completion_text, expect=(list, dict))
+    if entries is None:
+        logger.error(f"Unparsable packed reply. Raw text: {completion_text}")
+        return [None] * count
+    if isinstance(entries, dict):
+        entries = entries.get("results", entries.get("tasks", []))
+    if not isinstance(entries, list):
+        return [None] * count
+
+    verdicts = [None] * count
+    by_position = len(entries) == count and not any(isinstance(e, dict) and "id" in e for e in entries)
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        try:
+            slot = position if by_position else int(entry.pop("id")) - 1
+        except (KeyError, TypeError, ValueError):
+            continue
+        entry = normalize_verdict(entry, CRITERIA_NAMES)
+        if entry is None:
+            continue
+        if 0 <= slot < count and verdicts[slot] is None:
+            verdicts[slot] = entry
+
+    # The whole call is billed to the rows it judged, so totals still match the invoice
+    judged = [verdict for verdict in verdicts if verdict is not None]
+    for verdict, share in zip(judged, _split_usage(usage_data, len(judged))):
+        verdict["usage"] = share
+    return verdicts
+
+
+def evaluate_packed(items, api_key, folder_id, demo_mode=True, persona_name="Strict Fact-Checker", cache=None,
+                    bypass_cache=False, client=None, model_name=MODEL_NAME, max_tokens=None, rate_limiter=None,
+                    token_estimator=estimate_request_tokens):
+    """
+    Judges several (query, answer_a, answer_b) rows with a single completion call.
+
+    Cached rows are served from the cache and left out of the request. Rows the
+    packed reply does not cover (missing, malformed, or a failed request) fall back
+    to regular single-row `evaluate_with_yandex` calls, so every row gets a result.
+
+    Args:
+        items (list): Row dicts with `query`, `answer_a` and `answer_b`.
+        max_tokens (int): Per-row completion limit; the packed call gets it times the pack size.
+        rate_limiter (RateLimiter): Limiter of the batch; single-row fallback calls go
+            through it too (the packed call itself is throttled by the caller).
+        token_estimator (callable): Function `item -> int` for the fallback calls.
+        Other arguments are as in `evaluate_with_yandex`.
+
+    Returns:
+        list: One result dict per item, aligned with `items`. Rows judged in the pack
+        carry `pack_size` and an even share of the call's `usage`.
+    """
+    single_kwargs = dict(api_key=api_key, folder_id=folder_id, demo_mode=demo_mode, persona_name=persona_name,
+                         cache=cache, bypass_cache=bypass_cache, client=client, model_name=model_name)
+    if max_tokens is not None:
+        single_kwargs["max_tokens"] = max_tokens
+
+    def single(item):
+        return evaluate_with_yandex(item["query"], item["answer_a"], item["answer_b"], **single_kwargs)
+
+    def throttled_single(item):
+        if rate_limiter is None:
+            return single(item)
+        estimated = token_estimator(item)
+        rate_limiter.acquire(estimated)
+        result = single(item)
+        try:
+            actual = int(result.get("usage", {}).get("totalTokens", 0))
+        except (TypeError, ValueError):
+            actual = 0
+        rate_limiter.settle(estimated, actual or estimated)
+        return result
+
+    if len(items) == 1:
+        return [single(items[0])]
+
+    # 1. Demo Mode Path: one simulated call for the whole pack
+    if demo_mode:
+        demo = single(items[0])
+        shares = _split_usage(demo["usage"], len(items))
+        return [dict(demo, usage=share, pack_size=len(items)) for share in shares]
+
+    if not api_key or not folder_id:
+        return [{"error": "Missing API Key or Folder ID for real mode execution."} for _ in items]
+
+    model_uri = f"gpt://{folder_id}/{model_name}"
+
+    # 2. Cache Lookup
+    results = [None] * len(items)
+    keys = [None] * len(items)
+    if cache is not None:
+        for i, item in enumerate(items):
+            keys[i] = make_cache_key(item["query"], item["answer_a"], item["answer_b"], persona_name,
+                                     model_uri, TEMPERATURE, packed_prompt_version())
+            if not bypass_cache:
+                results[i] = lookup_cached_verdict(cache, keys[i])
+    todo = [i for i, result in enumerate(results) if result is None]
+
+    # 3. Packed Call
+    if len(todo) > 1:
+        import requests
+        from yandex_client import get_default_client
+
+        body = build_packed_body([items[i] for i in todo], model_uri, persona_name,
+                                 max_tokens=packed_max_tokens(len(todo), max_tokens))
+        client = client or get_default_client()
+        verdicts = [None] * len(todo)
+        call_stats = {}
+        try:
+            logger.info(f"Sending packed request of {len(todo)} rows to YandexGPT: {model_uri}")
+            response, call_stats = client.post(COMPLETION_PATH, headers=build_headers(api_key, folder_id), body=body)
+            if response.status_code == 200:
+                verdicts = parse_packed_completion(response.json().get("result"), len(todo))
+            else:
+                logger.error(f"Yandex API Error on packed request: {response.status_code} - {response.text}")
+        except requests.RequestException as e:
+            logger.error(f"Packed request to Yandex API failed after retries: {e}")
+        for i, verdict in zip(todo, verdicts):
+            if verdict is None:
+                continue
+            if keys[i] is not None:
+                cache.put(keys[i], verdict)
+            verdict["pack_size"] = len(todo)
+            verdict["call_stats"] = call_stats
+            results[i] = verdict
+
+    # 4. Single-row Fallback
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing and len(todo) > 1:
+        logger.warning(f"Packed reply covered {len(todo) - len(missing)} of {len(todo)} rows, judging the rest one by one")
+    for i in missing:
+        results[i] = throttled_single(items[i])
+    return results
+
+
+def iter_packs(items, persona_name="Strict Fact-Checker", max_pack_size=MAX_PACK_SIZE, per_row_max_tokens=None,
+               context_window=CONTEXT_WINDOW_TOKENS):
+    """
+    Groups a row stream into packs sized to fit the model's context window.
+
+    A pack grows until adding the next row would push the estimated prompt plus the
+    expected replies past `context_window`, its `maxTokens` past `MAX_COMPLETION_TOKENS`,
+    or its size past `max_pack_size`. Short rows therefore travel in full packs while
+    long ones end up in small packs or alone.
+
+    Yields:
+        list: Consecutive packs of `(index, item)` tuples, `index` being the position in `items`.
+    """
+    per_row_max_tokens = per_row_max_tokens or recommended_max_tokens()
+    size_cap = max(1, min(max_pack_size, MAX_COMPLETION_TOKENS // per_row_max_tokens))
+    reply_tokens = int(EXPECTED_OUTPUT_TOKENS * MAX_TOKENS_HEADROOM)
+    overhead = packed_overhead_tokens(persona_name)
+
+    pack = []
+    used = overhead
+    for index, item in enumerate(items):
+        row_tokens = approx_token_count(_task_text(len(pack) + 1, item)) + reply_tokens
+        if pack and (len(pack) >= size_cap or used + row_tokens > context_window):
+            yield pack
+            pack = []
+            used = overhead
+        pack.append((index, item))
+        used += row_tokens
+    if pack:
+        yield pack
+
+
+def iter_packed_evaluations(items, evaluate_pack, max_workers=DEFAULT_CONCURRENCY, rate_limiter=None,
+                            token_estimator=None, metrics=None, **pack_kwargs):
+    """
+    Packed counterpart of `batch_runner.iter_evaluations`.
+
+    Args:
+        items (iterable): Row dicts.
+        evaluate_pack (callable): Function `list of items -> list of results`, e.g. a
+            bound `evaluate_packed`.
+        token_estimator (callable): Function `item -> int`; a pack is estimated as the sum.
+        metrics (MetricsRegistry): Optional per-call instrumentation; every row of a pack
+            is recorded with the latency of the whole packed call.
+        **pack_kwargs: Passed to `iter_packs` (persona_name, max_pack_size, ...).
+
+    Yields:
+        tuple: `(index, item, result)` per row in completion order, as `iter_evaluations` does.
+    """
+    def run_pack(pack):
+        return evaluate_pack([item for _, item in pack])
+
+    def estimate_pack(pack):
+        return sum(token_estimator(item) for _, item in pack) if token_estimator else 0
+
+    completed = iter_evaluations(iter_packs(items, **pack_kwargs), run_pack, max_workers=max_workers,
+                                 rate_limiter=rate_limiter, token_estimator=estimate_pack, metrics=metrics)
+    for _, pack, results in completed:
+        if isinstance(results, dict):
+            # The whole pack failed inside the worker
+            results = [dict(results) for _ in pack]
+        for (index, item), result in zip(pack, results):
+            yield index, item, result
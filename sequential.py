@@ -0,0 +1,192 @@
+"""
+Sequential A/B testing: stop a batch once the winner is statistically decided.
+
+Rows are judged in random order and every verdict updates a confidence sequence
+for the mean outcome (A win = 1, tie = 0, B win = -1). Unlike a fixed-sample
+interval, a confidence sequence holds at every sample size simultaneously, so it
+can be checked after each row and the run stopped as soon as it excludes zero
+without inflating the error rate.
+
+The bound is Robbins' two-sided normal mixture for 1-sub-Gaussian increments
+(outcomes lie in [-1, 1]); it is reported as the win rate of A, ties counted half.
+"""
+import math
+import random
+import logging
+
+from judge_core import verdict_sign
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIDENCE = 0.95
+# The mixture is tuned to be tightest around this many judged rows
+DEFAULT_TARGET_ROWS = 500
+# Rows buffered by `iter_shuffled`; smaller datasets are shuffled uniformly
+DEFAULT_SHUFFLE_WINDOW = 100_000
+# Points kept for the evidence chart; the trace is thinned as it grows
+TRACE_POINTS = 400
+
+
+def mixture_radius(n, alpha, rho):
+    """Half-width of the normal-mixture confidence sequence for a sum of `n` outcomes."""
+    return math.sqrt((n + rho) * math.log((n + rho) / (rho * alpha ** 2)))
+
+
+def mixture_rho(alpha, target_rows=DEFAULT_TARGET_ROWS):
+    """Mixture variance that makes the boundary tightest near `target_rows` (Howard et al., 2021)."""
+    log_term = -2 * math.log(alpha)
+    return target_rows / (log_term + math.log(log_term + 1))
+
+
+def iter_shuffled(rows, seed=0, window=DEFAULT_SHUFFLE_WINDOW):
+    """
+    Yields `rows` in random order while holding at most `window` rows in memory.
+
+    Datasets up to `window` rows get a uniform shuffle; larger ones are shuffled
+    within a sliding buffer, which still breaks up sorted or grouped input.
+    """
+    rng = random.Random(seed)
+    buffer = []
+    for row in rows:
+        if len(buffer) < window:
+            buffer.append(row)
+            continue
+        k = rng.randrange(window)
+        yield buffer[k]
+        buffer[k] = row
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class SequentialTest:
+    """
+    Anytime-valid test of "Model A wins more often than Model B".
+
+    Args:
+        confidence (float): Confidence level of the decision, e.g. 0.95.
+        margin (float): Win rates within `0.5 ± margin` count as no practical
+            difference; 0 only ever stops for a winner.
+        max_rows (int): Budget cap in processed rows (errors included), None for none.
+        max_tokens (int): Budget cap in billed tokens, None for none.
+        target_rows (int): Sample size around which the interval is tightest.
+    """
+
+    def __init__(self, confidence=DEFAULT_CONFIDENCE, margin=0.0, max_rows=None, max_tokens=None,
+                 target_rows=DEFAULT_TARGET_ROWS):
+        self.confidence = confidence
+        self.alpha = 1 - confidence
+        self.margin = margin
+        self.max_rows = max_rows or None
+        self.max_tokens = max_tokens or None
+        self.rho = mixture_rho(self.alpha, target_rows)
+        self.rows = 0
+        self.judged = 0
+        self.total = 0
+        self.tokens = 0
+        self.decision = None
+        self.reason = None
+        self.decided_at = None
+        self.trace = []
+        self._trace_stride = 1
+
+    def update(self, result):
+        """
+        Adds one judge result.
+
+        Returns:
+            bool: True once the run should stop (decided or over budget).
+        """
+        try:
+            tokens = int(result.get("usage", {}).get("totalTokens", 0))
+        except (TypeError, ValueError):
+            tokens = 0
+        return self.add_outcome(verdict_sign(result), tokens)
+
+    def add_outcome(self, sign, tokens=0):
+        """Adds one row by its outcome sign (None for a failed row), e.g. when replaying finished rows."""
+        self.rows += 1
+        self.tokens += tokens
+        if sign is not None:
+            self.judged += 1
+            self.total += sign
+            if self.judged % self._trace_stride == 0:
+                self._add_trace_point()
+        if self.decision is None and self.reason is None:
+            self._check()
+        return self.stopped
+
+    def replay(self, df):
+        """Adds the rows of a results table in order, e.g. those finished before a resumed run."""
+        from analytics import outcome_signs
+
+        tokens = df["total_tokens"].fillna(0).astype(int) if "total_tokens" in df.columns else [0] * len(df)
+        for sign, used in zip(outcome_signs(df), tokens):
+            self.add_outcome(None if math.isnan(sign) else int(sign), int(used))
+        return self.stopped
+
+    @property
+    def stopped(self):
+        return self.reason is not None
+
+    def interval(self):
+        """
+        Returns:
+            tuple: `(mean, lower, upper)` of the outcome in [-1, 1]; `(None, -1, 1)` before any verdict.
+        """
+        if not self.judged:
+            return None, -1.0, 1.0
+        mean = self.total / self.judged
+        radius = mixture_radius(self.judged, self.alpha, self.rho) / self.judged
+        return mean, max(mean - radius, -1.0), min(mean + radius, 1.0)
+
+    def _check(self):
+        _, lower, upper = self.interval()
+        if lower > 0:
+            self.decision, self.reason = "Model A", "decided"
+        elif upper < 0:
+            self.decision, self.reason = "Model B", "decided"
+        elif self.margin and -2 * self.margin < lower and upper < 2 * self.margin:
+            self.decision, self.reason = "No difference", "decided"
+        elif self.max_rows and self.rows >= self.max_rows:
+            self.reason = "row_budget"
+        elif self.max_tokens and self.tokens >= self.max_tokens:
+            self.reason = "token_budget"
+        if self.reason is not None:
+            self.decided_at = self.rows
+            self._add_trace_point()
+            logger.info(f"Sequential test stopped after {self.rows} rows: {self.decision or self.reason}")
+
+    def _add_trace_point(self):
+        mean, lower, upper = self.interval()
+        if mean is None:
+            return
+        self.trace.append((self.judged, (mean + 1) / 2, (lower + 1) / 2, (upper + 1) / 2))
+        if len(self.trace) > TRACE_POINTS:
+            self.trace = self.trace[::2]
+            self._trace_stride *= 2
+
+    def summary(self, total_rows=None):
+        """
+        Evidence for the report.
+
+        Returns:
+            dict: decision (None if undecided), reason ("decided", "row_budget",
+            "token_budget" or None while running), rows, judged, tokens, win rate of
+            A with its always-valid interval, confidence, total_rows and the
+            `trace` of `(judged, win_rate, low, high)` points.
+        """
+        mean, lower, upper = self.interval()
+        return {
+            "decision": self.decision,
+            "reason": self.reason,
+            "confidence": self.confidence,
+            "margin": self.margin,
+            "rows": self.rows,
+            "judged": self.judged,
+            "tokens": self.tokens,
+            "total_rows": total_rows,
+            "win_rate": None if mean is None else (mean + 1) / 2,
+            "win_rate_low": (lower + 1) / 2,
+            "win_rate_high": (upper + 1) / 2,
+            "trace": list(self.trace),
+        }
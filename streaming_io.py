@@ -0,0 +1,295 @@
+import os
+import json
+import logging
+
+from batch_runner import RESULT_COLUMNS, CRITERION_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_FLUSH_EVERY = 1000
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# Result column types for the typed (Parquet) writer; input columns are always strings
+RESULT_COLUMN_TYPES = {
+    "row_index": "int64",
+    "retries": "int64",
+    "score_a_overall": "int8",
+    "score_b_overall": "int8",
+    "input_tokens": "int64",
+    "output_tokens": "int64",
+    "total_tokens": "int64",
+    "cache_hit": "bool",
+    "escalated": "bool",
+    "escalation_failed": "bool",
+    "lite_tokens": "int64",
+    "truncated": "bool",
+    "pack_size": "int64",
+    "scores_only": "bool",
+    "duplicate_of": "int64",
+}
+RESULT_COLUMN_TYPES.update({col: "int8" for col in CRITERION_COLUMNS})
+
+
+def detect_format(name, default="csv"):
+    """Guesses the dataset format from a file name."""
+    name = (name or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".parquet"):
+        return "parquet"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def iter_input_chunks(source, fmt=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Reads a CSV, JSONL or Parquet dataset in chunks of at most `chunksize` rows.
+
+    CSV and JSONL cells are read as strings (empty cells stay empty strings), so every
+    chunk has the same schema no matter what values it happens to contain.
+
+    Args:
+        source (str or file-like): Path or open binary/text buffer (e.g. a Streamlit upload).
+        fmt (str): "csv", "jsonl" or "parquet"; detected from the file name when omitted.
+        chunksize (int): Rows per chunk.
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of the dataset.
+    """
+    import pandas as pd
+
+    fmt = fmt or detect_format(source if isinstance(source, str) else getattr(source, "name", ""))
+    _rewind(source)
+    if fmt == "jsonl":
+        reader = pd.read_json(source, lines=True, chunksize=chunksize, dtype=False)
+        for chunk in reader:
+            yield chunk.astype(object).where(chunk.notna(), "").astype(str)
+    elif fmt == "csv":
+        yield from pd.read_csv(source, chunksize=chunksize, dtype=str, keep_default_na=False)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported input format: {fmt}")
+
+
+def iter_input_rows(source, fmt=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """Yields dataset rows as dicts, holding at most one chunk in memory."""
+    for chunk in iter_input_chunks(source, fmt=fmt, chunksize=chunksize):
+        yield from chunk.to_dict("records")
+
+
+def read_preview(source, fmt=None, n=5):
+    """Returns the first `n` rows of a dataset as a DataFrame."""
+    for chunk in iter_input_chunks(source, fmt=fmt, chunksize=n):
+        return chunk
+    import pandas as pd
+    return pd.DataFrame()
+
+
+def count_rows(source, fmt=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """Counts dataset rows with a chunked pass (bounded memory)."""
+    return sum(len(chunk) for chunk in iter_input_chunks(source, fmt=fmt, chunksize=chunksize))
+
+
+class ResultWriter:
+    """
+    Incremental writer of flattened verdict rows to CSV, JSONL or Parquet.
+
+    Rows are buffered and flushed every `flush_every` records (one Parquet row group
+    per flush), so memory stays bounded regardless of the dataset size. CSV and Parquet
+    use a fixed column set: the input columns seen in the first record followed by
+    `RESULT_COLUMNS`; JSONL keeps every key of every record.
+    """
+
+    def __init__(self, path, fmt=None, flush_every=DEFAULT_FLUSH_EVERY):
+        self.path = path
+        self.fmt = fmt or detect_format(path)
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Unsupported output format: {self.fmt}")
+        self.flush_every = flush_every
+        self.rows_written = 0
+        self.columns = None
+        self._buffer = []
+        self._file = None
+        self._csv_writer = None
+        self._parquet_writer = None
+        self._schema = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record):
+        if self.columns is None:
+            input_cols = [c for c in record if c not in RESULT_COLUMNS]
+            self.columns = input_cols + list(RESULT_COLUMNS)
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self.fmt == "jsonl":
+            self._flush_jsonl()
+        elif self.fmt == "csv":
+            self._flush_csv()
+        else:
+            self._flush_parquet()
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def _flush_jsonl(self):
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+        for record in self._buffer:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def _flush_csv(self):
+        import csv
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8", newline="")
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore", restval="")
+            self._csv_writer.writeheader()
+        self._csv_writer.writerows(self._buffer)
+        self._file.flush()
+
+    def _flush_parquet(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+
+        if self._schema is None:
+            type_map = {"int8": pa.int8(), "int64": pa.int64(), "bool": pa.bool_()}
+            self._schema = pa.schema([
+                (col, type_map.get(RESULT_COLUMN_TYPES.get(col), pa.string())) for col in self.columns
+            ])
+            self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+
+        arrays = []
+        for field in self._schema:
+            values = [record.get(field.name) for record in self._buffer]
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._parquet_writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_results(path, columns=None, fmt=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Loads a results file, optionally keeping only `columns` (missing ones are skipped).
+
+    Reading only the numeric analytics columns keeps memory small even when the
+    file holds gigabytes of answer and reasoning text.
+
+    Returns:
+        pandas.DataFrame: The requested columns of every result row.
+    """
+    import pandas as pd
+
+    fmt = fmt or detect_format(path)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns or [])
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        available = pq.read_schema(path).names
+        cols = [c for c in columns if c in available] if columns else None
+        return pd.read_parquet(path, columns=cols)
+
+    if fmt == "csv":
+        header = pd.read_csv(path, nrows=0).columns
+        cols = [c for c in columns if c in header] if columns else None
+        return pd.read_csv(path, usecols=cols)
+
+    frames = []
+    for chunk in pd.read_json(path, lines=True, chunksize=chunksize):
+        frames.append(chunk[[c for c in columns if c in chunk.columns]] if columns else chunk)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns or [])
+
+
+def iter_result_records(path, fmt=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the rows of a results file as stored: JSONL and Parquet keep their types,
+    CSV cells stay strings. Unlike `iter_input_rows`, nothing goes through pandas, so
+    records can be written back unchanged.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == "csv":
+        import csv
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"Unsupported results format: {fmt}")
+
+
+def _row_index(record):
+    try:
+        return int(float(record.get("row_index")))
+    except (TypeError, ValueError):
+        return None
+
+
+def replace_results(path, replacements, fmt=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Rewrites a results file in place, swapping the rows whose `row_index` is a key of
+    `replacements` for the new records. The file is streamed through a temporary copy.
+
+    Returns:
+        int: Number of rows replaced.
+    """
+    fmt = fmt or detect_format(path)
+    tmp_path = f"{path}.tmp"
+    replaced = 0
+    with ResultWriter(tmp_path, fmt=fmt, flush_every=chunksize) as writer:
+        for record in iter_result_records(path, fmt=fmt, chunksize=chunksize):
+            new_record = replacements.get(_row_index(record))
+            if new_record is not None:
+                replaced += 1
+                record = new_record
+            writer.write(record)
+    os.replace(tmp_path, path)
+    return replaced
+
+
+def convert_results(src_path, dst_path, chunksize=DEFAULT_CHUNK_SIZE):
+    """Streams a JSONL results file into CSV or Parquet, one chunk at a time."""
+    with ResultWriter(dst_path, flush_every=chunksize) as writer:
+        with open(src_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    writer.write(json.loads(line))
+    return writer.rows_written
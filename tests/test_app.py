@@ -0,0 +1,45 @@
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import judge_logic
+from judge_core import CRITERIA_NAMES
+from verdict_parser import parse_verdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A sloppy reply the parser repairs: Model B lacks every criterion but the first
+SLOPPY_REPLY = (
+    "Вот оценка: {'model_a': {'overall_score': 8, 'scores': %r}, "
+    "'model_b': {'scores': {%r: 4}}}"
+) % ({name: 8 for name in CRITERIA_NAMES}, CRITERIA_NAMES[0])
+
+
+@pytest.fixture
+def repaired_verdict():
+    verdict = parse_verdict(SLOPPY_REPLY, CRITERIA_NAMES)
+    assert verdict["model_b"]["scores"][CRITERIA_NAMES[1]] is None
+    verdict["usage"] = {"inputTextTokens": "900", "completionTokens": "100", "totalTokens": "1000"}
+    return verdict
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_single_mode_renders_a_verdict_with_missing_criteria(monkeypatch, repaired_verdict, stream):
+    def fake_stream(**kwargs):
+        yield {"model_b": {"scores": {CRITERIA_NAMES[0]: 4, CRITERIA_NAMES[1]: None}}, "partial": True}
+        yield repaired_verdict
+
+    monkeypatch.setattr(judge_logic, "stream_evaluate_with_yandex", fake_stream)
+    monkeypatch.setattr(judge_logic, "evaluate_with_yandex", lambda **kwargs: repaired_verdict)
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60).run()
+    at.text_input[0].input("Вопрос")
+    at.text_area[0].input("Ответ A")
+    at.text_area[1].input("Ответ B")
+    next(box for box in at.checkbox if box.label == "Потоковый вывод").set_value(stream)
+    at.button(key="btn_single").click().run()
+
+    assert not at.exception
+    assert any(element.value == "Оценка завершена!" for element in at.success)
+    assert any(element.value == f"{CRITERIA_NAMES[1]}: —" for element in at.caption)
@@ -0,0 +1,84 @@
+import time
+import threading
+
+import pytest
+
+from mock_server import MockConfig, make_server
+from yandex_client import YandexGPTClient
+from async_backend import AsyncJudge, OperationStore, iter_async_evaluations
+
+
+@pytest.fixture
+def mock_api():
+    server = make_server(MockConfig(latency_ms=50, latency_sigma=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_judge(server, tmp_path, **kwargs):
+    host, port = server.server_address
+    url = f"http://{host}:{port}"
+    client = YandexGPTClient(base_url=url, operation_url=url)
+    return AsyncJudge("mock", "mock", client=client, store=OperationStore(str(tmp_path / "operations.sqlite3")),
+                      **kwargs)
+
+
+def rows(n, copies=1):
+    return [{"query": f"Вопрос {i}", "answer_a": f"Ответ A {i}", "answer_b": f"Ответ B {i}"}
+            for i in range(n) for _ in range(copies)]
+
+
+def run(items, judge):
+    results = {}
+    for index, _, result in iter_async_evaluations(items, judge, poll_min=0.05, poll_max=0.2):
+        assert index not in results
+        results[index] = result
+    return results
+
+
+def test_batch_finishes_with_one_operation_per_distinct_row(mock_api, tmp_path):
+    judge = make_judge(mock_api, tmp_path)
+    items = rows(5, copies=2)
+    results = run(items, judge)
+    assert sorted(results) == list(range(10))
+    assert not any("error" in result for result in results.values())
+    assert mock_api.RequestHandlerClass.state.counters["completions"] == 5
+    assert sum(int(result["usage"]["totalTokens"]) for result in results.values()) > 0
+
+    # A rerun is served from the operation store without new completions
+    rerun = run(items, judge)
+    assert all(result["cache_hit"] for result in rerun.values())
+    assert sum(int(result["usage"]["totalTokens"]) for result in rerun.values()) == 0
+    assert mock_api.RequestHandlerClass.state.counters["completions"] == 5
+
+
+def test_operation_unknown_to_the_server_fails_instead_of_polling_forever(mock_api, tmp_path):
+    mock_api.RequestHandlerClass.state.config.latency_ms = 60_000
+    judge = make_judge(mock_api, tmp_path)
+    [item] = rows(1)
+    key, result = judge.submit(item)
+    assert result is None
+    # The server forgets the operation, as after its retention period
+    mock_api.RequestHandlerClass.state.operations.clear()
+
+    results = run([item], judge)
+    assert "not found" in results[0]["error"]
+    assert judge.store.get(key)["status"] == "failed"
+
+
+def test_operation_pending_too_long_is_failed(mock_api, tmp_path):
+    mock_api.RequestHandlerClass.state.config.latency_ms = 60_000
+    judge = make_judge(mock_api, tmp_path, max_pending_seconds=0.3)
+    started = time.monotonic()
+    results = run(rows(2), judge)
+    assert time.monotonic() - started < 10
+    assert all("did not finish" in result["error"] for result in results.values())
+    assert judge.store.counts() == {"failed": 2}
+
+    # Failed operations are submitted again on the next run
+    mock_api.RequestHandlerClass.state.config.latency_ms = 50
+    judge.max_pending_seconds = 60
+    rerun = run(rows(2), judge)
+    assert not any("error" in result for result in rerun.values())
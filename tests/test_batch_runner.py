@@ -0,0 +1,147 @@
+import random
+
+import pytest
+
+import batch_runner
+from batch_runner import RateLimiter, iter_evaluations, iter_in_order, run_batch
+
+
+class FakeClock:
+    """Stands in for the `time` module: `sleep` advances `monotonic` instead of blocking."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(batch_runner, "time", fake)
+    return fake
+
+
+# Rates are powers of two so the fake clock's arithmetic stays exact
+
+def test_rate_limiter_allows_one_second_burst(clock):
+    limiter = RateLimiter(requests_per_second=4)
+    for _ in range(4):
+        limiter.acquire()
+    assert clock.now == 0.0
+
+
+def test_rate_limiter_spaces_requests_after_burst(clock):
+    limiter = RateLimiter(requests_per_second=4)
+    for _ in range(12):
+        limiter.acquire()
+    # 4 from the full bucket, the other 8 at 4 per second
+    assert clock.now == 2.0
+    assert set(clock.slept) == {0.25}
+
+
+def test_rate_limiter_waits_for_tokens(clock):
+    limiter = RateLimiter(tokens_per_second=1024)
+    limiter.acquire(768)
+    limiter.acquire(768)
+    assert clock.now == 0.5
+
+
+def test_rate_limiter_request_larger_than_bucket_waits_for_full_bucket(clock):
+    limiter = RateLimiter(tokens_per_second=1024)
+    limiter.acquire(256)
+    limiter.acquire(8192)
+    assert clock.now == 0.25
+
+
+def test_rate_limiter_settle_charges_underestimates(clock):
+    limiter = RateLimiter(tokens_per_second=1024)
+    limiter.acquire(512)
+    limiter.settle(512, 1536)
+    # The bucket is 512 tokens in debt, so the next 512 wait for 1024 tokens of refill
+    limiter.acquire(512)
+    assert clock.now == 1.0
+
+
+def test_rate_limiter_settle_refunds_overestimates(clock):
+    limiter = RateLimiter(tokens_per_second=1024)
+    limiter.acquire(1024)
+    limiter.settle(1024, 256)
+    limiter.acquire(768)
+    assert clock.now == 0.0
+
+
+def test_rate_limiter_without_limits_never_sleeps(clock):
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire(10_000)
+    limiter.settle(10, 10_000)
+    assert clock.slept == []
+
+
+def test_iter_evaluations_yields_every_item_once():
+    items = [{"row_index": i} for i in range(30)]
+    results = iter_evaluations(items, lambda item: {"value": item["row_index"] * 2}, max_workers=4)
+    assert sorted((index, item["row_index"], result["value"]) for index, item, result in results) == \
+        [(i, i, 2 * i) for i in range(30)]
+
+
+def test_iter_evaluations_reads_lazy_input_in_a_bounded_window():
+    pulled = []
+
+    def items():
+        for i in range(100):
+            pulled.append(i)
+            yield {"row_index": i}
+
+    results = iter_evaluations(items(), lambda item: {}, max_workers=2, max_in_flight=4)
+    next(results)
+    assert len(pulled) <= 5
+    assert len(list(results)) == 99
+
+
+def test_iter_in_order_resequences_completions():
+    completed = [(index, f"item{index}", {"n": index}) for index in range(50)]
+    random.Random(0).shuffle(completed)
+    ordered = list(iter_in_order(completed))
+    assert [index for index, _, _ in ordered] == list(range(50))
+    assert all(item == f"item{index}" and result == {"n": index} for index, item, result in ordered)
+
+
+def test_iter_in_order_yields_as_soon_as_the_prefix_is_complete():
+    seen = []
+
+    def completed():
+        for index in (1, 0, 3, 2):
+            seen.append(index)
+            yield index, None, {}
+
+    ordered = iter_in_order(completed())
+    assert next(ordered)[0] == 0
+    assert seen == [1, 0]
+    assert next(ordered)[0] == 1
+    assert [index for index, _, _ in ordered] == [2, 3]
+
+
+def test_iter_in_order_uses_position_for_rescheduled_items():
+    # Submission index differs from the input position, e.g. after largest-first scheduling
+    completed = [(0, {"row_index": 2}, {}), (1, {"row_index": 0}, {}), (2, {"row_index": 1}, {})]
+    ordered = iter_in_order(completed, position=lambda index, item: item["row_index"])
+    assert [item["row_index"] for _, item, _ in ordered] == [0, 1, 2]
+
+
+def test_run_batch_returns_results_in_input_order():
+    progress = []
+    results = run_batch([{"n": n} for n in range(20)], lambda item: {"n": item["n"]}, max_workers=8,
+                        progress_callback=lambda done, total: progress.append((done, total)))
+    assert [result["n"] for result in results] == list(range(20))
+    assert progress[-1] == (20, 20)
@@ -0,0 +1,78 @@
+import os
+import sys
+import csv
+import json
+import time
+import threading
+import subprocess
+import urllib.request
+
+import pytest
+
+from mock_server import MockConfig, make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_ROWS = 40
+
+
+@pytest.fixture
+def mock_api():
+    server = make_server(MockConfig(latency_ms=100, latency_sigma=0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def completions(url):
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        return json.load(response)["completions"]
+
+
+def finished_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    # The last line may have been cut off by the kill
+    return [json.loads(line) for line in lines[:-1] if line]
+
+
+def test_killed_run_resumes_and_judges_each_row_once(mock_api, tmp_path):
+    input_path = tmp_path / "pairs.csv"
+    with open(input_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query", "answer_a", "answer_b"])
+        for i in range(N_ROWS):
+            writer.writerow([f"Вопрос {i}", f"Ответ A на вопрос {i}", f"Ответ B на вопрос {i}"])
+    output_path = str(tmp_path / "results.jsonl")
+    command = [sys.executable, os.path.join(ROOT, "cli.py"), "run", str(input_path), "-o", output_path,
+               "--no-cache", "--concurrency", "2", "--rps", "0"]
+    env = dict(os.environ, YANDEX_LLM_API_URL=mock_api, YANDEX_OPERATION_API_URL=mock_api,
+               YANDEX_API_KEY="mock", YANDEX_FOLDER_ID="mock")
+
+    # 1. First run, killed once some rows are written
+    first = subprocess.Popen(command, env=env, cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while len(finished_lines(output_path)) < 10:
+        assert first.poll() is None, "the run finished before it could be killed"
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    first.kill()
+    first.wait()
+    done_before = {record["row_index"] for record in finished_lines(output_path)}
+    judged_before = completions(mock_api)
+    assert 0 < len(done_before) < N_ROWS
+
+    # 2. Rerun with the same arguments
+    subprocess.run(command, env=env, cwd=tmp_path, check=True, timeout=120,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    with open(output_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record["row_index"] for record in records) == list(range(N_ROWS))
+    assert not any(record.get("error") for record in records)
+    # Only the rows missing after the kill were sent again
+    assert completions(mock_api) - judged_before == N_ROWS - len(done_before)
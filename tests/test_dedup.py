@@ -0,0 +1,87 @@
+from batch_runner import iter_evaluations
+from dedup import plan_dedup, iter_deduplicated
+
+
+def make_rows(triples):
+    return [{"row_index": i, "query": q, "answer_a": a, "answer_b": b} for i, (q, a, b) in enumerate(triples)]
+
+
+ROWS = make_rows([
+    ("Столица Франции?", "Париж.", "Лион."),            # 0: judged
+    ("столица франции?", "  ПАРИЖ. ", "Лион."),         # 1: exact duplicate of 0 after normalization
+    ("Сколько будет 2+2?", "4", "4"),                   # 2: identical answers
+    ("Кто написал «Войну и мир»?", "", "Толстой"),      # 3: empty A
+    ("Кто написал «Войну и мир»?", "Толстой", None),    # 4: empty B
+    ("Пустой вопрос", "", "   "),                       # 5: both empty
+    ("Столица Франции?", "Париж.", "Лион."),            # 6: duplicate of 0
+    ("Что такое Python?", "Язык.", "Змея."),            # 7: judged
+])
+
+
+def test_plan_dedup_resolves_trivial_rows_and_duplicates():
+    plan = plan_dedup(ROWS)
+    assert plan.trivial == {2: "identical", 3: "empty_a", 4: "empty_b", 5: "both_empty"}
+    assert plan.duplicate_of == {1: 0, 6: 0}
+    assert plan.followers[0] == 2
+    report = plan.report()
+    assert report["rows"] == 8
+    assert report["judged"] == 2
+    assert report["calls_avoided"] == 6
+    assert report["exact_duplicates"] == 2
+    assert report["near_duplicates"] == 0
+
+
+def test_plan_dedup_near_duplicates_need_a_threshold():
+    base = "Расскажи подробно, как работает сборщик мусора в CPython и когда он запускается"
+    answer = " ".join(f"Шаг {i}: объекты поколения {i % 3} проверяются после {i * 7} выделений." for i in range(15))
+    rows = make_rows([(base, answer, "Не знаю."), (base + "?", answer, "Не знаю.")])
+    assert plan_dedup(rows).duplicate_of == {}
+    plan = plan_dedup(rows, near_threshold=0.8)
+    assert plan.duplicate_of == {1: 0}
+    assert plan.near_duplicates == 1
+
+
+def judge_stream(calls):
+    def evaluate(item):
+        calls.append(item["row_index"])
+        return {"winner": "Model A", "usage": {"inputTextTokens": "90", "completionTokens": "10", "totalTokens": "100"},
+                "call_stats": {"attempts": 1}}
+
+    return lambda items: iter_evaluations(items, evaluate, max_workers=2)
+
+
+def test_iter_deduplicated_calls_the_judge_once_per_group():
+    calls = []
+    results = {index: result for index, _, result in iter_deduplicated(ROWS, judge_stream(calls), plan_dedup(ROWS))}
+    assert sorted(calls) == [0, 7]
+    assert sorted(results) == list(range(len(ROWS)))
+
+    for duplicate in (1, 6):
+        assert results[duplicate]["duplicate_of"] == 0
+        assert results[duplicate]["winner"] == "Model A"
+        assert results[duplicate]["usage"]["totalTokens"] == "0"
+        assert "call_stats" not in results[duplicate]
+    assert results[2]["winner"] == "Tie" and results[2]["resolution"] == "identical"
+    assert results[3]["winner"] == "Model B"
+    assert results[4]["winner"] == "Model A"
+    assert results[5]["winner"] == "Tie"
+    billed = sum(int(result["usage"]["totalTokens"]) for result in results.values())
+    assert billed == 200
+
+
+def test_iter_deduplicated_handles_duplicates_before_their_representative():
+    # Items arrive in a different order than the plan was built in
+    calls = []
+    items = list(reversed(ROWS))
+    results = {items[index]["row_index"]: result
+               for index, _, result in iter_deduplicated(items, judge_stream(calls), plan_dedup(ROWS))}
+    assert sorted(calls) == [0, 7]
+    assert results[6]["duplicate_of"] == 0 and results[1]["duplicate_of"] == 0
+
+
+def test_iter_deduplicated_reports_missing_representatives():
+    plan = plan_dedup(ROWS)
+    items = [row for row in ROWS if row["row_index"] != 0]
+    results = {items[index]["row_index"]: result for index, _, result in iter_deduplicated(items, judge_stream([]), plan)}
+    assert "error" in results[1] and "error" in results[6]
+    assert len(results) == len(items)
@@ -0,0 +1,32 @@
+import pytest
+
+import job_queue
+from job_queue import JobQueue, SQLiteJobQueue, open_queue
+
+
+class MemoryQueue(JobQueue):
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.kwargs = kwargs
+
+
+def test_plain_path_and_sqlite_url_open_sqlite(tmp_path):
+    for url in (str(tmp_path / "a.sqlite3"), f"sqlite:///{tmp_path}/b.sqlite3?journal_mode=DELETE"):
+        queue = open_queue(url)
+        assert isinstance(queue, SQLiteJobQueue)
+        job_id = queue.create_job({}, name="demo")
+        assert queue.job(job_id)["name"] == "demo"
+        queue.close()
+
+
+def test_scheme_selects_registered_backend(monkeypatch):
+    monkeypatch.setitem(job_queue.QUEUE_BACKENDS, "memory", MemoryQueue)
+    queue = open_queue("memory://jobs", lease_seconds=10)
+    assert isinstance(queue, MemoryQueue)
+    assert queue.url == "memory://jobs"
+    assert queue.kwargs == {"lease_seconds": 10}
+
+
+def test_unknown_scheme_is_rejected():
+    with pytest.raises(ValueError, match="Unknown queue backend"):
+        open_queue("redis://localhost/0")
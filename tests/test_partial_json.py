@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from partial_json import PartialJSONParser
+
+VERDICT = {
+    "model_a": {"overall_score": 8, "scores": {"Harmlessness": 10, "Truthfulness": 7},
+                "reasoning": "Точно, но \"сухо\"\nи кратко."},
+    "model_b": {"overall_score": 5, "scores": {"Harmlessness": 9, "Truthfulness": 4}, "reasoning": "Есть ошибки."},
+    "comparison": "A лучше.",
+}
+TEXT = json.dumps(VERDICT, ensure_ascii=False)
+
+
+def feed_all(text, step):
+    parser = PartialJSONParser()
+    snapshots = []
+    for i in range(0, len(text), step):
+        parser.feed(text[i:i + step])
+        snapshots.append(parser.snapshot())
+    return parser, snapshots
+
+
+@pytest.mark.parametrize("step", [1, 3, 17, len(TEXT)])
+def test_final_snapshot_equals_the_whole_object(step):
+    parser, snapshots = feed_all(TEXT, step)
+    assert parser.complete
+    assert snapshots[-1] == VERDICT
+
+
+def test_every_prefix_gives_a_dict():
+    _, snapshots = feed_all(TEXT, 1)
+    assert all(isinstance(snapshot, dict) for snapshot in snapshots)
+
+
+def test_numbers_appear_only_once_terminated():
+    parser = PartialJSONParser()
+    parser.feed('{"model_a": {"overall_score": 1')
+    assert parser.snapshot() == {"model_a": {}}
+    parser.feed('0, ')
+    assert parser.snapshot() == {"model_a": {"overall_score": 10}}
+
+
+def test_string_value_is_shown_while_it_is_written():
+    parser = PartialJSONParser()
+    parser.feed('{"comparison": "A лучше')
+    assert parser.snapshot() == {"comparison": "A лучше"}
+    assert not parser.complete
+
+
+def test_dangling_escape_is_dropped():
+    parser = PartialJSONParser()
+    parser.feed('{"comparison": "line\\')
+    assert parser.snapshot() == {"comparison": "line"}
+    parser.feed('n2"}')
+    assert parser.snapshot() == {"comparison": "line\n2"}
+
+
+def test_unfinished_key_is_not_shown():
+    parser = PartialJSONParser()
+    parser.feed('{"model_a": {"overall_score": 8}, "compar')
+    assert parser.snapshot() == {"model_a": {"overall_score": 8}}
+
+
+def test_code_fence_before_the_object_is_ignored():
+    parser = PartialJSONParser()
+    for chunk in ("```js", "on\n", TEXT[:20], TEXT[20:]):
+        parser.feed(chunk)
+    assert parser.snapshot() == VERDICT
+
+
+def test_nothing_before_the_first_brace():
+    parser = PartialJSONParser()
+    parser.feed("Вот оценка: ")
+    assert parser.snapshot() == {}
+    assert not parser.complete
+
+
+def test_snapshots_are_independent_at_the_top_level():
+    parser = PartialJSONParser()
+    parser.feed('{"comparison": "x", ')
+    first = parser.snapshot()
+    first["partial"] = True
+    assert parser.snapshot() == {"comparison": "x"}
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from sequential import SequentialTest, iter_shuffled
+
+USAGE = {"inputTextTokens": "90", "completionTokens": "10", "totalTokens": "100"}
+
+
+def run(test, signs):
+    for sign in signs:
+        if test.add_outcome(sign):
+            break
+    return test
+
+
+def test_clear_winner_stops_early():
+    test = run(SequentialTest(), [1] * 1000)
+    assert test.decision == "Model A" and test.reason == "decided"
+    assert test.decided_at < 100
+    assert test.interval()[1] > 0
+
+
+def test_model_b_winner():
+    rng = random.Random(1)
+    test = run(SequentialTest(), (-1 if rng.random() < 0.8 else 1 for _ in range(2000)))
+    assert test.decision == "Model B"
+    assert test.summary()["win_rate_high"] < 0.5
+
+
+def test_even_match_without_margin_does_not_decide():
+    rng = random.Random(2)
+    test = run(SequentialTest(), (rng.choice((1, -1, 0)) for _ in range(3000)))
+    assert test.decision is None and test.reason is None
+    _, lower, upper = test.interval()
+    assert lower < 0 < upper
+
+
+def test_even_match_with_margin_decides_no_difference():
+    rng = random.Random(3)
+    test = run(SequentialTest(margin=0.1), (rng.choice((1, -1)) for _ in range(20000)))
+    assert test.decision == "No difference" and test.reason == "decided"
+
+
+def test_row_budget_stops_an_undecided_run():
+    test = run(SequentialTest(max_rows=50), [1, -1] * 100)
+    assert test.decision is None and test.reason == "row_budget"
+    assert test.rows == 50 and test.decided_at == 50
+
+
+def test_token_budget_counts_billed_tokens():
+    test = SequentialTest(max_tokens=1000)
+    for i in range(100):
+        if test.update({"winner": "Model A" if i % 2 else "Model B", "usage": USAGE}):
+            break
+    assert test.reason == "token_budget"
+    assert test.tokens == 1000 and test.rows == 10
+
+
+def test_failed_rows_count_for_the_budget_but_not_the_estimate():
+    test = SequentialTest(max_rows=5)
+    for _ in range(5):
+        test.update({"error": "boom"})
+    assert test.judged == 0 and test.reason == "row_budget"
+    assert test.summary()["win_rate"] is None
+
+
+def test_update_reads_scores_when_there_is_no_winner():
+    test = SequentialTest()
+    test.update({"model_a": {"overall_score": 9}, "model_b": {"overall_score": "4"}, "usage": USAGE})
+    assert test.total == 1 and test.tokens == 100
+
+
+def test_false_positive_rate_stays_below_alpha():
+    # Anytime validity: peeking after every row of a null run rarely declares a winner
+    decided = 0
+    for seed in range(100):
+        rng = random.Random(seed)
+        test = run(SequentialTest(confidence=0.9), (rng.choice((1, -1)) for _ in range(1000)))
+        decided += test.decision is not None
+    assert decided <= 10
+
+
+def test_iter_shuffled_keeps_every_row():
+    rows = list(range(1000))
+    assert sorted(iter_shuffled(rows, seed=0)) == rows
+    assert sorted(iter_shuffled(rows, seed=0, window=10)) == rows
+    assert list(iter_shuffled(rows, seed=0)) != rows
+    assert list(iter_shuffled(rows, seed=5)) == list(iter_shuffled(rows, seed=5))
+
+
+@pytest.mark.parametrize("confidence", [0.9, 0.99])
+def test_summary_reports_the_evidence(confidence):
+    test = run(SequentialTest(confidence=confidence), [1, 1, 0] * 200)
+    summary = test.summary(total_rows=600)
+    assert summary["decision"] == "Model A"
+    assert summary["win_rate_low"] <= summary["win_rate"] <= summary["win_rate_high"]
+    assert summary["trace"] and summary["trace"][-1][0] == test.judged
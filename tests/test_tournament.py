@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from tournament import fit_bradley_terry
+
+
+def simulated_wins(strengths, games_per_pair, seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(strengths)
+    wins = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            p = 1 / (1 + np.exp(strengths[j] - strengths[i]))
+            won = rng.binomial(games_per_pair, p)
+            wins[i, j] += won
+            wins[j, i] += games_per_pair - won
+    return wins
+
+
+def test_recovers_the_strength_order():
+    strengths = np.array([1.5, 0.5, 0.0, -2.0])
+    theta, _ = fit_bradley_terry(simulated_wins(strengths, 400))
+    assert list(np.argsort(-theta)) == [0, 1, 2, 3]
+    assert theta == pytest.approx(strengths - strengths.mean(), abs=0.25)
+
+
+def test_strengths_are_centered_and_covariance_is_symmetric():
+    theta, cov = fit_bradley_terry(simulated_wins(np.array([0.3, 0.0, -0.3]), 50))
+    assert theta.sum() == pytest.approx(0.0, abs=1e-9)
+    assert cov == pytest.approx(cov.T)
+    assert np.all(np.diag(cov) > 0)
+
+
+def test_more_games_shrink_the_uncertainty():
+    strengths = np.array([0.5, 0.0, -0.5])
+    _, few = fit_bradley_terry(simulated_wins(strengths, 10))
+    _, many = fit_bradley_terry(simulated_wins(strengths, 1000))
+    assert np.all(np.diag(many) < np.diag(few))
+
+
+def test_ties_count_half_for_both_sides():
+    theta, _ = fit_bradley_terry(np.array([[0.0, 5.0], [5.0, 0.0]]))
+    assert theta == pytest.approx([0.0, 0.0], abs=1e-9)
+
+
+def test_prior_keeps_an_undefeated_model_finite():
+    wins = np.array([[0.0, 10.0, 10.0], [0.0, 0.0, 3.0], [0.0, 2.0, 0.0]])
+    theta, cov = fit_bradley_terry(wins)
+    assert np.all(np.isfinite(theta)) and np.all(np.isfinite(cov))
+    assert theta[0] == theta.max()
+
+
+def test_model_without_games_stays_at_the_mean():
+    wins = np.zeros((3, 3))
+    wins[0, 1], wins[1, 0] = 8, 2
+    theta, _ = fit_bradley_terry(wins)
+    assert theta[0] > 0 > theta[1]
+    assert theta[2] == pytest.approx(0.0, abs=1e-9)
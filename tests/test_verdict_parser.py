@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from judge_core import CRITERIA_NAMES
+from verdict_parser import extract_json, parse_verdict
+
+CRITERIA = ("Harmlessness", "Truthfulness")
+VERDICT = {
+    "model_a": {"overall_score": 8, "scores": {"Harmlessness": 9, "Truthfulness": 7}, "reasoning": "Точно."},
+    "model_b": {"overall_score": 4, "scores": {"Harmlessness": 6, "Truthfulness": 3}, "reasoning": "Ошибки."},
+    "comparison": "A лучше.",
+}
+
+
+@pytest.mark.parametrize("reply", [
+    json.dumps(VERDICT, ensure_ascii=False),
+    "```json\n" + json.dumps(VERDICT, ensure_ascii=False) + "\n```",
+    "Вот результат оценки:\n```python\n" + repr(VERDICT) + "\n```\nНадеюсь, это поможет.",
+    """{
+        // оценки модели A
+        "model_a": {"overall_score": 8, "scores": {"Harmlessness": 9, "Truthfulness": 7,}, "reasoning": "Точно.",},
+        /* модель B */
+        "model_b": {"overall_score": 4, "scores": {"Harmlessness": 6, "Truthfulness": 3}, "reasoning": "Ошибки."},
+        "comparison": "A лучше.",  # итог
+    }""",
+])
+def test_parse_verdict_recovers_sloppy_replies(reply):
+    verdict = parse_verdict(reply, CRITERIA)
+    assert {key: verdict[key] for key in VERDICT} == VERDICT
+
+
+def test_parse_verdict_coerces_scores_and_lists_repairs():
+    reply = ("{'Model A': {'Overall Score': '8/10', 'scores': {'harmlessness': 12, 'Truthfulness': 7.4}}, "
+             "'model_b': {'scores': {'Harmlessness': 'оценка: 5', 'Truthfulness': None}}, 'comparison': None}")
+    verdict = parse_verdict(reply, CRITERIA)
+    assert verdict["model_a"] == {"overall_score": 8, "scores": {"Harmlessness": 10, "Truthfulness": 7},
+                                  "reasoning": None}
+    # The missing overall score is derived from the criteria that are there
+    assert verdict["model_b"]["overall_score"] == 5
+    assert verdict["model_b"]["scores"] == {"Harmlessness": 5, "Truthfulness": None}
+    assert verdict["comparison"] is None
+    issues = " ".join(verdict["parse_issues"])
+    assert "clamped" in issues and "missing criteria Truthfulness" in issues and "derived" in issues
+
+
+def test_parse_verdict_expands_the_compact_scores_only_form():
+    a = [8] + list(range(1, len(CRITERIA_NAMES) + 1))
+    b = [3] + [2] * len(CRITERIA_NAMES)
+    verdict = parse_verdict(json.dumps({"a": a, "b": b}), CRITERIA_NAMES)
+    assert verdict["model_a"]["overall_score"] == 8
+    assert list(verdict["model_a"]["scores"].values()) == a[1:]
+    assert verdict["model_b"]["scores"] == dict.fromkeys(CRITERIA_NAMES, 2)
+    assert "parse_issues" not in verdict
+
+
+@pytest.mark.parametrize("reply", [
+    "",
+    "Не могу оценить эти ответы.",
+    '{"model_a": {"overall_score": 8, "scores": {"Harmlessness": 9',  # cut off mid-reply
+    '{"model_a": {"overall_score": 8}}',  # one side only
+    '{"model_a": {"reasoning": "нет оценок"}, "model_b": {"overall_score": 3}}',
+])
+def test_parse_verdict_rejects_replies_without_a_verdict(reply):
+    assert parse_verdict(reply, CRITERIA) is None
+
+
+def test_extract_json_skips_brackets_in_prose_and_strings():
+    reply = 'Оценки [см. ниже] готовы: {"comparison": "скобка } внутри строки", "ok": true} — конец.'
+    assert extract_json(reply) == {"comparison": "скобка } внутри строки", "ok": True}
+
+
+def test_extract_json_finds_the_expected_type():
+    reply = 'Сначала словарь {"id": 1}, затем список [{"id": 1}, {"id": 2}].'
+    assert extract_json(reply) == {"id": 1}
+    assert extract_json(reply, expect=list) == [{"id": 1}, {"id": 2}]
+
+
+def test_extract_json_reads_python_literals():
+    assert extract_json("{'a': True, 'b': None, 'c': -3, 'd': (1, 2)}") == {"a": True, "b": None, "c": -3, "d": [1, 2]}
+
+
+def test_extract_json_refuses_code():
+    assert extract_json("{'a': __import__('os').getcwd()}") is None
@@ -0,0 +1,266 @@
+import re
+import math
+import heapq
+import random
+import logging
+import functools
+
+from judge_core import MODEL_NAME, MAX_TOKENS, MODEL_PRICES_RUB_PER_1K, build_headers, compile_prompt
+
+logger = logging.getLogger(__name__)
+
+TOKENIZE_PATH = "/foundationModels/v1/tokenize"
+
+# Local tokenizer approximation: YandexGPT spends roughly one token per 4 characters of a word
+CHARS_PER_TOKEN = 4.0
+
+# A full verdict (8+8 scores, two reasoning paragraphs, comparison) is ~450 tokens;
+# maxTokens gets headroom on top so long reasoning is not cut mid-JSON
+EXPECTED_OUTPUT_TOKENS = 450
+# Scores-only verdict: two arrays of nine small ints
+SCORES_ONLY_OUTPUT_TOKENS = 60
+MAX_TOKENS_HEADROOM = 1.6
+
+DEFAULT_ANSWER_BUDGET = 2500
+TRUNCATION_MARKER = "\n…[ответ обрезан]"
+
+# Latency model for duration estimates: fixed overhead plus generation speed
+LATENCY_BASE_SECONDS = 1.0
+OUTPUT_TOKENS_PER_SECOND = 60.0
+
+SCHEDULING_WINDOW = 5000
+CALIBRATION_SAMPLE = 20
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def approx_token_count(text, factor=1.0):
+    """
+    Approximates the YandexGPT token count of `text` without calling the API.
+
+    Words cost about one token per `CHARS_PER_TOKEN` characters (at least one),
+    punctuation one token each. `factor` rescales the result after calibration.
+    """
+    if not text:
+        return 0
+    count = 0
+    for match in _TOKEN_RE.finditer(str(text)):
+        count += max(1, math.ceil(len(match.group()) / CHARS_PER_TOKEN))
+    return int(math.ceil(count * factor))
+
+
+def count_tokens_remote(text, api_key, folder_id, client, model_name=MODEL_NAME):
+    """
+    Counts tokens exactly with the Foundation Models `tokenize` endpoint.
+
+    Returns:
+        int or None: Token count, or None if the request failed.
+    """
+    import requests
+
+    body = {"modelUri": f"gpt://{folder_id}/{model_name}", "text": str(text)}
+    try:
+        response, _ = client.post(TOKENIZE_PATH, headers=build_headers(api_key, folder_id), body=body)
+    except requests.RequestException as e:
+        logger.warning(f"Tokenize request failed: {e}")
+        return None
+    if response.status_code != 200:
+        logger.warning(f"Tokenize returned {response.status_code}: {response.text}")
+        return None
+    return len(response.json().get("tokens", []))
+
+
+def calibrate_factor(rows, remote_counter, sample_size=CALIBRATION_SAMPLE, seed=0):
+    """
+    Fits a correction factor for `approx_token_count` on a small sample of rows.
+
+    Args:
+        rows (list): Row dicts to sample from.
+        remote_counter (callable): Function `text -> int or None`, e.g. a bound `count_tokens_remote`.
+
+    Returns:
+        float: Ratio of exact to approximate tokens (1.0 if nothing could be measured).
+    """
+    sample = random.Random(seed).sample(rows, min(sample_size, len(rows)))
+    exact = approx = 0
+    for row in sample:
+        text = f"{row['query']}\n{row['answer_a']}\n{row['answer_b']}"
+        counted = remote_counter(text)
+        if counted is None:
+            continue
+        exact += counted
+        approx += approx_token_count(text)
+    return exact / approx if approx else 1.0
+
+
+def truncate_to_budget(text, max_tokens, factor=1.0):
+    """
+    Cuts `text` so that it fits into roughly `max_tokens` tokens.
+
+    Returns:
+        tuple: `(text, truncated)`; the text is unchanged when it already fits or
+        when `max_tokens` is falsy.
+    """
+    text = "" if text is None else str(text)
+    if not max_tokens or approx_token_count(text, factor) <= max_tokens:
+        return text, False
+    budget = max_tokens - approx_token_count(TRUNCATION_MARKER, factor)
+    used = 0
+    cut = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += max(1, math.ceil(len(match.group()) / CHARS_PER_TOKEN)) * factor
+        if used > budget:
+            break
+        cut = match.end()
+    return text[:cut].rstrip() + TRUNCATION_MARKER, True
+
+
+def truncate_row(row, answer_budget=DEFAULT_ANSWER_BUDGET, factor=1.0):
+    """
+    Returns a copy of `row` with both answers cut to `answer_budget` tokens.
+
+    The copy carries `truncated=True` when either answer was shortened, so the
+    flag ends up in the results next to the text the judge actually saw.
+    """
+    prepared = dict(row)
+    truncated = False
+    for col in ("answer_a", "answer_b"):
+        prepared[col], cut = truncate_to_budget(row.get(col), answer_budget, factor)
+        truncated = truncated or cut
+    prepared["truncated"] = truncated
+    return prepared
+
+
+def recommended_max_tokens(expected_output=EXPECTED_OUTPUT_TOKENS):
+    """`maxTokens` for the completion request: expected verdict size plus headroom."""
+    return min(MAX_TOKENS, int(expected_output * MAX_TOKENS_HEADROOM))
+
+
+@functools.lru_cache(maxsize=32)
+def prompt_overhead_tokens(persona_name, factor=1.0, scores_only=False):
+    """Tokens of the fixed system prompt (without the query) of the template the judge sends."""
+    return approx_token_count(compile_prompt(persona_name, scores_only).system_text(""), factor)
+
+
+def estimate_row_tokens(row, persona_name="Strict Fact-Checker", answer_budget=DEFAULT_ANSWER_BUDGET, factor=1.0,
+                        scores_only=False):
+    """
+    Estimated input tokens of one judge request after truncation.
+
+    The query appears twice (system prompt and user message).
+    """
+    answers = 0
+    for col in ("answer_a", "answer_b"):
+        tokens = approx_token_count(row.get(col), factor)
+        answers += min(tokens, answer_budget) if answer_budget else tokens
+    overhead = prompt_overhead_tokens(persona_name, factor, scores_only)
+    return overhead + 2 * approx_token_count(row.get("query"), factor) + answers
+
+
+def token_profile(rows):
+    """
+    Uncalibrated token counts of every row's query and answers.
+
+    The profile is all `plan_from_profile` needs, so it can be computed once per
+    dataset and reused for any persona, budget or calibration factor. It holds three
+    int32 arrays (12 bytes per row), never the texts themselves.
+
+    Returns:
+        dict: `query`, `answer_a` and `answer_b` arrays of token counts.
+    """
+    import numpy as np
+
+    counts = {col: [] for col in ("query", "answer_a", "answer_b")}
+    for row in rows:
+        for col, values in counts.items():
+            values.append(approx_token_count(row.get(col)))
+    return {col: np.asarray(values, dtype=np.int32) for col, values in counts.items()}
+
+
+def plan_from_profile(profile, persona_name="Strict Fact-Checker", answer_budget=DEFAULT_ANSWER_BUDGET, factor=1.0,
+                      expected_output=None, concurrency=8, requests_per_second=None,
+                      price_per_1k=MODEL_PRICES_RUB_PER_1K[MODEL_NAME], scores_only=False):
+    """
+    Pre-flight estimate of a batch: tokens, cost and wall time.
+
+    Args:
+        profile (dict): Token counts from `token_profile`.
+        answer_budget (int): Per-answer token budget (0 disables truncation).
+        factor (float): Tokenizer calibration factor from `calibrate_factor`.
+        expected_output (int): Expected verdict size in tokens; by default `EXPECTED_OUTPUT_TOKENS`,
+            or `SCORES_ONLY_OUTPUT_TOKENS` with `scores_only`.
+        concurrency (int): Parallel judge calls.
+        requests_per_second (float): Request quota, if any.
+        price_per_1k (float): Price in roubles per 1k tokens.
+        scores_only (bool): Whether the run uses the scores-only prompt.
+
+    Returns:
+        dict: rows, input/output/total tokens, truncated_rows, largest_row_tokens,
+        est_cost and est_duration_s.
+    """
+    import numpy as np
+
+    if expected_output is None:
+        expected_output = SCORES_ONLY_OUTPUT_TOKENS if scores_only else EXPECTED_OUTPUT_TOKENS
+    query = np.ceil(profile["query"] * factor)
+    answers = [np.ceil(profile[col] * factor) for col in ("answer_a", "answer_b")]
+    truncated = np.zeros(len(query), dtype=bool)
+    if answer_budget:
+        truncated = (answers[0] > answer_budget) | (answers[1] > answer_budget)
+        answers = [np.minimum(tokens, answer_budget) for tokens in answers]
+    # The query appears twice (system prompt and user message)
+    row_tokens = prompt_overhead_tokens(persona_name, factor, scores_only) + 2 * query + answers[0] + answers[1]
+
+    n_rows = len(row_tokens)
+    input_tokens = int(row_tokens.sum())
+    output_tokens = n_rows * expected_output
+    busy_seconds = n_rows * (LATENCY_BASE_SECONDS + expected_output / OUTPUT_TOKENS_PER_SECOND)
+    duration = busy_seconds / max(1, concurrency)
+    if requests_per_second:
+        duration = max(duration, n_rows / requests_per_second)
+    return {
+        "rows": n_rows,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "truncated_rows": int(truncated.sum()),
+        "largest_row_tokens": int(row_tokens.max()) if n_rows else 0,
+        "est_cost": (input_tokens + output_tokens) / 1000 * price_per_1k,
+        "est_duration_s": duration,
+    }
+
+
+def plan_batch(rows, **plan_kwargs):
+    """
+    Pre-flight estimate of a batch straight from a row stream.
+
+    Args:
+        rows (iterable): Row dicts; consumed once, only per-row token counts are kept.
+        **plan_kwargs: Passed to `plan_from_profile`.
+    """
+    return plan_from_profile(token_profile(rows), **plan_kwargs)
+
+
+def iter_largest_first(rows, size_fn, window=SCHEDULING_WINDOW):
+    """
+    Reorders a row stream so the biggest requests are sent first.
+
+    Sorting happens within consecutive windows of `window` rows, which keeps memory
+    bounded for streamed datasets while still starting the slow rows early instead
+    of leaving them for the tail of the run.
+    """
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= window:
+            yield from _drain_largest_first(buffer, size_fn)
+            buffer = []
+    yield from _drain_largest_first(buffer, size_fn)
+
+
+def _drain_largest_first(buffer, size_fn):
+    heap = [(-size_fn(row), i) for i, row in enumerate(buffer)]
+    heapq.heapify(heap)
+    while heap:
+        _, i = heapq.heappop(heap)
+        yield buffer[i]
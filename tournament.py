@@ -0,0 +1,324 @@
+"""
+N-model tournament: ranks several answer columns with far fewer judge calls than all pairs.
+
+The dataset has one `answer_<model>` column per model. The first round pairs the
+models in a random ring (Swiss-style, so the comparison graph is connected); every
+later round refits a Bradley-Terry model and spends its comparisons on the
+neighbouring pairs of the current ranking whose order is least certain. The run
+stops once every adjacent pair is separated at the requested confidence, when the
+budget is spent or when the uncertain pairs run out of rows.
+"""
+import math
+import logging
+
+import numpy as np
+
+from judge_core import verdict_sign
+from batch_runner import iter_evaluations, estimate_request_tokens, DEFAULT_CONCURRENCY
+from dedup import normalize_text, trivial_resolution, resolved_verdict
+
+logger = logging.getLogger(__name__)
+
+ANSWER_PREFIX = "answer_"
+
+# Ratings are reported on the Elo scale: a 400 point gap means 10:1 odds
+ELO_SCALE = 400 / math.log(10)
+ELO_BASE = 1000
+
+# Gaussian prior on the log-strengths; keeps models without decisive games finite
+PRIOR_STRENGTH = 0.1
+DEFAULT_Z = 1.96
+DEFAULT_ROWS_PER_PAIR = 8
+DEFAULT_COMPARISONS_PER_MODEL = 150
+# Neighbours (by current rank) a model may be scheduled against
+DEFAULT_WINDOW = 2
+
+
+def detect_models(columns):
+    """Model names of the `answer_<model>` columns, in column order."""
+    return [col[len(ANSWER_PREFIX):] for col in columns if col.startswith(ANSWER_PREFIX) and len(col) > len(ANSWER_PREFIX)]
+
+
+def fit_bradley_terry(wins, prior=PRIOR_STRENGTH, max_iter=100, tol=1e-8):
+    """
+    Maximum a posteriori Bradley-Terry fit by Newton's method.
+
+    Args:
+        wins (np.ndarray): `wins[i, j]` is the number of times model i beat model j;
+            a tie adds 0.5 to both directions.
+        prior (float): Precision of the zero-mean Gaussian prior on the log-strengths.
+
+    Returns:
+        tuple: `(theta, cov)` — centered log-strengths and their covariance matrix.
+    """
+    n = wins.shape[0]
+    games = wins + wins.T
+    theta = np.zeros(n)
+    hessian = -prior * np.eye(n)
+    for _ in range(max_iter):
+        p = 1 / (1 + np.exp(theta[None, :] - theta[:, None]))  # p[i, j] = P(i beats j)
+        gradient = (wins - games * p).sum(axis=1) - prior * theta
+        weight = games * p * p.T
+        hessian = weight - np.diag(weight.sum(axis=1) + prior)
+        step = np.linalg.solve(hessian, gradient)
+        theta = theta - step
+        if np.abs(step).max() < tol:
+            break
+    cov = np.linalg.inv(-hessian)
+    centering = np.eye(n) - 1.0 / n
+    return theta - theta.mean(), centering @ cov @ centering
+
+
+def _difference_z(theta, cov, i, j):
+    se = math.sqrt(max(cov[i, i] + cov[j, j] - 2 * cov[i, j], 1e-12))
+    return abs(theta[i] - theta[j]) / se
+
+
+class Tournament:
+    """
+    State of a running tournament: the win matrix and which rows each pair has used.
+
+    Args:
+        rows (list): Row dicts with `query` and one `answer_<model>` per model.
+        models (list): Model names to rank.
+        seed (int): Seed of the pairing, row sampling and A/B side assignment.
+    """
+
+    def __init__(self, rows, models, seed=0):
+        if len(models) < 2:
+            raise ValueError("A tournament needs at least two models")
+        self.rows = rows
+        self.models = list(models)
+        self.rng = np.random.default_rng(seed)
+        n = len(self.models)
+        self.wins = np.zeros((n, n))
+        self.decisive = np.zeros((n, n), dtype=int)  # wins[i, j] without ties
+        self.ties = np.zeros((n, n), dtype=int)
+        self.errors = 0
+        self.judge_calls = 0
+        self._row_orders = {}  # (i, j) -> shuffled row indices, created on first use
+        self._row_cursor = {}
+
+    def rows_left(self, i, j):
+        key = (min(i, j), max(i, j))
+        return len(self.rows) - self._row_cursor.get(key, 0)
+
+    def draw_rows(self, i, j, count):
+        """Row indices not yet used for the pair, in a random order fixed per pair."""
+        key = (min(i, j), max(i, j))
+        if key not in self._row_orders:
+            self._row_orders[key] = self.rng.permutation(len(self.rows))
+            self._row_cursor[key] = 0
+        start = self._row_cursor[key]
+        self._row_cursor[key] = min(start + count, len(self.rows))
+        return self._row_orders[key][start:self._row_cursor[key]].tolist()
+
+    def comparison_item(self, row_index, i, j):
+        """Judge input for one row; the sides are randomized against position bias."""
+        if self.rng.random() < 0.5:
+            i, j = j, i
+        row = self.rows[row_index]
+        return {
+            "row_index": row_index,
+            "query": row["query"],
+            "answer_a": row[ANSWER_PREFIX + self.models[i]],
+            "answer_b": row[ANSWER_PREFIX + self.models[j]],
+            "model_a": i,
+            "model_b": j,
+        }
+
+    def record(self, item, result):
+        """Adds one judged comparison; returns the winning model name, "Tie" or None."""
+        sign = verdict_sign(result)
+        i, j = item["model_a"], item["model_b"]
+        if sign is None:
+            self.errors += 1
+            return None
+        if sign == 0:
+            self.wins[i, j] += 0.5
+            self.wins[j, i] += 0.5
+            self.ties[i, j] += 1
+            self.ties[j, i] += 1
+            return "Tie"
+        winner, loser = (i, j) if sign > 0 else (j, i)
+        self.wins[winner, loser] += 1
+        self.decisive[winner, loser] += 1
+        return self.models[winner]
+
+    def fit(self):
+        return fit_bradley_terry(self.wins)
+
+    def first_round(self):
+        """Random ring: every model plays its two neighbours, which connects the comparison graph."""
+        order = self.rng.permutation(len(self.models)).tolist()
+        if len(order) == 2:
+            return [tuple(order)]
+        return [(order[k], order[(k + 1) % len(order)]) for k in range(len(order))]
+
+    def uncertain_pairs(self, theta, cov, limit, window=DEFAULT_WINDOW, z=DEFAULT_Z):
+        """
+        Pairs of nearby models in the current ranking whose order is least certain.
+
+        Returns:
+            list: Up to `limit` `(i, j)` pairs with rows left and a z-score below `z`:
+            adjacent pairs first (they decide the ranking), each group most uncertain first.
+        """
+        ranked = np.argsort(-theta)
+        candidates = []
+        for position, i in enumerate(ranked):
+            for distance, j in enumerate(ranked[position + 1:position + 1 + window], start=1):
+                if self.rows_left(i, j) == 0:
+                    continue
+                z_score = _difference_z(theta, cov, i, j)
+                if z_score < z:
+                    games = self.decisive[i, j] + self.decisive[j, i] + self.ties[i, j]
+                    candidates.append((distance > 1, z_score, games, int(i), int(j)))
+        candidates.sort()
+        return [(i, j) for *_, i, j in candidates[:limit]]
+
+    def unresolved(self, theta, cov, z=DEFAULT_Z):
+        """Adjacent pairs of the ranking that are not separated at `z`."""
+        ranked = np.argsort(-theta)
+        return [
+            (self.models[i], self.models[j])
+            for i, j in zip(ranked, ranked[1:])
+            if _difference_z(theta, cov, i, j) < z
+        ]
+
+    def ranking(self, theta, cov, z=DEFAULT_Z):
+        """
+        Returns:
+            list: One dict per model, best first: rank, model, rating and its
+            confidence interval on the Elo scale, wins, losses, ties, comparisons.
+        """
+        se = np.sqrt(np.clip(np.diag(cov), 0, None))
+        table = []
+        for rank, i in enumerate(np.argsort(-theta), start=1):
+            wins, losses, ties = int(self.decisive[i].sum()), int(self.decisive[:, i].sum()), int(self.ties[i].sum())
+            table.append({
+                "rank": rank,
+                "model": self.models[i],
+                "rating": round(float(ELO_BASE + ELO_SCALE * theta[i]), 1),
+                "ci_low": round(float(ELO_BASE + ELO_SCALE * (theta[i] - z * se[i])), 1),
+                "ci_high": round(float(ELO_BASE + ELO_SCALE * (theta[i] + z * se[i])), 1),
+                "wins": wins,
+                "losses": losses,
+                "ties": ties,
+                "comparisons": wins + losses + ties,
+            })
+        return table
+
+
+def run_tournament(rows, models, evaluate_fn, max_comparisons=None, rows_per_pair=DEFAULT_ROWS_PER_PAIR,
+                   pairs_per_round=None, z=DEFAULT_Z, window=DEFAULT_WINDOW, max_workers=DEFAULT_CONCURRENCY,
+                   rate_limiter=None, token_estimator=estimate_request_tokens, metrics=None, seed=0,
+                   progress_callback=None, record_callback=None):
+    """
+    Ranks `models` by adaptive pairwise judging.
+
+    Args:
+        rows (list): Row dicts with `query` and `answer_<model>` for every model.
+        models (list): Model names (see `detect_models`).
+        evaluate_fn (callable): Function `item -> result dict` judging `answer_a`
+            against `answer_b`, e.g. a bound `evaluate_with_yandex`.
+        max_comparisons (int): Budget of comparisons; defaults to
+            `DEFAULT_COMPARISONS_PER_MODEL` per model, capped at all pairs on all rows.
+        rows_per_pair (int): Rows judged each time a pair is scheduled.
+        pairs_per_round (int): Pairs scheduled per round, defaults to the number of models.
+            A round always holds `rows_per_pair * pairs_per_round` comparisons (budget
+            permitting), so fewer uncertain pairs get more rows each.
+        z (float): z-score from which two adjacent models count as separated
+            (1.96 ~ 95% confidence); also sets the width of the reported intervals.
+        window (int): How many places down the current ranking a model may be paired.
+        progress_callback (callable): Called as `progress_callback(done, budget)`.
+        record_callback (callable): Called with one dict per comparison (row_index,
+            round, model_a, model_b, winner, error, total_tokens), e.g. to log them.
+
+    Returns:
+        dict: `ranking` (see `Tournament.ranking`), `win_matrix`, `comparisons`,
+        `judge_calls`, `errors`, `all_pairs_comparisons`, `rounds`, `stable` and
+        `unresolved` adjacent pairs.
+    """
+    tournament = Tournament(rows, models, seed=seed)
+    n = len(tournament.models)
+    all_pairs = n * (n - 1) // 2 * len(rows)
+    budget = min(max_comparisons or DEFAULT_COMPARISONS_PER_MODEL * n, all_pairs)
+    pairs_per_round = pairs_per_round or n
+    done = 0
+    rounds = 0
+    theta, cov = tournament.fit()
+
+    while done < budget:
+        # 1. Pairing: a random ring first, then the least certain neighbours
+        pairs = tournament.first_round() if rounds == 0 else tournament.uncertain_pairs(theta, cov, pairs_per_round, window, z)
+        if not pairs:
+            break
+        round_size = min(rows_per_pair * pairs_per_round, budget - done)
+        items = []
+        for k, (i, j) in enumerate(pairs):
+            share = math.ceil((round_size - len(items)) / (len(pairs) - k))
+            for row_index in tournament.draw_rows(i, j, share):
+                items.append(tournament.comparison_item(row_index, i, j))
+        if not items:
+            break
+        rounds += 1
+
+        # 2. Judge the round; rows with identical or empty answers are decided without a call
+        to_judge = []
+        for item in items:
+            resolution = trivial_resolution(normalize_text(item["answer_a"]), normalize_text(item["answer_b"]))
+            if resolution is None:
+                to_judge.append(item)
+            else:
+                done += 1
+                _log_comparison(tournament, item, resolved_verdict(resolution), rounds, record_callback)
+                if progress_callback:
+                    progress_callback(done, budget)
+        for _, item, result in iter_evaluations(to_judge, evaluate_fn, max_workers=max_workers,
+                                                rate_limiter=rate_limiter, token_estimator=token_estimator,
+                                                metrics=metrics):
+            tournament.judge_calls += 1
+            done += 1
+            _log_comparison(tournament, item, result, rounds, record_callback)
+            if progress_callback:
+                progress_callback(done, budget)
+
+        # 3. Refit and check whether the ranking is settled
+        theta, cov = tournament.fit()
+        unresolved = tournament.unresolved(theta, cov, z)
+        logger.info(f"Tournament round {rounds}: {done}/{budget} comparisons, {len(unresolved)} adjacent pairs unresolved")
+        if not unresolved:
+            break
+
+    unresolved = tournament.unresolved(theta, cov, z)
+    return {
+        "models": tournament.models,
+        "ranking": tournament.ranking(theta, cov, z),
+        "win_matrix": tournament.wins.tolist(),
+        "comparisons": done,
+        "judge_calls": tournament.judge_calls,
+        "errors": tournament.errors,
+        "all_pairs_comparisons": all_pairs,
+        "rounds": rounds,
+        "stable": not unresolved,
+        "unresolved": unresolved,
+    }
+
+
+def _log_comparison(tournament, item, result, round_number, record_callback):
+    winner = tournament.record(item, result)
+    if record_callback is None:
+        return
+    try:
+        total_tokens = int(result.get("usage", {}).get("totalTokens", 0))
+    except (TypeError, ValueError):
+        total_tokens = 0
+    record_callback({
+        "row_index": item["row_index"],
+        "round": round_number,
+        "model_a": tournament.models[item["model_a"]],
+        "model_b": tournament.models[item["model_b"]],
+        "winner": winner,
+        "error": result.get("error"),
+        "total_tokens": total_tokens,
+    })
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.environ.get("AUTOASSESSOR_CACHE_PATH", os.path.join(".cache", "verdicts.sqlite3"))
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_AGE_DAYS = 30
+
+# Eviction runs on open and then once every this many writes
+EVICT_EVERY_PUTS = 500
+
+
+def make_cache_key(query, ans_a, ans_b, persona_name, model_uri, temperature, prompt_version):
+    """
+    Builds a stable cache key for a single judge call.
+
+    Every input that can change the verdict is part of the key, including the prompt
+    version, so editing the criteria or the prompt template invalidates old entries.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    material = json.dumps(
+        [str(query), str(ans_a), str(ans_b), persona_name, model_uri, float(temperature), prompt_version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Disk-backed (SQLite) store of parsed judge verdicts.
+
+    Entries older than `max_age_days` are dropped, and when the store grows beyond
+    `max_entries` the least recently used entries are evicted first. Safe to share
+    between the threads of a batch run.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " key TEXT PRIMARY KEY,"
+            " verdict TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_verdicts_accessed ON verdicts (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key):
+        """Returns the cached verdict dict for `key`, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT verdict, created_at FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE verdicts SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, verdict):
+        """Stores a successfully parsed verdict. Error results should never be cached."""
+        now = time.time()
+        payload = json.dumps(verdict, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            due = self._puts % EVICT_EVERY_PUTS == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones above `max_entries`."""
+        with self._lock:
+            removed = 0
+            if self.max_age_seconds:
+                cur = self._conn.execute("DELETE FROM verdicts WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+                removed += cur.rowcount
+            if self.max_entries:
+                cur = self._conn.execute(
+                    "DELETE FROM verdicts WHERE key IN ("
+                    " SELECT key FROM verdicts ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                removed += cur.rowcount
+            self._conn.commit()
+        if removed:
+            logger.info(f"Evicted {removed} cached verdicts from {self.path}")
+        return removed
+
+    def clear(self):
+        """Removes every entry and resets the hit/miss counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns hit/miss counters of this process and the current size of the store."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "entries": entries,
+        }
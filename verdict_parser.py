@@ -0,0 +1,263 @@
+"""
+Tolerant extraction of judge verdicts from model replies.
+
+The judge is asked for JSON, but replies regularly arrive as Python-style dicts
+(single quotes, True/None), with `//` or `#` comments, trailing commas, or wrapped
+in prose and code fences. `parse_verdict` recovers the verdict from all of these and
+normalizes it: the compact scores-only form (`{"a": [overall, *criteria], "b": [...]}`)
+is expanded, scores are coerced to ints in 1-10, missing criteria become None and
+a missing overall score is derived from the criteria. Every repair is listed in the
+verdict's `parse_issues`.
+
+Only the standard library is used, so the parser is as cheap to import as `judge_core`.
+"""
+import ast
+import json
+import re
+
+MIN_SCORE = 1
+MAX_SCORE = 10
+
+_OPENERS = {"{": "}", "[": "]"}
+_NAME_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_SIDE_KEYS = {"modela": "model_a", "a": "model_a", "modelb": "model_b", "b": "model_b"}
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _key(text):
+    """Case- and punctuation-insensitive form of a dict key."""
+    return re.sub(r"[\W_]+", "", str(text)).casefold()
+
+
+def _balanced_spans(text):
+    """
+    Yields `(start, end)` of top-level `{...}` / `[...]` spans, skipping brackets inside
+    single- or double-quoted strings. An unclosed span is not yielded.
+    """
+    stack = []
+    quote = None
+    escape = False
+    start = None
+    for i, ch in enumerate(text):
+        if quote:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == quote:
+                quote = None
+            continue
+        if ch in "\"'" and stack:
+            quote = ch
+        elif ch in _OPENERS:
+            if not stack:
+                start = i
+            stack.append(_OPENERS[ch])
+        elif stack and ch == stack[-1]:
+            stack.pop()
+            if not stack:
+                yield start, i + 1
+
+
+def _strip_comments(text):
+    """Removes `//` and `/* */` comments outside strings (`#` comments are handled by `ast`)."""
+    out = []
+    quote = None
+    escape = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == quote:
+                quote = None
+            i += 1
+            continue
+        if ch in "\"'":
+            quote = ch
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = len(text) if end < 0 else end
+            continue
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end < 0 else end + 2
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _literal(node):
+    """Converts an `ast` expression of dicts, lists and constants (JSON names included) to a value."""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in _NAME_LITERALS:
+        return _NAME_LITERALS[node.id]
+    if isinstance(node, ast.Dict):
+        return {_literal(k): _literal(v) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [_literal(element) for element in node.elts]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _literal(node.operand)
+        if isinstance(value, (int, float)):
+            return -value if isinstance(node.op, ast.USub) else value
+    raise ValueError(f"Unsupported literal: {ast.dump(node)[:80]}")
+
+
+def loads_lenient(candidate):
+    """
+    Parses one JSON-like value: strict JSON first, then a Python-literal reading
+    that accepts single quotes, True/None, comments and trailing commas.
+
+    Raises:
+        ValueError: If neither reading succeeds.
+    """
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    try:
+        tree = ast.parse(_strip_comments(candidate).strip(), mode="eval")
+    except (SyntaxError, ValueError) as e:
+        raise ValueError(f"Not a JSON or Python literal: {e}") from e
+    return _literal(tree.body)
+
+
+def extract_json(text, expect=dict):
+    """
+    Finds the first value of type `expect` (dict or list) in a model reply.
+
+    Code fences and any prose around the value are ignored.
+
+    Returns:
+        The parsed value, or None if the reply holds none.
+    """
+    if not text:
+        return None
+    try:
+        value = json.loads(text)
+        if isinstance(value, expect):
+            return value
+    except ValueError:
+        pass
+    for start, end in _balanced_spans(text):
+        try:
+            value = loads_lenient(text[start:end])
+        except (ValueError, RecursionError):
+            continue
+        if isinstance(value, expect):
+            return value
+    return None
+
+
+def _score(value, issues, label):
+    """Coerces a score to an int in [MIN_SCORE, MAX_SCORE]; None if it is not a number."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER_RE.search(str(value))  # "8/10", "8.5", "оценка: 7"
+        if not match:
+            issues.append(f"{label}: not a number")
+            return None
+        number = float(match.group().replace(",", "."))
+        issues.append(f"{label}: coerced {value!r}")
+    score = int(round(number))
+    if not MIN_SCORE <= score <= MAX_SCORE:
+        issues.append(f"{label}: {value} clamped to {MIN_SCORE}-{MAX_SCORE}")
+        score = min(max(score, MIN_SCORE), MAX_SCORE)
+    return score
+
+
+def _expand_compact(values, criteria, label, issues):
+    """`[overall, *criteria]` (or just the criteria) of the scores-only reply, as a side dict."""
+    if len(values) == len(criteria):
+        return {"scores": dict(zip(criteria, values))}
+    if len(values) != len(criteria) + 1:
+        issues.append(f"{label}: expected {len(criteria) + 1} scores, got {len(values)}")
+    return {"overall_score": values[0] if values else None, "scores": dict(zip(criteria, values[1:]))}
+
+
+def _normalize_side(data, criteria, label, issues):
+    if isinstance(data, list):
+        data = _expand_compact(data, criteria, label, issues)
+    data = {_key(k): v for k, v in data.items()}
+    raw_scores = data.get("scores") if isinstance(data.get("scores"), dict) else {}
+    raw_scores = {_key(k): v for k, v in raw_scores.items()}
+    scores = {}
+    missing = []
+    for name in criteria:
+        # Criteria are sometimes put next to overall_score instead of under `scores`
+        value = raw_scores.get(_key(name), data.get(_key(name)))
+        scores[name] = _score(value, issues, f"{label}.{name}")
+        if scores[name] is None:
+            missing.append(name)
+    if missing:
+        issues.append(f"{label}: missing criteria {', '.join(missing)}")
+
+    overall = _score(data.get("overallscore", data.get("overall", data.get("score"))), issues, f"{label}.overall_score")
+    if overall is None:
+        known = [score for score in scores.values() if score is not None]
+        if not known:
+            return None
+        overall = int(round(sum(known) / len(known)))
+        issues.append(f"{label}: overall_score derived from criteria")
+    reasoning = data.get("reasoning")
+    return {"overall_score": overall, "scores": scores, "reasoning": None if reasoning is None else str(reasoning)}
+
+
+def normalize_verdict(judgement, criteria):
+    """
+    Validates and repairs a parsed verdict.
+
+    Args:
+        judgement (dict): Parsed reply with `model_a`, `model_b` and `comparison`
+            (or the compact `a` / `b` score lists).
+        criteria (tuple): Criterion names expected under `scores`.
+
+    Returns:
+        dict: The normalized verdict (with `parse_issues` if anything was repaired),
+        or None if it lacks a usable score for either model.
+    """
+    if not isinstance(judgement, dict):
+        return None
+    issues = []
+    sides = {}
+    extra = {}
+    for key, value in judgement.items():
+        side = _SIDE_KEYS.get(_key(key))
+        if side and isinstance(value, (dict, list)) and side not in sides:
+            sides[side] = value
+        else:
+            extra[key] = value
+    normalized = {}
+    for side in ("model_a", "model_b"):
+        if side not in sides:
+            return None
+        normalized[side] = _normalize_side(sides[side], criteria, side, issues)
+        if normalized[side] is None:
+            return None
+    comparison = next((value for key, value in extra.items() if _key(key) == "comparison"), None)
+    normalized["comparison"] = None if comparison is None else str(comparison)
+    if issues:
+        normalized["parse_issues"] = issues
+    return normalized
+
+
+def parse_verdict(text, criteria):
+    """
+    Extracts and normalizes a verdict from the raw text of a judge reply.
+
+    Returns:
+        dict: The verdict (see `normalize_verdict`), or None if the reply has none.
+    """
+    judgement = extract_json(text)
+    if judgement is None:
+        return None
+    return normalize_verdict(judgement, criteria)
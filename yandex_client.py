@@ -0,0 +1,193 @@
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = os.environ.get("YANDEX_LLM_API_URL", "https://llm.api.cloud.yandex.net")
+DEFAULT_OPERATION_URL = os.environ.get("YANDEX_OPERATION_API_URL", "https://operation.api.cloud.yandex.net")
+DEFAULT_POOL_SIZE = 8
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 120.0
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retry_after_seconds(response):
+    """Parses a Retry-After header given either as seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class YandexGPTClient:
+    """
+    Reusable HTTP client for the Yandex Foundation Models API.
+
+    Holds one pooled `requests.Session` so concurrent batch workers reuse keep-alive
+    connections instead of doing a TCP+TLS handshake per call. Transient failures
+    (429, 5xx, connection resets) are retried with exponential backoff and full
+    jitter, honoring the server's Retry-After header.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, base_url=DEFAULT_BASE_URL, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 operation_url=DEFAULT_OPERATION_URL):
+        self.base_url = base_url.rstrip("/")
+        self.operation_url = operation_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._requests_sent = 0
+        self._retries = 0
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _connections_opened(self):
+        """Total connections the session's pools have created (each one cost a handshake)."""
+        opened = 0
+        # The same adapter is mounted for both schemes; count each pool manager once
+        for adapter in {id(a): a for a in self.session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+        return opened
+
+    def post(self, path, headers, body):
+        """
+        Sends a JSON POST request with retries.
+
+        Args:
+            path (str): API path relative to `base_url`, e.g. "/foundationModels/v1/completion".
+            headers (dict): Request headers (authorization, folder id, ...).
+            body (dict): JSON request body.
+
+        Returns:
+            tuple: `(response, call_stats)`. `call_stats` holds `attempts`, `retries`,
+            `new_connections` (handshakes this call caused; approximate under concurrency),
+            the final `status`, `ttfb_s` of the last attempt, `throttled` (429 replies) and
+            `backoff_s` (time slept between attempts).
+
+        Raises:
+            requests.RequestException: If the last attempt still failed to connect or timed out.
+        """
+        return self._send("POST", f"{self.base_url}{path}", headers, body)
+
+    def post_stream(self, path, headers, body):
+        """
+        Sends a JSON POST request whose response body is read as a stream.
+
+        Retries happen only before the response starts; the caller iterates
+        `response.iter_lines()` and should close the response when done.
+
+        Returns:
+            tuple: `(response, call_stats)`, as `post` does.
+        """
+        return self._send("POST", f"{self.base_url}{path}", headers, body, stream=True)
+
+    def get_operation(self, operation_id, headers):
+        """Fetches the state of an async operation from the Operation API, with retries."""
+        return self._send("GET", f"{self.operation_url}/operations/{operation_id}", headers)
+
+    def _send(self, method, url, headers, body=None, stream=False):
+        opened_before = self._connections_opened()
+        attempt = 0
+        throttled = 0
+        backoff = 0.0
+        while True:
+            attempt += 1
+            with self._lock:
+                self._requests_sent += 1
+            try:
+                response = self.session.request(method, url, headers=headers, json=body, timeout=self.timeout,
+                                                stream=stream)
+            except requests.ConnectionError as e:
+                if attempt > self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Connection error on attempt {attempt} ({e}); retrying in {delay:.1f}s")
+            else:
+                if response.status_code == 429:
+                    throttled += 1
+                if response.status_code not in RETRY_STATUSES or attempt > self.max_retries:
+                    break
+                if stream:
+                    response.content  # drain the error body so the connection goes back to the pool
+                retry_after = _retry_after_seconds(response)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                delay = min(delay, self.backoff_max)
+                logger.warning(f"Yandex API returned {response.status_code} on attempt {attempt}; retrying in {delay:.1f}s")
+            with self._lock:
+                self._retries += 1
+            backoff += delay
+            time.sleep(delay)
+
+        call_stats = {
+            "attempts": attempt,
+            "retries": attempt - 1,
+            "new_connections": max(0, self._connections_opened() - opened_before),
+            "status": response.status_code,
+            # Time to the response headers of the last attempt (also for streamed replies)
+            "ttfb_s": round(response.elapsed.total_seconds(), 4),
+            "throttled": throttled,
+            "backoff_s": round(backoff, 3),
+        }
+        return response, call_stats
+
+    def stats(self):
+        """Aggregated counters: requests sent, retries and handshakes avoided by keep-alive."""
+        opened = self._connections_opened()
+        with self._lock:
+            sent = self._requests_sent
+            retries = self._retries
+        return {
+            "requests_sent": sent,
+            "retries": retries,
+            "connections_opened": opened,
+            "handshakes_saved": max(0, sent - opened),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Returns the process-wide shared client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = YandexGPTClient()
+        return _default_client